@@ -42,9 +42,10 @@ Rectangle {
             height: widget_height
 
             // Add properties and bindings for RPM values
-            value: RPM_Meter.currRPM
-            maximumValue: RPM_Meter.maxRPM
-            minimumValue: RPM_Meter.minRPM
+            value: telemetry.rpm
+            opacity: telemetry.rpmStale ? 0.4 : 1.0     // holding an old value
+            maximumValue: telemetry.maxRPM
+            minimumValue: telemetry.minRPM
 
             anchors {
                 centerIn: parent
@@ -111,7 +112,7 @@ Rectangle {
             radius: 360
 
             Text {
-                text: Math.round(RPM_Meter.currRPM)
+                text: Math.round(telemetry.rpm)
                 color: "white"
                 font.pixelSize: 36
                 font.bold: true
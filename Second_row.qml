@@ -30,53 +30,53 @@ Rectangle { // This is the main background
 
         SecondPanels {
             title: "Coolant Temperature"
-            currValue: temperature.currValue
+            currValue: telemetry.coolantTemp
             units: "°C"
         }
 
         SecondPanels {
             title: "Intake Pressure"
-            currValue: intakePressureLabel.currValue
+            currValue: telemetry.intakePressure
             units: "%"
         }
 
         SecondPanels {
             title: "Intake Temperature"
-            currValue: intakeTempLabel.currValue
+            currValue: telemetry.intakeTemp
             units: "°C"
         }
 
         StringPanels {
             title: "Run Time"
-            currValue: runtimeLabel.currValue
+            currValue: telemetry.runTime
         }
 
         SecondPanels {
             title: "Fuel Level"
-            currValue: fuelLevelLabel.currValue
+            currValue: telemetry.fuelLevel
             units: "%"
         }
 
         StringPanels {
             title: "Fuel Type"
-            currValue: fuelTypeLabel.currValue
+            currValue: telemetry.fuelType
         }
 
         SecondPanels {
             title: "Speed"
-            currValue: Math.round(speedometer.currSpeed)
+            currValue: Math.round(telemetry.speed)
             units: "mph"
         }
 
         SecondPanels {
             title: "Speed"
-            currValue: Math.round(speedometer.currSpeed * 1.60934)
+            currValue: Math.round(telemetry.speed * 1.60934)
             units: "kmh"
         }
 
         SecondPanels {
             title: "RPM"
-            currValue: Math.round(RPM_Meter.currRPM)
+            currValue: Math.round(telemetry.rpm)
             units: " x 1000 revs"
         }
 
@@ -41,9 +41,9 @@ Rectangle {
             width: widget_width
             height: widget_height
 
-            value: speedometer.currSpeed
-            maximumValue: speedometer.maxSpeed
-            minimumValue: speedometer.minSpeed
+            value: telemetry.speed
+            maximumValue: telemetry.maxSpeed
+            minimumValue: telemetry.minSpeed
 
             anchors {
                 centerIn: parent
@@ -102,7 +102,7 @@ Rectangle {
         CircularGauge {
             width: widget_width - 100
             height: widget_height - 100
-            //value: speedometer.currSpeed
+            //value: telemetry.speed
             maximumValue: 260
             minimumValue: 0
             style: CircularGaugeStyle {
@@ -171,7 +171,7 @@ Rectangle {
             radius: 360
 
             Text {
-                text: Math.round(speedometer.currSpeed)
+                text: Math.round(telemetry.speed)
                 color: "white"
                 font.pixelSize: 36
                 font.bold: true
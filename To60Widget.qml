@@ -24,10 +24,10 @@ Rectangle {
         onTriggered: {
             console.log("TIMING")
             // Simulate speed increase (e.g., from a car accelerating)
-            if (speedometer.currSpeed < targetSpeed && speedometer.currSpeed > 0) {
+            if (telemetry.speed < targetSpeed && telemetry.speed > 0) {
                 elapsedTime += interval / 1000  // Update elapsed time in seconds
                 messageText.text = "Timing..."
-            } else if (speedometer.currSpeed >= 60){
+            } else if (telemetry.speed >= 60){
                 isTiming = false
                 elapsedTime += 0.2
                 messageText.text = `0-60 time: ${elapsedTime.toFixed(2)} seconds`
@@ -0,0 +1,258 @@
+"""
+acquisition.py - OBD acquisition worker for the dashboard
+
+The worker owns the obd.OBD connection and runs the query loop on its own
+QThread. Each cycle is published to the UI as an immutable Snapshot through a
+queued signal, so QML rendering never waits on the serial link.
+
+A failed read doesn't zero a channel: the last good value is held, and the
+channel is only flagged stale once nothing good has arrived for its
+staleness window (stale_window()).
+
+Channels listed in raw_channels are read through elm_raw's direct serial fast
+path instead of python-OBD (and leave the CAN multi-PID batch). Enhanced
+channels behind another module's header always are: elm_raw owns ATSH.
+"""
+
+import functools
+import threading
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Callable, Iterable, Mapping, Optional
+
+from PyQt5.QtCore import QThread, pyqtSignal
+import obd
+
+import elm_raw
+import enhanced_pids
+import py_obd
+from connection_manager import ConnectionManager, LinkState
+
+
+# Channel name -> (getter, target refresh rate in Hz, Mode 01 command name or None
+# if it isn't covered by the PIDS_x bitmaps). Values are already in dashboard units.
+CHANNELS: dict[str, tuple[Callable[[obd.OBD], float], float, Optional[str]]] = {
+    "rpm": (py_obd.get_rpm, 20.0, "RPM"),
+    "speed": (py_obd.get_speed, 10.0, "SPEED"),     # mph, fused with GPS on the UI side
+    "throttle_pos": (py_obd.get_throttle_pos, 20.0, "THROTTLE_POS"),
+    "engine_load": (py_obd.get_engine_load, 5.0, "ENGINE_LOAD"),
+    "intake_pressure": (py_obd.get_intake_pressure, 5.0, "INTAKE_PRESSURE"),
+    "absolute_load": (py_obd.get_absolute_load, 5.0, "ABSOLUTE_LOAD"),
+    "coolant_temp": (py_obd.get_temperature, 1.0, "COOLANT_TEMP"),
+    "intake_temp": (py_obd.get_intake_temp, 1.0, "INTAKE_TEMP"),
+    "module_voltage": (py_obd.get_battery_voltage, 1.0, "CONTROL_MODULE_VOLTAGE"),
+    "fuel_level": (py_obd.get_fuel_level, 1 / 30, "FUEL_LEVEL"),
+    "baro_pressure": (py_obd.get_barometric_pressure, 1 / 30, "BAROMETRIC_PRESSURE"),
+    "run_time": (py_obd.get_runtime, 1.0, "RUN_TIME"),             # s since engine start
+}
+
+# Mode 22 channels (oil_pressure, ...) at the rates enhanced_pids.json gives them.
+# Definitions left out are noted in PROBLEMS, for the dash to report.
+PROBLEMS: list[str] = []
+for _name, _pid in enhanced_pids.DEFINITIONS.items():
+    if _name in CHANNELS:
+        PROBLEMS.append(f"Enhanced PID {_name} clashes with a built-in channel; ignored")
+        continue
+    CHANNELS[_name] = (py_obd.enhanced_getter(_name), _pid.hz, None)
+
+# Read through elm_raw whatever raw_channels says (python-OBD never leaves the default header)
+MODULE_CHANNELS = frozenset(name for name, pid in enhanced_pids.DEFINITIONS.items()
+                            if pid.ecu != "pcm" and name in CHANNELS)
+
+# MIL / DTC count rarely change, but STATUS doubles as the "is the ECU still
+# there" check for the connection manager, so don't make it too slow
+STATUS_HZ = 0.5
+
+# On CAN these go out together as one multi-PID request, replacing their
+# individual CHANNELS entries. VPW/J1850 keeps the per-channel rates above.
+FAST_BATCH: dict[str, obd.OBDCommand] = {
+    "rpm": obd.commands.RPM,
+    "speed": obd.commands.SPEED,
+    "throttle_pos": obd.commands.THROTTLE_POS,
+    "engine_load": obd.commands.ENGINE_LOAD,
+    "intake_pressure": obd.commands.INTAKE_PRESSURE,
+    "intake_temp": obd.commands.INTAKE_TEMP,
+}
+FAST_BATCH_HZ = 20.0
+
+# Seconds a channel may go without a good read before it is flagged stale.
+# Never less than STALE_PERIODS target poll periods: on a saturated VPW bus the
+# scheduler delivers only about a quarter of the target rates.
+STALE_AFTER = 2.0
+STALE_PERIODS = 8
+
+
+def stale_window(name: str, batched: bool = False, stale_after: float = STALE_AFTER) -> float:
+    hz = FAST_BATCH_HZ if batched and name in FAST_BATCH else CHANNELS[name][1]
+    return max(stale_after, STALE_PERIODS / hz)
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """One acquisition cycle. Never mutated after it is published."""
+    connected: bool
+    timestamp: float
+    link: str = LinkState.PORT_ABSENT.value
+    mil: bool = False
+    dtc_count: int = 0
+    values: Mapping[str, float] = field(default_factory=lambda: MappingProxyType({}))
+    fresh: frozenset = frozenset()      # channels that got a new sample since the previous Snapshot
+    stale: frozenset = frozenset()      # channels holding a value older than their staleness window
+    fuel_type: str = ""                 # read once per connect; "" if the vehicle doesn't say
+
+
+def make_scheduler(batched: bool = False, supported: Optional[set[str]] = None,
+                   raw: frozenset = frozenset(), raw_link: Optional[elm_raw.RawLink] = None) -> py_obd.PollScheduler:
+    """
+    Build the poll schedule for a connection. Channels whose command isn't in
+    `supported` are left out entirely (None means support is unknown: poll everything).
+    Channels in `raw` (and MODULE_CHANNELS) use the elm_raw getter on `raw_link`
+    at their own CHANNELS rate; the python-OBD getters put the adapter back on
+    the default header first if one of those left it elsewhere.
+    """
+    def wanted(command_name):
+        return supported is None or command_name is None or command_name in supported
+
+    def default_header(getter):
+        return elm_raw.on_default_header(raw_link, getter)
+
+    raw = raw | MODULE_CHANNELS
+    scheduler = py_obd.PollScheduler()
+    scheduler.register("status", default_header(py_obd.get_status), STATUS_HZ)
+    if batched:
+        batch = {name: cmd for name, cmd in FAST_BATCH.items() if wanted(cmd.name) and name not in raw}
+        scheduler.register("fast_batch", default_header(lambda c: py_obd.get_batch(c, batch, default=None)),
+                           FAST_BATCH_HZ)
+    for name, (getter, hz, command_name) in CHANNELS.items():
+        if batched and name in FAST_BATCH and name not in raw:
+            continue
+        if not wanted(command_name):
+            print(f"[INFO] Skipping {name}: {command_name} not supported by this vehicle")
+            continue
+        getter = elm_raw.getter(name, raw_link) if name in raw else default_header(getter)
+        # None on a failed read, so the worker can hold the last good value
+        scheduler.register(name, functools.partial(getter, default=None), hz)
+    return scheduler
+
+
+class AcquisitionWorker(QThread):
+    """Background thread that owns the OBD connection and publishes Snapshots."""
+
+    snapshotReady = pyqtSignal(object)
+
+    def __init__(self, port: str, interval: float = 0.05, stale_after: float = STALE_AFTER,
+                 raw_channels: Iterable[str] = (), parent=None):
+        super().__init__(parent)
+        self.interval = interval            # how often a Snapshot is published
+        self.link = ConnectionManager(port)
+        self.capability_path = py_obd.CAPABILITY_CACHE_PATH     # None: don't cache supported PIDs
+        unknown = set(raw_channels) - set(elm_raw.RAW_PIDS)
+        if unknown:
+            raise ValueError(f"no raw fast path for {', '.join(sorted(unknown))}")
+        self.raw_channels = frozenset(raw_channels)
+        self.scheduler = make_scheduler(raw=self.raw_channels)
+        self._mil = False
+        self._dtc_count = 0
+        self._values: dict[str, float] = {}
+        self._good_at: dict[str, float] = {}    # monotonic time of each channel's last good read
+        self.stale_after = stale_after
+        self._windows = {name: stale_window(name, False, stale_after) for name in CHANNELS}
+        self._fresh: set[str] = set()
+        self._fuel_type = ""
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.wait()
+
+    def _on_connected(self) -> None:
+        """Fresh link: work out what to poll (never let this kill the worker)."""
+        connection = self.link.connection
+        supported = None
+        try:
+            supported = py_obd.discover_capabilities(connection, self.capability_path) or None
+        except Exception as e:
+            print("[WARN] PID discovery failed:", e)
+
+        if supported is None or "FUEL_TYPE" in supported:
+            self._fuel_type = py_obd.get_fuel_type(connection)
+
+        batched = py_obd.probe_multi_pid(connection, list(FAST_BATCH.values()))
+        print("[INFO] Multi-PID requests:", "on" if batched else "off")
+        if self.raw_channels:
+            print("[INFO] Raw fast path:", ", ".join(sorted(self.raw_channels)))
+        self.scheduler = make_scheduler(batched, supported, self.raw_channels, self.link.raw)
+        self._values = {name: 0.0 for name in (*CHANNELS, *FAST_BATCH)}
+        self._windows = {name: stale_window(name, batched and name not in self.raw_channels, self.stale_after)
+                         for name in CHANNELS}
+        # Stale until the first good read; the window runs from the connect
+        now = time.monotonic()
+        self._good_at = {name: now - self._windows[name] for name in self._values}
+
+    def _store(self, name: str, value: Optional[float]) -> None:
+        if value is None:
+            return  # failed read: keep the last good value
+        self._values[name] = value
+        self._good_at[name] = time.monotonic()
+        self._fresh.add(name)
+
+    def _snapshot(self) -> Snapshot:
+        fresh, self._fresh = frozenset(self._fresh), set()
+        now = time.monotonic()
+        stale = frozenset(name for name, t in self._good_at.items() if now - t >= self._windows[name])
+        return Snapshot(True, time.time(), self.link.state.value, self._mil, self._dtc_count,
+                        MappingProxyType(dict(self._values)), fresh, stale, self._fuel_type)
+
+    def _poll_until(self, deadline: float) -> None:
+        """Run due getters until the next publish deadline."""
+        while not self._stop.is_set() and self.link.state == LinkState.CONNECTED:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            wait = self.scheduler.time_until_due()
+            if wait > 0:
+                self._stop.wait(min(wait, remaining))
+                continue
+
+            result = self.scheduler.poll_next(self.link.connection)
+            if result is None:
+                continue
+            name, value = result
+            if name == "status":
+                self.link.report_ecu(value is not None)
+                # Keep the last known MIL state if STATUS didn't answer
+                if value is not None:
+                    self._mil, self._dtc_count = value
+            elif name == "fast_batch":
+                for channel, v in value.items():
+                    self._store(channel, v)
+            else:
+                self._store(name, value)
+
+    def run(self) -> None:
+        while not self._stop.is_set():
+            started = time.monotonic()
+            was_connected = self.link.state == LinkState.CONNECTED
+
+            # Only blocks this thread; backs off while the link stays down
+            state = self.link.poll()
+
+            if state != LinkState.CONNECTED:
+                self.snapshotReady.emit(Snapshot(False, time.time(), state.value))
+                self._stop.wait(max(0.0, min(self.interval * 4, self.link.time_until_attempt())
+                                    - (time.monotonic() - started)))
+                continue
+
+            if not was_connected:
+                self._on_connected()
+
+            try:
+                self._poll_until(started + self.interval)
+                snapshot = self._snapshot()
+            except Exception as e:
+                print("[WARN] OBD poll failed:", e)
+                snapshot = Snapshot(False, time.time(), self.link.state.value)
+            self.snapshotReady.emit(snapshot)
+
+        self.link.close()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: nmea.parse vs pynmea2.parse on a recorded NMEA corpus.
+
+  python3 bench_nmea.py gps_capture.nmea
+  python3 bench_nmea.py                    # synthetic RMC/VTG/GGA/GSV mix
+
+Record a corpus on the Pi with e.g. `cat /dev/ttyACM0 > gps_capture.nmea`.
+"""
+
+import argparse
+import random
+import time
+
+import pynmea2
+
+import nmea
+
+
+def _with_checksum(body: str) -> bytes:
+    cs = 0
+    for c in body:
+        cs ^= ord(c)
+    return f"${body}*{cs:02X}\r\n".encode()
+
+
+def synthetic_corpus(n: int = 10000) -> list[bytes]:
+    rnd = random.Random(1)
+    lines = []
+    for i in range(n // 4):
+        t = f"{12 + i // 36000 % 12:02d}{i // 600 % 60:02d}{i // 10 % 60:02d}.{i % 10}0"
+        kn = rnd.uniform(0, 70)
+        course = rnd.uniform(0, 360)
+        lines.append(_with_checksum(f"GNRMC,{t},A,4807.038,N,01131.000,E,{kn:.3f},{course:.2f},230394,,,A"))
+        lines.append(_with_checksum(f"GNVTG,{course:.2f},T,,M,{kn:.3f},N,{kn * 1.852:.3f},K,A"))
+        lines.append(_with_checksum(f"GNGGA,{t},4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,"))
+        lines.append(_with_checksum("GPGSV,3,1,11,03,03,111,00,04,15,270,00,06,01,010,00,13,06,292,00"))
+    return lines
+
+
+def load_corpus(path: str) -> list[bytes]:
+    with open(path, "rb") as f:
+        return [line for line in f.read().splitlines() if line.startswith(b"$")]
+
+
+def bench(label: str, fn, lines: list[bytes], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            fn(line)
+        best = min(best, time.perf_counter() - start)
+    per_line_us = best / len(lines) * 1e6
+    print(f"{label:<10} {per_line_us:8.2f} us/line  {len(lines) / best:10.0f} lines/s")
+    return best
+
+
+def _pynmea2_speed(line: bytes):
+    # What the dash used to do: full message object just to read spd_over_grnd
+    try:
+        msg = pynmea2.parse(line.decode("ascii", errors="ignore").strip())
+    except pynmea2.ParseError:
+        return None
+    if isinstance(msg, (pynmea2.types.talker.RMC, pynmea2.types.talker.VTG)):
+        return (msg.spd_over_grnd if isinstance(msg, pynmea2.types.talker.RMC) else msg.spd_over_grnd_kts) or 0
+    return None
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("corpus", nargs="?", help="file of raw NMEA lines (default: synthetic)")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    lines = load_corpus(args.corpus) if args.corpus else synthetic_corpus()
+    print(f"{len(lines)} sentences from {args.corpus or 'synthetic corpus'}")
+
+    # Sanity check: both decoders agree on speed wherever pynmea2 gives one
+    mismatches = 0
+    for line in lines:
+        ref = _pynmea2_speed(line)
+        fix = nmea.parse(line)
+        if ref is not None and fix is not None and fix.speed_knots is not None \
+                and abs(float(ref) - fix.speed_knots) > 1e-6:
+            mismatches += 1
+    print(f"speed mismatches: {mismatches}")
+
+    t_ref = bench("pynmea2", _pynmea2_speed, lines, args.repeat)
+    t_fast = bench("nmea", nmea.parse, lines, args.repeat)
+    print(f"speedup:   {t_ref / t_fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
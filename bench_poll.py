@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+End-to-end poll-throughput benchmark against the ELM327 emulator.
+
+  python3 bench_poll.py --profile vpw --duration 30 --json results/vpw.json
+  python3 bench_poll.py --profile can --base-latency 0.03 --compare results/can.json
+  python3 bench_poll.py --profile vpw --raw rpm,speed,throttle_pos
+
+Starts elm_emulator.py on a pty (in its own process, so the CPU figures are
+the dash side only), then:
+
+1. calls every acquisition.CHANNELS getter --calls times back to back, and
+2. runs the real AcquisitionWorker loop (connect, discovery, scheduler,
+   snapshots) for --duration seconds.
+
+Reported: samples/s per channel vs target rate, per-request bus latency
+percentiles, snapshot rate and tick overruns (snapshots arriving later than
+1.5x the publish interval), connect time and CPU usage. --json saves the
+result; --compare prints the change against an earlier result file.
+
+Getters that have an elm_raw fast path are also timed through it ("raw:<name>"),
+with dash-side CPU per call, so python-OBD and raw overhead show side by side.
+--raw switches those channels to the fast path in the worker loop too.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from obd.elm327 import ELM327
+from PyQt5.QtCore import Qt
+
+import elm_raw
+import py_obd
+from acquisition import CHANNELS, FAST_BATCH, FAST_BATCH_HZ, AcquisitionWorker
+from connection_manager import ConnectionManager, LinkState
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def latency_summary(samples: list[float]) -> dict:
+    s = sorted(samples)
+    return {"count": len(s), "p50_ms": percentile(s, 0.50) * 1000, "p95_ms": percentile(s, 0.95) * 1000,
+            "p99_ms": percentile(s, 0.99) * 1000, "max_ms": (s[-1] if s else 0.0) * 1000}
+
+
+@contextlib.contextmanager
+def timed_requests(latencies: dict[str, list[float]]):
+    """Time every request that goes out on the bus, keyed by request bytes."""
+    original = ELM327.send_and_parse
+
+    def send_and_parse(self, cmd):
+        start = time.perf_counter()
+        try:
+            return original(self, cmd)
+        finally:
+            latencies.setdefault(cmd.decode(errors="replace"), []).append(time.perf_counter() - start)
+
+    original_raw = elm_raw.exchange
+
+    def exchange(port, request, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original_raw(port, request, *args, **kwargs)
+        finally:
+            latencies.setdefault("raw " + request.decode(errors="replace").strip(), []).append(
+                time.perf_counter() - start)
+
+    ELM327.send_and_parse = send_and_parse
+    elm_raw.exchange = exchange
+    try:
+        yield
+    finally:
+        ELM327.send_and_parse = original
+        elm_raw.exchange = original_raw
+
+
+@contextlib.contextmanager
+def emulator(profile: str, base_latency, latency_overrides: list[str]):
+    link = os.path.join(tempfile.mkdtemp(prefix="elm-bench-"), "elm")
+    cmd = [sys.executable, os.path.join(HERE, "elm_emulator.py"), "--profile", profile, "--link", link]
+    if base_latency is not None:
+        cmd += ["--base-latency", str(base_latency)]
+    for spec in latency_overrides:
+        cmd += ["--latency", spec]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 10
+        while not os.path.exists(link):
+            if proc.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("emulator did not start")
+            time.sleep(0.05)
+        yield link
+    finally:
+        proc.terminate()
+        proc.wait(timeout=5)
+
+
+def cpu_times() -> tuple[float, float, float]:
+    t = os.times()
+    return t.user, t.system, time.monotonic()
+
+
+def cpu_summary(start, end) -> dict:
+    user, system, wall = (b - a for a, b in zip(start, end))
+    return {"user_s": user, "system_s": system, "percent": 100.0 * (user + system) / wall if wall else 0.0}
+
+
+def time_getter(getter, connection, calls: int) -> dict:
+    samples = []
+    cpu_start = time.process_time()
+    for _ in range(calls):
+        start = time.perf_counter()
+        getter(connection)
+        samples.append(time.perf_counter() - start)
+    cpu_ms = (time.process_time() - cpu_start) * 1000 / calls
+    return {"rate_hz": calls / sum(samples), "cpu_ms": cpu_ms, **latency_summary(samples)}
+
+
+def bench_getters(port: str, calls: int) -> dict:
+    """Each getter called back to back (python-OBD, then raw fast path): per-channel throughput."""
+    link = ConnectionManager(port, cache_path=None)
+    link.poll()
+    connection = link.connection
+    if link.state != LinkState.CONNECTED:
+        link.close()
+        raise RuntimeError(f"could not connect to emulator on {port}")
+    py_obd.discover_capabilities(connection, path=None)     # keep the emulator out of the real cache
+    results = {}
+    try:
+        for name, (getter, _, _) in CHANNELS.items():
+            results[name] = time_getter(elm_raw.on_default_header(link.raw, getter), connection, calls)
+            if name in elm_raw.RAW_PIDS:
+                results[f"raw:{name}"] = time_getter(elm_raw.getter(name, link.raw), connection, calls)
+        batch = dict(FAST_BATCH)
+        if py_obd.probe_multi_pid(connection, list(batch.values())):
+            start = time.perf_counter()
+            for _ in range(calls):
+                py_obd.get_batch(connection, batch)
+            results["fast_batch"] = {"rate_hz": calls / (time.perf_counter() - start)}
+    finally:
+        link.close()
+    return results
+
+
+def bench_cycle(port: str, duration: float, raw_channels=()) -> dict:
+    """The real worker loop, end to end, for `duration` seconds after connecting."""
+    worker = AcquisitionWorker(port, raw_channels=raw_channels)
+    worker.link = ConnectionManager(port, cache_path=None)     # always a cold connect
+    worker.capability_path = None
+    arrivals = []
+    connected_at = []
+    lock = threading.Lock()
+
+    def on_snapshot(snapshot):
+        now = time.monotonic()
+        with lock:
+            if snapshot.connected:
+                if not connected_at:
+                    connected_at.append(now)
+                arrivals.append(now)
+
+    worker.snapshotReady.connect(on_snapshot, Qt.DirectConnection)
+    started = time.monotonic()
+    runner = threading.Thread(target=worker.run, daemon=True)
+    runner.start()
+    while not connected_at and time.monotonic() - started < 60:
+        time.sleep(0.05)
+    if not connected_at:
+        worker._stop.set()
+        raise RuntimeError("worker never connected")
+
+    # Don't count the discovery pass and first fill
+    counts_before = dict(worker.scheduler.counts())
+    cpu_start = cpu_times()
+    time.sleep(duration)
+    cpu_end = cpu_times()
+    counts = worker.scheduler.counts()
+    worker._stop.set()
+    runner.join(timeout=10)
+
+    with lock:
+        window = [t for t in arrivals if cpu_start[2] <= t <= cpu_end[2]]
+    gaps = [b - a for a, b in zip(window, window[1:])]
+    targets = {name: hz for name, (_, hz, _) in CHANNELS.items()}
+    targets["fast_batch"] = FAST_BATCH_HZ
+    channels = {}
+    for name, n in counts.items():
+        if name == "status":
+            continue
+        got = n - counts_before.get(name, 0)
+        channels[name] = {"samples": got, "rate_hz": got / duration, "target_hz": targets.get(name)}
+
+    return {
+        "connect_s": connected_at[0] - started,
+        "multi_pid": "fast_batch" in counts,
+        "raw": sorted(raw_channels),
+        "channels": channels,
+        "snapshots": {
+            "count": len(window),
+            "rate_hz": len(window) / duration,
+            "overruns": sum(1 for g in gaps if g > 1.5 * worker.interval),
+            "max_gap_ms": max(gaps, default=0.0) * 1000,
+        },
+        "cpu": cpu_summary(cpu_start, cpu_end),
+    }
+
+
+def git_version() -> str:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=HERE, capture_output=True,
+                              text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def print_report(result: dict) -> None:
+    cycle = result["cycle"]
+    print(f"\n== {result['profile']} ({result['version']}) ==")
+    print(f"connect {cycle['connect_s']:.1f} s, multi-PID {'on' if cycle['multi_pid'] else 'off'}, "
+          f"raw {', '.join(cycle.get('raw', [])) or 'off'}")
+    print(f"{'channel':<16} {'rate':>8} {'target':>8}   (worker loop)")
+    for name, c in sorted(cycle["channels"].items()):
+        target = f"{c['target_hz']:.2f}" if c["target_hz"] else "-"
+        print(f"{name:<16} {c['rate_hz']:8.2f} {target:>8}")
+    s = cycle["snapshots"]
+    print(f"snapshots {s['rate_hz']:.1f}/s, {s['overruns']} overruns, max gap {s['max_gap_ms']:.0f} ms")
+    print(f"cpu {cycle['cpu']['percent']:.1f}% ({cycle['cpu']['user_s']:.2f} s user, {cycle['cpu']['system_s']:.2f} s sys)")
+
+    print(f"\n{'request':<14} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for cmd, r in sorted(result["requests"].items(), key=lambda kv: -kv[1]["count"]):
+        print(f"{cmd:<14} {r['count']:6d} {r['p50_ms']:8.1f} {r['p95_ms']:8.1f} {r['p99_ms']:8.1f} {r['max_ms']:8.1f}")
+
+    print(f"\n{'getter':<20} {'rate':>8} {'p50 ms':>8} {'p95 ms':>8} {'cpu ms':>8}   (back to back)")
+    for name, g in result["getters"].items():
+        print(f"{name:<20} {g['rate_hz']:8.2f} {g.get('p50_ms', 0):8.1f} {g.get('p95_ms', 0):8.1f} "
+              f"{g.get('cpu_ms', 0):8.2f}")
+
+
+def print_comparison(old: dict, new: dict) -> None:
+    print(f"\n== vs {old.get('version') or 'previous'} ==")
+    for name, c in sorted(new["cycle"]["channels"].items()):
+        before = old.get("cycle", {}).get("channels", {}).get(name)
+        if before and before["rate_hz"]:
+            change = 100 * (c["rate_hz"] / before["rate_hz"] - 1)
+            print(f"{name:<16} {before['rate_hz']:8.2f} -> {c['rate_hz']:8.2f} Hz ({change:+.0f}%)")
+    for key in ("rate_hz", "overruns"):
+        a, b = old["cycle"]["snapshots"][key], new["cycle"]["snapshots"][key]
+        print(f"snapshots {key:<10} {a:8.2f} -> {b:8.2f}")
+    a, b = old["cycle"]["cpu"]["percent"], new["cycle"]["cpu"]["percent"]
+    print(f"cpu percent          {a:8.1f} -> {b:8.1f}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--profile", choices=("vpw", "can"), default="vpw")
+    ap.add_argument("--base-latency", type=float, help="emulated bus latency per request (s)")
+    ap.add_argument("--latency", action="append", default=[], metavar="CMD=SECONDS")
+    ap.add_argument("--duration", type=float, default=20.0, help="seconds of worker loop to measure")
+    ap.add_argument("--calls", type=int, default=20, help="back-to-back calls per getter")
+    ap.add_argument("--json", help="save the result here")
+    ap.add_argument("--compare", help="earlier result JSON to compare against")
+    ap.add_argument("--raw", default="", metavar="CHANNELS",
+                    help="comma-separated channels (or 'all') on the raw fast path in the worker loop")
+    args = ap.parse_args()
+    raw_channels = set(elm_raw.RAW_PIDS) if args.raw == "all" else {c for c in args.raw.split(",") if c}
+    if raw_channels - set(elm_raw.RAW_PIDS):
+        ap.error(f"--raw: no fast path for {', '.join(sorted(raw_channels - set(elm_raw.RAW_PIDS)))}")
+
+    latencies: dict[str, list[float]] = {}
+    with emulator(args.profile, args.base_latency, args.latency) as port, timed_requests(latencies):
+        getters = bench_getters(port, args.calls)
+        latencies.clear()   # only the worker loop's requests below
+        cycle = bench_cycle(port, args.duration, raw_channels)
+
+    result = {
+        "version": git_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "profile": args.profile,
+        "base_latency": args.base_latency,
+        "latency_overrides": args.latency,
+        "duration_s": args.duration,
+        "cycle": cycle,
+        "requests": {cmd: latency_summary(s) for cmd, s in latencies.items()},
+        "getters": getters,
+    }
+    print_report(result)
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), result)
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\n[INFO] Saved {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+"""
+connection_manager.py - OBD link state machine for the acquisition worker
+
+States:
+  PORT_ABSENT  - /dev/rfcomm0 missing or the adapter doesn't answer
+  ADAPTER_UP   - the ELM answers AT commands but there's no 12 V / OBD socket
+  ECU_SILENT   - adapter and socket are fine, the ECU isn't talking (ignition off)
+  CONNECTED    - ECU answering Mode 01
+
+Attempts back off exponentially (capped) while the link is down. The protocol
+found on the first good connect is remembered, so when the ECU goes quiet and
+comes back (engine restart) we only re-probe it on the already-initialised
+adapter instead of repeating ATZ and the ATSP0 auto-detect sweep.
+
+Protocol, baud rate and ELM version are also saved per port in LINK_CACHE_PATH,
+so a cold start tries the last good settings first (no baud search, ATTP
+instead of ATSP0) and only falls back to the full sweep if that fails.
+
+The baud rate is found here rather than by python-OBD: each candidate gets an
+ATI on a plain serial port with a short timeout (probe_timeout), and obd.OBD
+is then opened at the one that answered. python-OBD reads with a 10 s timeout
+once it has the port, so a stale cached baud handed to it would cost that
+much per AT command before the sweep even started.
+"""
+
+import os
+import time
+from enum import Enum
+from typing import Callable, Optional
+
+import obd
+import serial
+from obd import OBDStatus
+
+import elm_raw
+import py_obd
+
+LINK_CACHE_PATH = os.path.join(py_obd.CACHE_DIR, "link.json")
+
+
+class LinkState(Enum):
+    PORT_ABSENT = "port-absent"
+    ADAPTER_UP = "adapter-up"
+    ECU_SILENT = "ecu-silent"
+    CONNECTED = "connected"
+
+
+# Same order as python-OBD's own search: the two ELM defaults, then fastest first
+BAUDRATES = [38400, 9600, 230400, 115200, 57600, 19200]
+
+
+def probe_adapter(port: str, baudrate: int, timeout: float) -> Optional[serial.Serial]:
+    """
+    `port` opened at `baudrate` if an ELM327 there gives a prompt back for ATI
+    within `timeout`, else None. The caller closes it.
+    """
+    try:
+        s = serial.Serial(port, baudrate, timeout=timeout)
+    except (serial.SerialException, OSError):
+        return None
+    try:
+        s.write(b"ATI\r")
+        deadline = time.monotonic() + timeout
+        reply = b""
+        while time.monotonic() < deadline and not reply.rstrip().endswith(b">"):
+            reply += s.read(s.in_waiting or 1)
+        if reply.rstrip().endswith(b">"):
+            return s
+    except (serial.SerialException, OSError):
+        pass
+    s.close()
+    return None
+
+
+def _state_for(status) -> LinkState:
+    if status == OBDStatus.CAR_CONNECTED:
+        return LinkState.CONNECTED
+    if status == OBDStatus.OBD_CONNECTED:
+        return LinkState.ECU_SILENT
+    if status == OBDStatus.ELM_CONNECTED:
+        return LinkState.ADAPTER_UP
+    return LinkState.PORT_ABSENT
+
+
+class ConnectionManager:
+    """Owns the obd.OBD object and decides when (and how) to reconnect."""
+
+    # Consecutive failed ECU checks before a connected link is declared silent
+    SILENT_AFTER = 2
+    # Attempts with the cached protocol that find no ECU before we forget it
+    # (a different vehicle, or the cache was wrong) and fall back to auto-detect
+    FORGET_PROTOCOL_AFTER = 3
+
+    def __init__(self, port: str, base_delay: float = 0.5, max_delay: float = 30.0,
+                 timeout: float = 2, probe_timeout: float = 0.5,
+                 cache_path: Optional[str] = LINK_CACHE_PATH, clock: Callable[[], float] = time.monotonic):
+        self.port = port
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.probe_timeout = probe_timeout      # s to wait for the adapter's prompt at each baud rate
+        self.cache_path = cache_path
+        self._clock = clock
+
+        self.state = LinkState.PORT_ABSENT
+        self.connection: Optional[obd.OBD] = None
+        self.raw: Optional[elm_raw.RawLink] = None     # elm_raw's handle on the same port
+        self.protocol: Optional[str] = None     # ELM protocol id, e.g. "2" (VPW) or "6" (CAN)
+        self.baudrate: Optional[int] = None
+        self.elm_version = ""
+        self._sweep_seconds: Optional[float] = None  # how long the last full auto-detect took
+        self._load_cache()
+
+        self._failures = 0
+        self._protocol_misses = 0
+        self._silent_checks = 0
+        self._next_attempt = 0.0
+
+    # -- public --
+
+    def poll(self) -> LinkState:
+        """Call from the worker loop. Attempts a (re)connect when one is due."""
+        if self.state == LinkState.CONNECTED and self.connection is not None \
+                and self.connection.status() == OBDStatus.NOT_CONNECTED:
+            # Serial link died under us (Bluetooth dropped)
+            self._set_state(LinkState.PORT_ABSENT)
+            self._close()
+
+        if self.state != LinkState.CONNECTED and self._clock() >= self._next_attempt:
+            self._attempt()
+        return self.state
+
+    def time_until_attempt(self) -> float:
+        return max(0.0, self._next_attempt - self._clock())
+
+    def report_ecu(self, answered: bool) -> None:
+        """
+        Feed the result of a periodic ECU check. python-OBD keeps reporting
+        CAR_CONNECTED after the ignition goes off, so this is how silence is noticed.
+        """
+        if self.state != LinkState.CONNECTED:
+            return
+        if answered:
+            self._silent_checks = 0
+            return
+        self._silent_checks += 1
+        if self._silent_checks >= self.SILENT_AFTER:
+            self._set_state(LinkState.ECU_SILENT)
+            self._schedule_retry()
+
+    def close(self) -> None:
+        self._close()
+        self._set_state(LinkState.PORT_ABSENT)
+
+    # -- internals --
+
+    def _set_state(self, state: LinkState) -> None:
+        if state != self.state:
+            print(f"[INFO] OBD link: {self.state.value} -> {state.value}")
+            self.state = state
+
+    def _close(self) -> None:
+        if self.raw is not None:
+            self.raw.close()
+            self.raw = None
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+        self.connection = None
+
+    def _schedule_retry(self) -> None:
+        delay = min(self.max_delay, self.base_delay * (2 ** self._failures))
+        self._failures += 1
+        self._next_attempt = self._clock() + delay
+
+    def _load_cache(self) -> None:
+        if not self.cache_path:
+            return
+        entry = py_obd.read_json_cache(self.cache_path).get(self.port)
+        if not entry:
+            return
+        self.protocol = entry.get("protocol") or None
+        self.baudrate = entry.get("baudrate") or None
+        self.elm_version = entry.get("elm_version", "")
+        self._sweep_seconds = entry.get("sweep_seconds")
+        print(f"[INFO] Cached link for {self.port}: protocol {self.protocol} @ {self.baudrate or 'auto'} baud"
+              f" ({self.elm_version or 'unknown adapter'})")
+
+    def _save_cache(self) -> None:
+        if not self.cache_path:
+            return
+        data = py_obd.read_json_cache(self.cache_path)
+        data[self.port] = {
+            "protocol": self.protocol,
+            "baudrate": self.baudrate,
+            "elm_version": self.elm_version,
+            "sweep_seconds": self._sweep_seconds,
+        }
+        py_obd.write_json_cache(self.cache_path, data)
+
+    def _read_elm_version(self) -> str:
+        try:
+            resp = self.connection.query(obd.commands.ELM_VERSION, force=True)
+            return str(resp.value or "").strip()
+        except Exception:
+            return ""
+
+    def _connected(self) -> None:
+        self._failures = 0
+        self._protocol_misses = 0
+        self._silent_checks = 0
+        protocol = self.connection.protocol_id()
+        baudrate = self.baudrate
+        elm_version = self._read_elm_version() or self.elm_version
+        if elm_version and self.elm_version and elm_version != self.elm_version:
+            print(f"[INFO] Adapter changed: {self.elm_version} -> {elm_version}")
+
+        changed = (protocol, baudrate, elm_version) != (self.protocol, self.baudrate, self.elm_version)
+        self.protocol, self.baudrate, self.elm_version = protocol, baudrate, elm_version
+        if changed:
+            self._save_cache()
+        if self.raw is None:
+            try:
+                self.raw = elm_raw.RawLink(self.port, self.baudrate)
+            except (serial.SerialException, OSError) as e:
+                print("[WARN] Raw fast path unavailable:", e)
+        if self.raw is not None:
+            self.raw.protocol = protocol
+        self._set_state(LinkState.CONNECTED)
+
+    def _ecu_answers(self) -> bool:
+        resp = py_obd.timed_query(self.connection, obd.commands.PIDS_A, force=True)
+        return resp is not None and resp.value is not None
+
+    def _attempt(self) -> None:
+        if not os.path.exists(self.port):
+            self._close()
+            self._set_state(LinkState.PORT_ABSENT)
+            self._schedule_retry()
+            return
+
+        if self.connection is not None and self.state in (LinkState.ADAPTER_UP, LinkState.ECU_SILENT):
+            if self._relink():
+                return
+            if self.connection is not None and self.connection.status() != OBDStatus.NOT_CONNECTED:
+                # Adapter still fine, ECU still quiet; keep the session and wait
+                self._schedule_retry()
+                return
+
+        self._full_connect()
+
+    def _relink(self) -> bool:
+        """Re-probe the ECU on the existing adapter session (no ATZ, no baud search)."""
+        started = self._clock()
+        try:
+            if self.raw is not None:
+                self.raw.select("")     # a module read may have left another header set
+            if not self.connection.protocol_id():
+                # The ECU never answered on this session. Select the cached protocol
+                # directly (ATTP), or run the ELM's auto-detect if we don't have one yet.
+                if not self.connection.interface.set_protocol(self.protocol):
+                    self._protocol_miss()
+                    return False
+            if self._ecu_answers():
+                self._connected()
+                print(f"[INFO] ECU re-linked in {(self._clock() - started) * 1000:.0f} ms")
+                return True
+            self._protocol_miss()
+        except Exception as e:
+            print("[WARN] OBD relink failed:", e)
+        return False
+
+    def _protocol_miss(self) -> None:
+        if self.protocol is None:
+            return
+        self._protocol_misses += 1
+        if self._protocol_misses >= self.FORGET_PROTOCOL_AFTER:
+            print("[INFO] Cached protocol", self.protocol, "not answering; going back to auto-detect")
+            self.protocol = None
+            self._protocol_misses = 0
+            # Next attempt starts over with a fresh adapter session
+            self._close()
+
+    def _find_baudrate(self) -> tuple[Optional[int], Optional[serial.Serial]]:
+        """The baud rate the adapter answers at and the probe port, or (None, None)."""
+        for baudrate in BAUDRATES:
+            probe = probe_adapter(self.port, baudrate, self.probe_timeout)
+            if probe is not None:
+                return baudrate, probe
+        return None, None
+
+    def _open(self, baudrate: Optional[int], protocol: Optional[str], probe: Optional[serial.Serial]) -> LinkState:
+        if probe is None:
+            print("OBD status: no adapter prompt at any baud rate")
+            return LinkState.PORT_ABSENT
+        try:
+            self.connection = obd.OBD(portstr=self.port, baudrate=baudrate, protocol=protocol,
+                                      fast=False, timeout=self.timeout)
+            state = _state_for(self.connection.status())
+        except Exception as e:
+            print("[WARN] OBD connect failed:", e)
+            state = LinkState.PORT_ABSENT
+        finally:
+            # Only now: closing the last handle on a Bluetooth rfcomm port drops the link
+            probe.close()
+        print("OBD status:", self.connection.status() if self.connection else "none")
+        return state
+
+    def _full_connect(self) -> None:
+        self._close()
+        started = self._clock()
+        probe = None
+        if self.baudrate is not None:
+            probe = probe_adapter(self.port, self.baudrate, self.probe_timeout)
+        cached = probe is not None
+
+        if cached:
+            # Last good settings: the baud just answered, ATTP skips ATSP0
+            state = self._open(self.baudrate, self.protocol, probe)
+        else:
+            if self.baudrate is not None:
+                # Nothing answered at that baud (different adapter?); do the full sweep now
+                print("[INFO] Cached link settings failed; falling back to full auto-detect")
+                self.protocol = None
+            self.baudrate, probe = self._find_baudrate()
+            state = self._open(self.baudrate, None, probe)
+
+        elapsed = self._clock() - started
+        if state == LinkState.CONNECTED:
+            if not cached:
+                self._sweep_seconds = elapsed
+                print(f"[INFO] Connected in {elapsed:.2f} s (full auto-detect)")
+            elif self._sweep_seconds:
+                print(f"[INFO] Connected in {elapsed:.2f} s with cached protocol {self.protocol}"
+                      f" (full auto-detect took {self._sweep_seconds:.2f} s, saved {self._sweep_seconds - elapsed:.2f} s)")
+            else:
+                print(f"[INFO] Connected in {elapsed:.2f} s with cached protocol {self.protocol}")
+            self._connected()
+            if not cached:
+                self._save_cache()  # new sweep time
+            return
+
+        if state == LinkState.ECU_SILENT:
+            self._protocol_miss()
+        if state == LinkState.PORT_ABSENT:
+            self._close()
+            # Adapter didn't answer at that baud; search again next time
+            self.baudrate = None
+        self._set_state(state)
+        self._schedule_retry()
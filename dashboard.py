@@ -1,13 +1,17 @@
-import os, sys, datetime
-from PyQt5.QtCore import QObject, QUrl, pyqtSignal, Qt, pyqtProperty, QTimer, pyqtSlot
+import os, sys, datetime, signal, argparse
+from PyQt5.QtCore import QObject, QUrl, pyqtSignal, Qt, pyqtProperty, QTimer, QSocketNotifier
 from PyQt5.QtWidgets import QApplication
 from PyQt5.QtQuick import QQuickView
-import py_obd, obd
-from obd import commands, OBDStatus
-import serial, pynmea2
-
-connection = None
-last_reconnect = 0.0
+from acquisition import AcquisitionWorker, PROBLEMS as CHANNEL_PROBLEMS
+from replay import ReplayWorker
+from speed_fusion import SpeedFusion
+from gauge_models import GaugeModel, TelemetryModel, UPDATE_STATS
+from trip_recorder import TripRecorder, PROBLEMS as TRIP_PROBLEMS
+from py_obd import QUERY_STATS
+import elm_raw
+import enhanced_pids
+import serial
+import nmea
 
 def get_serial_ports():
     # More reliable check for Raspberry Pi
@@ -36,134 +40,66 @@ def set_update_rate(port="/dev/ttyACM0", rate_ms=100):
         s.write(full.encode())
 
 
-class CheckEngine(QObject):
-    milChanged = pyqtSignal()
-    dtcCountChanged = pyqtSignal()
-
-    def __init__(self):
-        super().__init__()
-        self._mil = False
-        self._dtc_count = 0
-
-    @pyqtProperty(bool, notify=milChanged)
-    def mil(self): return self._mil
-
-    @mil.setter
-    def mil(self, v): self._mil = v; self.milChanged.emit()
-
-    @pyqtProperty(int, notify=dtcCountChanged)
-    def dtcCount(self): return self._dtc_count
-
-    @dtcCount.setter
-    def dtcCount(self, v): self._dtc_count = v; self.dtcCountChanged.emit()
-
-
 class GPSSpeedReader(QObject):
+    """
+    Event-driven NMEA reader. A QSocketNotifier on the serial fd wakes us when
+    bytes arrive; every available byte is drained into a buffer (like ReadLine
+    in testgps.py), all complete sentences are consumed and only the newest
+    speed is emitted. Nothing here ever blocks the GUI thread.
+    """
     speedUpdated = pyqtSignal(float)
 
+    MAX_BUFFER = 4096   # a stuck line without "\n" can't grow forever
+
     def __init__(self, port="/dev/ttyACM0", baud=115200, parent=None):
         super().__init__(parent)
-        self.port = serial.Serial(port, baudrate=baud, timeout=1)
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.read_speed)
-        self.timer.start(100)
-
-    def read_speed(self):
+        self.port = serial.Serial(port, baudrate=baud, timeout=0)  # non-blocking reads
+        self._buf = bytearray()
+        self.notifier = None
+        self.timer = None
         try:
-            raw = self.port.readline().decode('ascii', errors='ignore').strip()
-            if raw.startswith('$GPRMC'):
-                msg = pynmea2.parse(raw)
-                speed_knots = msg.spd_over_grnd or 0
-                speed_mph = speed_knots * 1.15078
-                self.speedUpdated.emit(round(speed_mph))
+            self.notifier = QSocketNotifier(self.port.fileno(), QSocketNotifier.Read, self)
+            self.notifier.activated.connect(self.read_available)
         except Exception:
-            pass
-
-
-class Speedometer(QObject):
-    speedChanged = pyqtSignal()
-
-    def __init__(self):
-        super().__init__()
-        self._minSpeed = 0.0
-        self._maxSpeed = 160.0
-        self._currSpeed = 0.0
-
-    @pyqtProperty(float, notify=speedChanged)
-    def currSpeed(self): return self._currSpeed
-
-    @currSpeed.setter
-    def currSpeed(self, v): self._currSpeed = v; self.speedChanged.emit()
-
-    @pyqtSlot(float)
-    def updateSpeed(self, v): self.currSpeed = v
-
-    @pyqtProperty(float)
-    def maxSpeed(self): return self._maxSpeed
-
-    @pyqtProperty(float)
-    def minSpeed(self): return self._minSpeed
-
-
-class RPMMeter(QObject):
-    RPMChanged = pyqtSignal()
-
-    def __init__(self):
-        super().__init__()
-        self._minRPM = 0.0
-        self._maxRPM = 10.0
-        self._currRPM = 0.0
-
-    @pyqtProperty(float, notify=RPMChanged)
-    def currRPM(self): return self._currRPM
-
-    @currRPM.setter
-    def currRPM(self, v): self._currRPM = v; self.RPMChanged.emit()
+            # No selectable fd (e.g. Windows COM port while testing); poll instead
+            self.timer = QTimer(self)
+            self.timer.timeout.connect(self.read_available)
+            self.timer.start(20)
 
-    @pyqtProperty(float)
-    def maxRPM(self): return self._maxRPM
-
-    @pyqtProperty(float)
-    def minRPM(self): return self._minRPM
-
-
-class BarMeter(QObject):
-    currValueChanged = pyqtSignal()
-
-    def __init__(self):
-        super().__init__()
-        self._minValue = 0.0
-        self._maxValue = 0.0
-        self._currValue = 0.0
-
-    @pyqtProperty(float, notify=currValueChanged)
-    def currValue(self): return self._currValue
-
-    @currValue.setter
-    def currValue(self, v): self._currValue = v; self.currValueChanged.emit()
-
-    @pyqtProperty(float)
-    def maxValue(self): return self._maxValue
-
-    @pyqtProperty(float)
-    def minValue(self): return self._minValue
-
-
-class StringLabel(QObject):
-    currValueChanged = pyqtSignal()
+    def read_available(self, *_):
+        try:
+            data = self.port.read(self.port.in_waiting or 1)
+        except (serial.SerialException, OSError):
+            # Receiver unplugged; stop listening rather than spinning on a dead fd
+            if self.notifier is not None:
+                self.notifier.setEnabled(False)
+            return
+        if not data:
+            return
+        self._buf.extend(data)
 
-    def __init__(self):
-        super().__init__()
-        self._currValue = ""
+        end = self._buf.rfind(b"\n")
+        if end < 0:
+            if len(self._buf) > self.MAX_BUFFER:
+                self._buf.clear()
+            return
+        lines = bytes(self._buf[:end]).split(b"\n")
+        del self._buf[:end + 1]
 
-    @pyqtProperty(str, notify=currValueChanged)
-    def currValue(self): return self._currValue
+        # Only the newest speed matters, so walk backwards and parse just that one
+        for raw in reversed(lines):
+            speed = self.parse_speed(raw)
+            if speed is not None:
+                self.speedUpdated.emit(speed)
+                return
 
-    @currValue.setter
-    def currValue(self, v): self._currValue = v; self.currValueChanged.emit()
+    @staticmethod
+    def parse_speed(raw: bytes):
+        """Speed in mph from an RMC/VTG line (any talker) with a fix, or None."""
+        return nmea.speed_mph(raw)
 
 
-class CenterScreenWidget(QObject):
+class CenterScreenWidget(GaugeModel):
     currTimeChanged = pyqtSignal()
 
     def __init__(self):
@@ -176,13 +112,13 @@ class CenterScreenWidget(QObject):
     def currTime(self): return self._currTime
 
     @currTime.setter
-    def currTime(self, v): self._currTime = v; self.currTimeChanged.emit()
+    def currTime(self, v): self._set("_currTime", v, self.currTimeChanged)
 
     @pyqtProperty(str, notify=currTimeChanged)
     def currDate(self): return self._currDate
 
     @currDate.setter
-    def currDate(self, v): self._currDate = v; self.currTimeChanged.emit()
+    def currDate(self, v): self._set("_currDate", v, self.currTimeChanged)
 
     def update_now(self):
         now = datetime.datetime.now()
@@ -190,142 +126,131 @@ class CenterScreenWidget(QObject):
         self.currDate = now.strftime("%m/%d/%Y")
 
 
-# — Utility Functions —
+class Diagnostics(GaugeModel):
+    """Hidden page (long-press the check engine light): per-command query stats."""
+    tableChanged = pyqtSignal()
+    visibleChanged = pyqtSignal()
+
+    def __init__(self):
+        super().__init__()
+        self._table = ""
+        self._visible = False
+        # Only format the table while someone is looking at it
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+
+    @pyqtProperty(str, notify=tableChanged)
+    def table(self): return self._table
 
-def make_connection(port: str) -> obd.OBD:
-    # VPW/Class2 tends to be more reliable with fast=False and a slightly longer timeout
-    return obd.OBD(portstr=port, fast=False, timeout=2)
+    @pyqtProperty(bool, notify=visibleChanged)
+    def visible(self): return self._visible
+
+    @visible.setter
+    def visible(self, v):
+        if self._set("_visible", v, self.visibleChanged):
+            if v:
+                self.refresh()
+                self.timer.start(1000)
+            else:
+                self.timer.stop()
+
+    def refresh(self):
+        self._set("_table", QUERY_STATS.table() + "\n\n" + UPDATE_STATS.summary(), self.tableChanged)
 
 
 # — Main Application —
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    ap = argparse.ArgumentParser(description="OBD2 / GPS dashboard")
+    ap.add_argument("--replay", metavar="FILE", help="play back a trip file or ELM transcript instead of the truck")
+    ap.add_argument("--speed", type=float, default=1.0, help="replay speed, 1-50x")
+    ap.add_argument("--raw", metavar="CHANNELS", default="",
+                    help="comma-separated channels (or 'all') to read via the raw ELM327 fast path")
+    args, qt_args = ap.parse_known_args()
+    raw_channels = set(elm_raw.RAW_PIDS) if args.raw == "all" else {c for c in args.raw.split(",") if c}
+    if raw_channels - set(elm_raw.RAW_PIDS):
+        ap.error(f"--raw: no fast path for {', '.join(sorted(raw_channels - set(elm_raw.RAW_PIDS)))} "
+                 f"(have: {', '.join(elm_raw.RAW_PIDS)})")
+    # enhanced_pids.json entries left out on load (bad definition, clashing name or trip_id)
+    for problem in (*enhanced_pids.PROBLEMS, *CHANNEL_PROBLEMS, *TRIP_PROBLEMS):
+        print("[WARN]", problem)
+
+    app = QApplication(sys.argv[:1] + qt_args)
     view = QQuickView()
     engine = view.engine()
     engine.addImportPath(os.path.join(os.getcwd(), "qml"))
 
     gps_port, obd_port, qml_file = get_serial_ports()
 
-    set_update_rate(gps_port, 100)
+    replaying = args.replay is not None
+    if not replaying:
+        set_update_rate(gps_port, 100)
 
     # Instantiate
-    temperature = BarMeter()
-    battery_capacity = BarMeter()       # now shows module voltage (V)
-    speedometer = Speedometer()
-    rpmmeter = RPMMeter()
+    # Every gauge value lives in one frame (deadbands in gauge_models.FRAME_FIELDS;
+    # enhanced_pids.json channels in its enhanced map, with their own)
+    telemetry = TelemetryModel(rate_hz=20, enhanced={name: pid.deadband
+                                                     for name, pid in enhanced_pids.DEFINITIONS.items()})
     centerScreen = CenterScreenWidget()
-    intakePressureLabel = BarMeter()
-    intakeTempLabel = BarMeter()
-    runtimeLabel = StringLabel()
-    fuelLevelLabel = BarMeter()         # now updated (%)
-    fuelTypeLabel = StringLabel()
-    engineLoadLabel = BarMeter()
-    throttlePosLabel = BarMeter()
-    barometricPressureLabel = BarMeter()
-    throttleAcceleratorLabel = BarMeter()
-    absoluteLoadLabel = BarMeter()
-    cel = CheckEngine()
-    gps = GPSSpeedReader(gps_port)
-    oilPressureLabel = BarMeter()
+    diagnostics = Diagnostics()
+    # A replay brings its own GPS speed and shouldn't be recorded again
+    gps = None if replaying else GPSSpeedReader(gps_port)
+    recorder = None if replaying else TripRecorder()
 
     # Expose to QML
     ctx = engine.rootContext()
-    ctx.setContextProperty("speedometer", speedometer)
-    ctx.setContextProperty("RPM_Meter", rpmmeter)
-    ctx.setContextProperty("temperature", temperature)
-    ctx.setContextProperty("battery_capacity", battery_capacity)
-    ctx.setContextProperty("intakePressureLabel", intakePressureLabel)
-    ctx.setContextProperty("intakeTempLabel", intakeTempLabel)
-    ctx.setContextProperty("runtimeLabel", runtimeLabel)
-    ctx.setContextProperty("fuelLevelLabel", fuelLevelLabel)
-    ctx.setContextProperty("fuelTypeLabel", fuelTypeLabel)
-    ctx.setContextProperty("engineLoadLabel", engineLoadLabel)
-    ctx.setContextProperty("throttlePosLabel", throttlePosLabel)
-    ctx.setContextProperty("barometricPressureLabel", barometricPressureLabel)
-    ctx.setContextProperty("throttleAcceleratorLabel", throttleAcceleratorLabel)
-    ctx.setContextProperty("absoluteLoadLabel", absoluteLoadLabel)
+    ctx.setContextProperty("telemetry", telemetry)
     ctx.setContextProperty("centerScreen", centerScreen)
-    ctx.setContextProperty("checkEngine", cel)
-    ctx.setContextProperty("oilPressureLabel", oilPressureLabel)
+    ctx.setContextProperty("diagnostics", diagnostics)
 
     view.setSource(QUrl.fromLocalFile(qml_file))
     view.show()
 
-    # Wire GPS -> Speedometer (connect ONCE)
-    gps.speedUpdated.connect(speedometer.updateSpeed)
-
-    # Connect to OBD
-    connection = make_connection(obd_port)
-    print("OBD status:", connection.status())
-
-    # Only attempt PID discovery if connected (and never let it crash the UI)
-    if connection.status() == OBDStatus.CAR_CONNECTED:
-        try:
-            py_obd.get_supported_pids_mode01(connection)
-            py_obd.get_supported_pids_mode06(connection)
-        except Exception as e:
-            print("[WARN] PID discovery failed:", e)
-
-    last_reconnect = 0.0
-
-    def set_disconnected_values():
-        rpmmeter.currRPM = 0
-        temperature.currValue = 0
-        battery_capacity.currValue = 0
-        engineLoadLabel.currValue = 0
-        throttlePosLabel.currValue = 0
-        barometricPressureLabel.currValue = 0
-        intakeTempLabel.currValue = 0
-        intakePressureLabel.currValue = 0
-        absoluteLoadLabel.currValue = 0
-        fuelLevelLabel.currValue = 0
-        oilPressureLabel.currValue = 0
-        # Show "disconnected" by turning MIL on (optional)
-        cel.mil = True
-        cel.dtcCount = 0
-
-    def update_all():
-        global last_reconnect, connection
-
-        centerScreen.update_now()
-
-        # If not connected, try to reconnect (rate-limited)
-        if connection.status() != OBDStatus.CAR_CONNECTED:
-            now = datetime.datetime.now().timestamp()
-            if now - last_reconnect > 2.0:
-                last_reconnect = now
-                try:
-                    connection.close()
-                except Exception:
-                    pass
-                connection = make_connection(obd_port)
-                print("OBD status:", connection.status())
-
-            set_disconnected_values()
-            return
-
-        # Connected: pull values
-        resp = connection.query(commands.STATUS)
-        if resp and resp.value:
-            cel.mil = bool(resp.value.MIL)
-            cel.dtcCount = int(resp.value.DTC_count)
-
-        # RPM in thousands for your gauge
-        rpmmeter.currRPM = (py_obd.get_rpm(connection) or 0) / 1000
-        temperature.currValue = py_obd.get_temperature(connection) or 0
-        battery_capacity.currValue = py_obd.get_battery_voltage(connection) or 0
-        engineLoadLabel.currValue = py_obd.get_engine_load(connection) or 0
-        throttlePosLabel.currValue = py_obd.get_throttle_pos(connection) or 0
-        barometricPressureLabel.currValue = py_obd.get_barometric_pressure(connection) or 0
-        intakePressureLabel.currValue = py_obd.get_intake_pressure(connection) or 0
-        intakeTempLabel.currValue = py_obd.get_intake_temp(connection) or 0
-        absoluteLoadLabel.currValue = py_obd.get_absolute_load(connection) or 0
-        fuelLevelLabel.currValue = py_obd.get_fuel_level(connection) or 0
-        oilPressureLabel.currValue = py_obd.get_oil_pressure(connection) or 0
-
-    poll_timer = QTimer()
-    poll_timer.timeout.connect(update_all)
-    poll_timer.start(100)
+    # GPS + OBD SPEED -> fusion -> telemetry frame (connect ONCE)
+    fusion = SpeedFusion(rate_hz=20)
+    if gps is not None:
+        gps.speedUpdated.connect(fusion.updateGps)
+        gps.speedUpdated.connect(recorder.record_gps)
+    fusion.speedChanged.connect(telemetry.setSpeed)
+    fusion.sourceChanged.connect(telemetry.setSpeedSource)
+
+    def apply_snapshot(snapshot):
+        # Runs on the GUI thread; never touches the serial link
+        if snapshot.connected and "speed" in snapshot.fresh:
+            fusion.updateObd(snapshot.values["speed"])
+        telemetry.applySnapshot(snapshot)
+        if recorder is not None:
+            recorder.record_snapshot(snapshot)
+
+    # Clock ticks on its own so it keeps moving while the worker is reconnecting
+    clock_timer = QTimer()
+    clock_timer.timeout.connect(centerScreen.update_now)
+    clock_timer.start(1000)
+
+    # Frames that actually changed vs. skipped, once a minute
+    stats_timer = QTimer()
+    stats_timer.timeout.connect(lambda: print("[INFO]", UPDATE_STATS.summary()))
+    stats_timer.start(60000)
+
+    # OBD polling (or replay) lives on its own thread; snapshots arrive via a queued signal
+    if replaying:
+        worker = ReplayWorker(args.replay, args.speed)
+        worker.gpsSpeed.connect(fusion.updateGps, Qt.QueuedConnection)
+    else:
+        worker = AcquisitionWorker(obd_port, raw_channels=raw_channels)
+    worker.snapshotReady.connect(apply_snapshot, Qt.QueuedConnection)
+    app.aboutToQuit.connect(worker.stop)
+    if recorder is not None:
+        app.aboutToQuit.connect(recorder.close)     # copies the trip to the SD card
+    worker.start()
+
+    # shutdown_monitor.py powers off with `shutdown -h`, which SIGTERMs us; quit
+    # cleanly so the trip gets saved. The idle timer lets Python see the signal.
+    signal.signal(signal.SIGTERM, lambda *_: app.quit())
+    # `kill -USR1 <pid>` dumps per-command query stats
+    signal.signal(signal.SIGUSR1, lambda *_: print("[INFO] Query stats\n" + QUERY_STATS.table(), flush=True))
+    signal_timer = QTimer()
+    signal_timer.timeout.connect(lambda: None)
+    signal_timer.start(500)
 
     sys.exit(app.exec_())
@@ -68,7 +68,7 @@ Rectangle {
     //Labels {
     //    id: label1
     //    label: "Intake Pressure"
-    //    currValue: intakePressureLabel.currValue
+    //    currValue: telemetry.intakePressure
     //    unit: "kPa"
     //    fontSize: 18
     //    color: "white"
@@ -83,7 +83,7 @@ Rectangle {
     //Labels {
     //    id: label2
     //    label: "Intake Temp"
-    //    currValue: intakeTempLabel.currValue
+    //    currValue: telemetry.intakeTemp
     //    unit: "°F"
     //    fontSize: 18
     //    color: "white"
@@ -98,7 +98,7 @@ Rectangle {
     StringLabels {
         id: label3
         label: "Run Time"
-        currValue: runtimeLabel.currValue
+        currValue: telemetry.runTime
         fontSize: 18
         color: "white"
         borderColor: "#FF0000" // Example border color
@@ -112,7 +112,7 @@ Rectangle {
     //Labels {
     //    id: label4
     //    label: "Fuel Level"
-    //    currValue: fuelLevelLabel.currValue
+    //    currValue: telemetry.fuelLevel
     //    unit: "%"
     //    fontSize: 18
     //    color: "white"
@@ -127,7 +127,7 @@ Rectangle {
     //StringLabels {
     //    id: label5
     //    label: "Fuel Type"
-    //    currValue: fuelTypeLabel.currValue
+    //    currValue: telemetry.fuelType
     //    fontSize: 18
     //    color: "white"
     //    borderColor: "#FF0000" // Example border color
@@ -141,7 +141,7 @@ Rectangle {
     //Labels {
     //    id: label6
     //    label: "Engine Load"
-    //    currValue: engineLoadLabel.currValue
+    //    currValue: telemetry.engineLoad
     //    unit: "%"
     //    fontSize: 18
     //    color: "white"
@@ -156,7 +156,7 @@ Rectangle {
     //Labels {
     //    id: label7
     //    label: "Throttle Position"
-    //    currValue: throttlePosLabel.currValue
+    //    currValue: telemetry.throttlePos
     //    unit: "%"
     //    fontSize: 18
     //    color: "white"
@@ -171,7 +171,7 @@ Rectangle {
     //Labels {
     //    id: label8
     //    label: "Barometric Pres"
-    //    currValue: barometricPressureLabel.currValue
+    //    currValue: telemetry.baroPressure
     //    unit: "kPa"
     //    fontSize: 18
     //    color: "white"
@@ -185,16 +185,22 @@ Rectangle {
 
     Image {
         id: celIcon
-        source: checkEngine.mil ? "images/cel_on.png" : "images/cel_off.png"
+        source: telemetry.mil ? "images/cel_on.png" : "images/cel_off.png"
         anchors.horizontalCenter: parent.horizontalCenter
         anchors.top: label3.bottom
         anchors.topMargin: 100
         width: 48
         height: 48
+
+        // Long-press opens the hidden diagnostics page
+        MouseArea {
+            anchors.fill: parent
+            onPressAndHold: diagnostics.visible = true
+        }
     }
 
     Text {
-        text: checkEngine.dtcCount > 0 ? "(" + checkEngine.dtcCount + ")" : ""
+        text: telemetry.dtcCount > 0 ? "(" + telemetry.dtcCount + ")" : ""
         anchors.top: celIcon.bottom
         anchors.horizontalCenter: celIcon.horizontalCenter
         color: "red"
@@ -204,7 +210,7 @@ Rectangle {
     //Labels {
     //    id: label9
     //    label: "Throttle Accel"
-    //    currValue: throttleAcceleratorLabel.currValue
+    //    currValue: telemetry.accelPos
     //    unit: "%"
     //    fontSize: 18
     //    color: "white"
@@ -219,7 +225,7 @@ Rectangle {
     //Labels {
     //    id: label10
     //    label: "Absolute Load"
-    //    currValue: absoluteLoadLabel.currValue
+    //    currValue: telemetry.absoluteLoad
     //    unit: "%"
     //    fontSize: 18
     //    color: "white"
@@ -234,7 +240,8 @@ Rectangle {
     Labels {
         id: label11
         label: "Oil Pressure"
-        currValue: oilPressureLabel.currValue
+        currValue: telemetry.oilPressure
+        opacity: telemetry.oilPressureStale ? 0.4 : 1.0     // holding an old value
         unit: "psi"
         fontSize: 18
         color: "white"
@@ -250,7 +257,8 @@ Rectangle {
     BarMeter {
         id: temperatureBar
 
-        mainValue: temperature.currValue
+        mainValue: telemetry.coolantTemp
+        opacity: telemetry.coolantTempStale ? 0.4 : 1.0
         maxValue: 200
 
         label_name: "Temperature(Coolant)"
@@ -268,7 +276,8 @@ Rectangle {
     BarMeter {
         id: fualBar
 
-        mainValue: fuelLevelLabel.currValue
+        mainValue: telemetry.fuelLevel
+        opacity: telemetry.fuelLevelStale ? 0.4 : 1.0
         maxValue: 100
 
         label_name: "Fuel"
@@ -318,4 +327,27 @@ Rectangle {
     }
     
 
+
+    // Hidden diagnostics page: per-command query latency / outcome table
+    Rectangle {
+        anchors.fill: parent
+        color: "#E6000000"
+        visible: diagnostics.visible
+        z: 100
+
+        Text {
+            anchors.fill: parent
+            anchors.margins: 20
+            text: diagnostics.table
+            color: "#00FF00"
+            font.family: "monospace"
+            font.pixelSize: 14
+        }
+
+        // Tap anywhere to close
+        MouseArea {
+            anchors.fill: parent
+            onClicked: diagnostics.visible = false
+        }
+    }
 }
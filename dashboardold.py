@@ -293,7 +293,7 @@ if __name__ == "__main__":
             barometricPressureLabel.currValue = py_obd.get_intake_pressure(connection) or 0
             intakeTempLabel.currValue = py_obd.get_intake_temp(connection) or 0
             absoluteLoadLabel.currValue = py_obd.get_absolute_load(connection) or 0
-            oilPressureLabel.currValue = py_obd.get_oil_pressure(connection) or 0
+            oilPressureLabel.currValue = py_obd.get_enhanced(connection, "oil_pressure") or 0
 
         else:
             # Reset values if disconnected
@@ -0,0 +1,135 @@
+"""
+dashlog.py - Buffered, rate-limited log file writer
+
+write() only appends (time, message) to an in-memory ring buffer under a lock,
+so it is safe and cheap to call from the poll loop. A background thread wakes
+every flush_interval seconds and writes everything queued in one go.
+
+- A line identical end to end to one seen within dedupe_window seconds is
+  only counted; when the window closes a single "(repeated N times)" line is
+  written. Lines that differ anywhere, e.g. in a bitmap or value at the end,
+  are all kept, so each logged line has to carry its own context (which
+  command it is about) rather than lean on the line before it.
+- If the buffer fills between flushes the oldest lines are dropped (and counted).
+- When the file would grow past max_bytes it is rotated to <path>.1, so the log
+  can never fill /tmp (tmpfs on the Pi).
+"""
+
+import atexit
+import collections
+import os
+import threading
+import time
+from typing import Callable
+
+
+class BufferedLog:
+    def __init__(self, path: str, max_bytes: int = 1_000_000, capacity: int = 2000,
+                 flush_interval: float = 1.0, dedupe_window: float = 60.0,
+                 clock: Callable[[], float] = time.time):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.dedupe_window = dedupe_window
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buffer = collections.deque(maxlen=capacity)
+        self._seen = {}             # whole line -> [first seen, repeats since]
+        self._dropped = 0
+        self._wake = threading.Event()
+        self._thread = None
+        self._closed = False
+
+    MAX_TRACKED = 512   # distinct messages remembered for dedupe
+
+    def write(self, msg: str) -> None:
+        """Queue one line. Never blocks on I/O and never raises."""
+        now = self._clock()
+        msg = msg.rstrip()      # as written, so lines that look the same are the same
+        with self._lock:
+            entry = self._seen.get(msg)
+            if entry is not None and now - entry[0] < self.dedupe_window:
+                entry[1] += 1
+                return
+            if entry is not None and entry[1]:
+                self._queue_repeats(msg, entry[1], now)
+            self._seen[msg] = [now, 0]
+            self._queue(now, msg)
+            if self._thread is None and not self._closed:
+                self._start()
+
+    def _queue(self, t: float, line: str) -> None:
+        if len(self._buffer) == self._buffer.maxlen:
+            self._dropped += 1
+        self._buffer.append((t, line))
+
+    def _queue_repeats(self, msg: str, count: int, now: float) -> None:
+        self._queue(now, f"{msg.rstrip()}  (repeated {count} times)")
+
+    def _expire_seen(self, now: float) -> None:
+        """Close finished dedupe windows, writing their repeat counts."""
+        expired = [m for m, (first, _) in self._seen.items() if now - first >= self.dedupe_window]
+        if len(self._seen) - len(expired) > self.MAX_TRACKED:
+            expired = list(self._seen)
+        for msg in expired:
+            count = self._seen.pop(msg)[1]
+            if count:
+                self._queue_repeats(msg, count, now)
+
+    def _start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="dashlog", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        """Write everything queued so far in a single append."""
+        with self._lock:
+            self._expire_seen(self._clock())
+            if not self._buffer and not self._dropped:
+                return
+            lines = list(self._buffer)
+            self._buffer.clear()
+            dropped, self._dropped = self._dropped, 0
+
+        text = "".join(
+            f"{time.strftime('%H:%M:%S', time.localtime(t))} {line.rstrip()}\n" for t, line in lines)
+        if dropped:
+            text += f"[WARN] Log buffer full, dropped {dropped} lines\n"
+        data = text.encode("utf-8", errors="replace")
+        try:
+            self._rotate_if_needed(len(data))
+            with open(self.path, "ab") as f:
+                f.write(data)
+        except Exception:
+            # Never let logging crash the dash
+            pass
+
+    def _rotate_if_needed(self, incoming: int) -> None:
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return
+        if size + incoming > self.max_bytes:
+            os.replace(self.path, self.path + ".1")
+
+    def close(self) -> None:
+        """Flush pending repeat counts and lines, then stop the flusher."""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2)
+        with self._lock:
+            now = self._clock()
+            for msg, (_, count) in self._seen.items():
+                if count:
+                    self._queue_repeats(msg, count, now)
+            self._seen.clear()
+        self.flush()
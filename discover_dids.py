@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+discover_dids.py - Work out what scanned Mode 22 DIDs mean
+
+  python3 discover_dids.py sample --duration 300 -o drive.npz     # while driving
+  python3 discover_dids.py analyze drive.npz
+  python3 discover_dids.py analyze obd-debug.log                  # ELM transcript (see replay.py)
+
+sample polls every DID mode22_db has a positive reply for (switching
+modules with ATSH) in rounds, together with a few Mode 01 reference
+channels in their native units, and saves the rounds to an .npz.
+
+analyze lines up the DID payloads with the references (sample-and-hold,
+rows where either side is older than HOLD seconds are left out) and, for
+every payload byte A, B, ... and every big-endian 16-bit pair A*256+B,
+computes the correlation and least-squares line against every reference in
+one go (pairwise-complete sums as matrix products). Strong fits come out as
+decoder proposals, the right-hand side ready for an enhanced_pids.json "value":
+
+  221940 (pcm) A         coolant_c  r=+1.000  coolant_c = A*1 - 40
+"""
+
+import argparse
+import signal
+import sys
+import time
+
+import numpy as np
+
+import elm_raw
+import gm_modules
+import mode22_db
+import replay
+import scan_mode22_range
+
+# Mode 01 reference channels, native units (the fit coefficients come out in these)
+REFERENCES = {
+    "rpm": elm_raw.RawPid("RPM", "010C", 2, lambda d: (d[0] * 256 + d[1]) / 4.0),
+    "speed_kph": elm_raw.RawPid("SPEED", "010D", 1, lambda d: float(d[0])),
+    "coolant_c": elm_raw.RawPid("COOLANT_TEMP", "0105", 1, lambda d: float(d[0] - 40)),
+    "map_kpa": elm_raw.RawPid("INTAKE_PRESSURE", "010B", 1, lambda d: float(d[0])),
+    "throttle_pct": elm_raw.RawPid("THROTTLE_POS", "0111", 1, lambda d: d[0] * 100.0 / 255.0),
+}
+REF_BY_REQUEST = {pid.request.decode().strip(): name for name, pid in REFERENCES.items()}
+
+HOLD = 1.0          # s a sample stays valid for lining up with the other side
+MIN_ROWS = 20
+MIN_R = 0.9
+
+
+class Session:
+    """Rows in time: reference values and DID payload bytes (NaN where missing or stale)."""
+
+    def __init__(self, t: np.ndarray, refs: dict[str, np.ndarray], dids: dict[str, np.ndarray]):
+        self.t = t
+        self.refs = refs        # name -> (rows,)
+        self.dids = dids        # "target:DID" -> (rows, payload bytes)
+
+    def save(self, path: str) -> None:
+        arrays = {"t": self.t}
+        arrays.update({f"ref.{k}": v for k, v in self.refs.items()})
+        arrays.update({f"did.{k}": v for k, v in self.dids.items()})
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "Session":
+        with np.load(path) as z:
+            refs = {k[4:]: z[k] for k in z.files if k.startswith("ref.")}
+            dids = {k[4:]: z[k] for k in z.files if k.startswith("did.")}
+            return cls(z["t"], refs, dids)
+
+
+def reference_value(pid: elm_raw.RawPid, text: str):
+    """First reply to a reference request, decoded; None if nothing usable came back."""
+    for _, data in mode22_db.frames(text):
+        if data.startswith(pid.reply) and len(data) >= len(pid.reply) + pid.size:
+            return pid.decode(data[len(pid.reply):len(pid.reply) + pid.size])
+    return None
+
+
+def _held(events: list[tuple[float, object]], t: np.ndarray, width: int = 0) -> np.ndarray:
+    """Sample-and-hold (time, value) events onto row times; NaN before the first or after HOLD."""
+    out = np.full((len(t), width) if width else len(t), np.nan, dtype=np.float64)
+    if not events:
+        return out
+    times = np.array([e[0] for e in events])
+    idx = np.searchsorted(times, t, side="right") - 1
+    ok = (idx >= 0) & (t - times[np.maximum(idx, 0)] <= HOLD)
+    if width:
+        values = np.full((len(events), width), np.nan)
+        for i, (_, payload) in enumerate(events):
+            values[i, :len(payload)] = list(payload[:width])
+    else:
+        values = np.array([e[1] for e in events], dtype=np.float64)
+    out[ok] = values[idx[ok]]
+    return out
+
+
+def session_from_events(ref_events: dict[str, list], did_events: dict[str, list], t=None) -> Session:
+    """Rows at times `t` (default: every DID reply), everything held from its last sample."""
+    if t is None:
+        t = np.array(sorted({e[0] for events in did_events.values() for e in events}))
+    refs = {name: _held(events, t) for name, events in ref_events.items()}
+    dids = {key: _held(events, t, max(len(p) for _, p in events)) for key, events in did_events.items() if events}
+    return Session(t, refs, dids)
+
+
+def transcript_session(path: str) -> Session:
+    """Mode 01 reference and Mode 22 replies out of an ELM transcript (functional header)."""
+    ref_events: dict[str, list] = {name: [] for name in REFERENCES}
+    did_events: dict[str, list] = {}
+    with open(path, "r", errors="ignore") as f:
+        for i, (t, request, response) in enumerate(replay._exchanges(f)):
+            request = request.replace(" ", "").upper()
+            t = i / replay.TRANSCRIPT_RATE if t is None else t
+            text = "\n".join(response)
+            if request in REF_BY_REQUEST:
+                name = REF_BY_REQUEST[request]
+                value = reference_value(REFERENCES[name], text)
+                if value is not None:
+                    ref_events[name].append((t, value))
+            elif request.startswith("22") and len(request) == 6:
+                reply = mode22_db.parse_reply(int(request[2:], 16), text)
+                if reply.status == mode22_db.POSITIVE and reply.payload:
+                    did_events.setdefault(f":{request[2:]}", []).append((t, reply.payload))
+    if not did_events:
+        raise ValueError(f"no Mode 22 replies in {path}")
+    return session_from_events(ref_events, did_events)
+
+
+def features(session: Session) -> tuple[list[tuple[str, str]], np.ndarray]:
+    """Candidate raw values per DID: each byte A, B, ... and each 16-bit pair A*256+B, ..."""
+    names, columns = [], []
+    for key, payload in sorted(session.dids.items()):
+        letters = [chr(ord("A") + i) for i in range(payload.shape[1])]
+        for i, letter in enumerate(letters):
+            names.append((key, letter))
+            columns.append(payload[:, i])
+        for i in range(payload.shape[1] - 1):
+            names.append((key, f"({letters[i]}*256+{letters[i + 1]})"))
+            columns.append(payload[:, i] * 256 + payload[:, i + 1])
+    return names, np.column_stack(columns) if columns else np.empty((len(session.t), 0))
+
+
+def fit_all(x: np.ndarray, y: np.ndarray) -> dict[str, np.ndarray]:
+    """
+    Correlation and least-squares line y = slope*x + intercept for every
+    column pair of x (rows, F) and y (rows, R), each pair over the rows where
+    both are present. Returns (F, R) arrays: n, r, slope, intercept, rms.
+    """
+    mx, my = ~np.isnan(x), ~np.isnan(y)
+    x0, y0 = np.where(mx, x, 0.0), np.where(my, y, 0.0)
+    mxf, myf = mx.astype(np.float64), my.astype(np.float64)
+    n = mxf.T @ myf
+    sx, sy = x0.T @ myf, mxf.T @ y0
+    sxx, syy, sxy = (x0 ** 2).T @ myf, mxf.T @ (y0 ** 2), x0.T @ y0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sxy / n - sx * sy / n ** 2
+        var_x = sxx / n - (sx / n) ** 2
+        var_y = syy / n - (sy / n) ** 2
+        slope = cov / var_x
+        intercept = sy / n - slope * sx / n
+        r = cov / np.sqrt(var_x * var_y)
+        # Residual of the line: var_y * (1 - r^2)
+        rms = np.sqrt(np.maximum(var_y * (1 - r ** 2), 0.0))
+    constant = var_x <= 1e-12
+    r[constant] = np.nan
+    return {"n": n, "r": r, "slope": slope, "intercept": intercept, "rms": rms}
+
+
+def _nice(v: float) -> str:
+    return f"{v:.4g}"
+
+
+def proposals(session: Session, min_r: float = MIN_R) -> list[dict]:
+    names, x = features(session)
+    ref_names = sorted(session.refs)
+    if not names or not ref_names:
+        return []
+    y = np.column_stack([session.refs[k] for k in ref_names])
+    fits = fit_all(x, y)
+    score = np.where((fits["n"] >= MIN_ROWS) & ~np.isnan(fits["r"]), np.abs(fits["r"]), -1.0)
+    best = np.argmax(score, axis=1)
+    out = []
+    for i, (key, raw) in enumerate(names):
+        j = best[i]
+        if score[i, j] < min_r:
+            continue
+        target, did = key.split(":")
+        slope, intercept = fits["slope"][i, j], fits["intercept"][i, j]
+        sign = "-" if intercept < 0 else "+"
+        out.append({
+            "did": did, "module": gm_modules.module_name(target), "raw": raw, "reference": ref_names[j],
+            "r": float(fits["r"][i, j]), "n": int(fits["n"][i, j]), "slope": float(slope),
+            "intercept": float(intercept), "rms": float(fits["rms"][i, j]),
+            "formula": f"{ref_names[j]} = {raw}*{_nice(slope)} {sign} {_nice(abs(intercept))}",
+        })
+    # Grouped by DID, strongest fit first within each; a byte and the pair it starts often both fit, keep both
+    return sorted(out, key=lambda p: (p["did"], -abs(p["r"])))
+
+
+def print_proposals(session: Session, min_r: float) -> None:
+    rows = len(session.t)
+    span = session.t[-1] - session.t[0] if rows else 0.0
+    print(f"{rows} rows over {span:.0f} s, {len(session.dids)} DIDs, references: {', '.join(sorted(session.refs))}")
+    found = proposals(session, min_r)
+    if not found:
+        print(f"[INFO] No fits with |r| >= {min_r}; sample longer or over a wider range of conditions")
+        return
+    for p in found:
+        print(f"  22{p['did']} ({p['module']}) {p['raw']:<10} {p['reference']:<13} r={p['r']:+.3f} "
+              f"n={p['n']:<5} rms={p['rms']:.3g}  {p['formula']}")
+
+
+# ---- live sampling ----
+
+def sample(scanner: scan_mode22_range.Scanner, duration: float) -> Session:
+    """Poll references and every recorded hit DID in rounds until `duration` (or Ctrl-C)."""
+    scanner.open()
+    by_target: dict[str, list[int]] = {}
+    for row in scanner.db.rows(scanner.vehicle):
+        by_target.setdefault(row["target"], []).append(row["did"])
+    if not by_target:
+        raise ValueError(f"no Mode 22 hits recorded for {scanner.vehicle}; run scan_mode22_range.py first")
+    # References go to the PCM (its physical header if we know it) first in every round
+    pcm = dict(scanner.targets).get("pcm", "")
+    order = [pcm] + [t for t in sorted(by_target) if t != pcm]
+    # '' (the default header) has to be sent as the protocol's power-on header after a physical one
+    default = gm_modules.DEFAULT_HEADERS.get(scanner.protocol)
+    if "" in order and len(order) > 1 and default is None:
+        physical = ", ".join(gm_modules.module_name(t) for t in order if t)
+        raise ValueError(f"the default header can't be restored on protocol {scanner.protocol}, so the "
+                         f"references and functional DIDs can't be sampled next to {physical}")
+    slowest = 0.0
+    for target in order:
+        scanner.select(gm_modules.module_name(target), target)
+        slowest = max(slowest, scanner.timeout)
+    scanner.set_timeout(slowest, force=True)    # one ATST has to suit every module
+
+    ref_events: dict[str, list] = {name: [] for name in REFERENCES}
+    did_events: dict[str, list] = {}
+    current = None      # the select() calls above leave the last physical header set
+    started = time.monotonic()
+    rounds = []
+    try:
+        while time.monotonic() - started < duration:
+            for target in order:
+                if target != current:
+                    if target or default:
+                        scan_mode22_range.cmd(scanner.ser, f"ATSH{target or default}")
+                    current = target
+                if target == pcm:
+                    for name, pid in REFERENCES.items():
+                        text, _ = scan_mode22_range.cmd(scanner.ser, pid.request.decode().strip(), 2.0)
+                        value = reference_value(pid, text)
+                        if value is not None:
+                            ref_events[name].append((time.monotonic(), value))
+                for did in by_target.get(target, []):
+                    text, _ = scan_mode22_range.cmd(scanner.ser, f"22{did:04X}", 2.0)
+                    reply = mode22_db.parse_reply(did, text)
+                    if reply.status == mode22_db.POSITIVE:
+                        did_events.setdefault(f"{target}:{did:04X}", []).append((time.monotonic(), reply.payload))
+            rounds.append(time.monotonic())
+            if len(rounds) % 20 == 0:
+                print(f"[INFO] {len(rounds)} rounds, {time.monotonic() - started:.0f} s")
+    except KeyboardInterrupt:
+        print("\n[INFO] Stopped")
+    if not did_events:
+        raise ValueError("no DID answered while sampling")
+    return session_from_events(ref_events, did_events, np.array(rounds))
+
+
+def cmd_sample(args) -> None:
+    db = mode22_db.ScanDB(args.db)
+    scanner = scan_mode22_range.Scanner(args.port, args.baud, [], db, args.vehicle)
+
+    def interrupt(*_):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, interrupt)    # stop sampling but still save and analyze
+    try:
+        session = sample(scanner, args.duration)
+    finally:
+        scanner.close()
+        db.close()
+    session.save(args.output)
+    print(f"[INFO] Saved {len(session.t)} rows to {args.output}")
+    print_proposals(session, args.min_r)
+
+
+def cmd_analyze(args) -> None:
+    session = Session.load(args.session) if args.session.endswith(".npz") else transcript_session(args.session)
+    print_proposals(session, args.min_r)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--min-r", type=float, default=MIN_R, help="weakest |correlation| worth proposing")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("sample", help="poll hit DIDs and references, then analyze")
+    p.add_argument("--port", default=scan_mode22_range.PORT)
+    p.add_argument("--baud", type=int, default=scan_mode22_range.BAUD)
+    p.add_argument("--db", default=mode22_db.DB_PATH)
+    p.add_argument("--vehicle", help="default: the VIN")
+    p.add_argument("--duration", type=float, default=300.0, help="seconds to sample (Ctrl-C stops early)")
+    p.add_argument("-o", "--output", default="discovery.npz")
+    p.set_defaults(func=cmd_sample)
+
+    p = sub.add_parser("analyze", help="fit a saved session or an ELM transcript")
+    p.add_argument("session", help=".npz from sample, or an ELM transcript")
+    p.set_defaults(func=cmd_analyze)
+
+    args = ap.parse_args()
+    try:
+        args.func(args)
+    except (ValueError, OSError) as e:
+        sys.exit(f"[ERROR] {e}")
+
+
+if __name__ == "__main__":
+    main()
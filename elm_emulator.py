@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+elm_emulator.py - Simulated ELM327 + truck on a pseudo-terminal
+
+  python3 elm_emulator.py --profile vpw --link /tmp/rfcomm-sim
+  python3 dashboard.py ...            # with the OBD port pointed at /tmp/rfcomm-sim
+  python3 scan_mode22_range.py --port /tmp/rfcomm-sim
+
+Answers the AT commands py_obd / python-OBD and the Mode 22 scanners send
+(ATZ ATI ATE ATL ATS ATH ATSH ATSP ATDP ATDPN ATST ATAT ATRV ...), plus Mode 01
+(with multi-PID requests on CAN), Mode 06 (CAN), Mode 09 VIN and GM Mode 22
+enhanced PIDs from a small simulated engine.
+
+Mode 22 requests with the default (functional) header are answered by the
+PCM only; ATSH to a module's physical address reaches the TCM and BCM too
+(VPW 6C 10/18/40 F1, CAN 7E0/7E1), each with its own DIDs.
+
+Profiles set the framing and timing: "vpw" is a 2000s GM truck on SAE J1850
+VPW (10.4 kbit/s, no multi-PID, no Mode 06), "can" is ISO 15765-4 CAN
+11-bit/500k. Per-PID latency can be overridden with --latency 010C=0.08.
+Requests nothing answers take the ATST timeout, like the real adapter.
+
+Send SIGUSR1 to the emulator to toggle the ignition (ECU goes silent while
+the adapter keeps answering AT commands) for reconnect testing.
+"""
+
+import argparse
+import math
+import os
+import select
+import signal
+import time
+import tty
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from gm_modules import DEFAULT_HEADERS, j1850_crc
+
+ELM_VERSION = "ELM327 v1.5"
+VIN = "1GCEK19T45E000001"
+
+
+@dataclass
+class Profile:
+    protocol: str                   # ATDPN digit
+    description: str                # ATDP text
+    latency: float                  # s per answered request
+    search_time: float              # s for the first request after ATSP0
+    multi_pid: bool
+    mode06: bool
+    per_pid: dict[str, float] = field(default_factory=dict)
+
+
+PROFILES = {
+    "vpw": Profile("2", "SAE J1850 VPW", 0.065, 2.5, False, False,
+                   {"0902": 0.35, "22115C": 0.09}),
+    "can": Profile("6", "ISO 15765-4 (CAN 11/500)", 0.018, 0.8, True, True,
+                   {"0902": 0.05}),
+}
+
+
+class Engine:
+    """A truck going round a loop: idle, pull to ~4500 rpm, cruise, repeat."""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._start = clock()
+
+    def t(self) -> float:
+        return self._clock() - self._start
+
+    def rpm(self) -> float:
+        phase = self.t() % 60
+        if phase < 10:
+            return 700 + 20 * math.sin(phase * 3)
+        if phase < 25:
+            return 700 + 3800 * (phase - 10) / 15
+        return 1800 + 300 * math.sin(phase / 3)
+
+    def speed_kph(self) -> float:
+        phase = self.t() % 60
+        return 0.0 if phase < 10 else min(110.0, self.rpm() / 40)
+
+    def throttle(self) -> float:
+        phase = self.t() % 60
+        return 14.0 if phase < 10 else (85.0 if phase < 25 else 22.0)
+
+    def coolant_c(self) -> float:
+        return min(92.0, 20 + self.t() * 0.5)
+
+    def oil_psi(self) -> float:
+        return 10 + self.rpm() / 100
+
+    def pids(self) -> dict[int, bytes]:
+        """Mode 01 PID -> raw data bytes."""
+        rpm = int(self.rpm() * 4)
+        load = int(self.throttle() * 2.2)
+        return {
+            0x01: bytes([0x00, 0x07, 0x65, 0x00]),                        # MIL off, 0 DTCs
+            0x04: bytes([min(255, load)]),
+            0x05: bytes([int(self.coolant_c()) + 40]),
+            0x0B: bytes([min(255, 30 + load // 3)]),                      # MAP kPa
+            0x0C: bytes([rpm >> 8, rpm & 0xFF]),
+            0x0D: bytes([int(self.speed_kph())]),
+            0x0F: bytes([35 + 40]),                                       # IAT 35 °C
+            0x11: bytes([int(self.throttle() * 255 / 100)]),
+            0x1F: bytes([int(self.t()) >> 8 & 0xFF, int(self.t()) & 0xFF]),
+            0x2F: bytes([int(0.62 * 255)]),
+            0x33: bytes([99]),
+            0x42: bytes([0x37, 0x1C]),                                    # 14.1 V
+            0x43: bytes([0x00, min(255, load)]),
+            0x49: bytes([int(self.throttle() * 255 / 100)]),
+            0x51: bytes([0x01]),                                          # gasoline
+        }
+
+    def gear(self) -> int:
+        return 0 if self.speed_kph() == 0 else min(4, 1 + int(self.speed_kph() / 30))
+
+    def mode22(self, module: str = "pcm") -> dict[int, bytes]:
+        """GM enhanced DID -> raw data bytes for one module."""
+        if module == "tcm":
+            out_rpm = int(self.speed_kph() * 30)
+            return {
+                0x1941: bytes([self.gear()]),
+                0x1A01: bytes([out_rpm >> 8 & 0xFF, out_rpm & 0xFF]),        # output shaft rpm
+            }
+        if module == "bcm":
+            return {
+                0x1A02: bytes([int(0.62 * 255)]),                           # fuel sender
+                0x1A03: bytes([int(self.coolant_c() / 4) + 40]),            # interior temp
+            }
+        return {
+            0x115C: bytes([max(0, min(255, int((self.oil_psi() + 17.5) / 0.65)))]),
+            0x1940: bytes([int(self.coolant_c() - 10) + 40]),            # trans temp
+            0x11A6: bytes([0x3A, 0x98]),
+        }
+
+    # Mode 06 test results: MID -> [(TID, unit/scaling id, value, min, max)]
+    MODE06 = {
+        0x01: [(0x01, 0x0A, 0x0300, 0x0000, 0x0400)],
+        0x21: [(0x80, 0x24, 0x0010, 0x0000, 0x0100)],
+    }
+
+
+# Physical addressing: VPW node address -> module, CAN request id -> (module, reply id)
+VPW_NODES = {0x10: "pcm", 0x18: "tcm", 0x40: "bcm"}
+CAN_IDS = {0x7E0: ("pcm", 0x7E8), 0x7E1: ("tcm", 0x7E9)}
+
+
+def supported_bitmap(base: int, pids) -> bytes:
+    """The 4-byte PIDS_x answer for PIDs base+1 .. base+32 (plus the next-range bit)."""
+    bits = 0
+    for pid in pids:
+        if base < pid <= base + 32:
+            bits |= 1 << (32 - (pid - base))
+    if any(pid > base + 32 for pid in pids):
+        bits |= 1
+    return bits.to_bytes(4, "big")
+
+
+class ElmEmulator:
+    def __init__(self, profile: Profile, engine: Optional[Engine] = None,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.profile = profile
+        self.engine = engine or Engine()
+        self._sleep = sleep
+        self.ignition = True
+        self.requests = 0
+        self.reset()
+
+    def reset(self) -> None:
+        self.echo = True
+        self.linefeeds = False
+        self.spaces = True
+        self.headers = False
+        self.protocol = "0"                 # auto
+        self.searched = False
+        self.timeout = 0x32 * 0.004         # ATST default 200 ms
+        self.adaptive = 1
+        self.header = ""                    # ATSH; empty = default functional header
+        self._last = ""
+
+    # ---- framing ----
+
+    def _hex(self, data: bytes) -> str:
+        return (" " if self.spaces else "").join(f"{b:02X}" for b in data)
+
+    def _target(self) -> tuple[Optional[str], int]:
+        """(module the current header reaches, its reply address); None if nothing is there."""
+        vpw = self.profile.protocol != "6"
+        if not self.header or self.header == DEFAULT_HEADERS.get(self.profile.protocol):
+            return "pcm", 0x10 if vpw else 0x7E8
+        if vpw:
+            node = int(self.header[2:4], 16) if len(self.header) == 6 else None
+            return VPW_NODES.get(node), node or 0
+        module, reply = CAN_IDS.get(int(self.header, 16), (None, 0))
+        return module, reply
+
+    def _frames(self, payload: bytes, source: Optional[int] = None) -> list[str]:
+        """One ECU reply, formatted the way the adapter prints it."""
+        if self.profile.protocol != "6":
+            if not self.headers:
+                return [self._hex(payload)]
+            head = bytes([0x48, 0x6B, source or 0x10]) + payload
+            return [self._hex(head + bytes([j1850_crc(head)]))]
+
+        sep = " " if self.spaces else ""
+        can_id = f"{source or 0x7E8:03X}"
+        if len(payload) <= 7:
+            if not self.headers:
+                return [self._hex(payload)]
+            return [can_id + sep + self._hex(bytes([len(payload)]) + payload)]
+
+        # ISO-TP: first frame carries 6 bytes, consecutive frames 7
+        chunks = [payload[:6]] + [payload[i:i + 7] for i in range(6, len(payload), 7)]
+        if not self.headers:
+            return [f"{len(payload):03X}"] + [f"{i}:{sep}{self._hex(c)}" for i, c in enumerate(chunks)]
+        lines = [can_id + sep + self._hex(bytes([0x10 | len(payload) >> 8, len(payload) & 0xFF]) + chunks[0])]
+        for i, c in enumerate(chunks[1:], 1):
+            lines.append(can_id + sep + self._hex(bytes([0x20 | i & 0x0F]) + c))
+        return lines
+
+    # ---- commands ----
+
+    def handle(self, line: str) -> list[str]:
+        """One command line (without CR) -> response lines (prompt not included)."""
+        cmd = line.replace(" ", "").upper()
+        if not cmd:
+            cmd = self._last
+        self._last = cmd
+        if cmd.startswith("AT"):
+            return self._at(cmd[2:])
+        if not cmd or any(c not in "0123456789ABCDEF" for c in cmd):
+            return ["?"]
+        return self._obd(cmd)
+
+    def _at(self, a: str) -> list[str]:
+        if a in ("Z", "WS"):
+            self.reset()
+            self._sleep(0.5 if a == "Z" else 0.1)
+            return ["", ELM_VERSION]
+        if a == "I":
+            return [ELM_VERSION]
+        if a == "@1":
+            return ["OBDII to RS232 Interpreter"]
+        if a == "RV":
+            return ["14.1V" if self.ignition else "12.4V"]
+        if a == "D":
+            self.reset()
+            return ["OK"]
+        flags = {"E": "echo", "L": "linefeeds", "S": "spaces", "H": "headers"}
+        if len(a) == 2 and a[0] in flags and a[1] in "01":
+            setattr(self, flags[a[0]], a[1] == "1")
+            return ["OK"]
+        if a.startswith("SP") or a.startswith("TP"):
+            p = a[2:].lstrip("A") or "0"
+            self.protocol = p
+            self.searched = p == self.profile.protocol
+            return ["OK"]
+        if a == "DP":
+            auto = "AUTO, " if self.protocol == "0" else ""
+            return [auto + self.profile.description]
+        if a == "DPN":
+            return [("A" if self.protocol == "0" else "") + self.profile.protocol]
+        if a.startswith("SH"):
+            h = a[2:]
+            if len(h) not in (3, 6) or any(c not in "0123456789ABCDEF" for c in h):
+                return ["?"]
+            self.header = h
+            return ["OK"]
+        if a.startswith("ST") and len(a) == 4:
+            try:
+                n = int(a[2:], 16)
+            except ValueError:
+                return ["?"]
+            # ST00 restores the default
+            self.timeout = (n or 0x32) * 0.004
+            return ["OK"]
+        if a.startswith("AT") and a[2:] in ("0", "1", "2"):
+            self.adaptive = int(a[2:])
+            return ["OK"]
+        if a in ("M0", "M1", "CAF0", "CAF1", "AL", "NL", "PC", "BI", "CFC0", "CFC1", "R0", "R1"):
+            return ["OK"]
+        return ["?"]
+
+    def _wrong_protocol(self) -> bool:
+        return self.protocol not in ("0", self.profile.protocol)
+
+    def _obd(self, cmd: str) -> list[str]:
+        self.requests += 1
+        out = []
+        if self._wrong_protocol():
+            self._sleep(self.timeout * 5)
+            return ["BUS INIT: ...ERROR" if self.profile.protocol != "6" else "UNABLE TO CONNECT"]
+        if not self.searched:
+            out.append("SEARCHING...")
+            self._sleep(self.profile.search_time)
+            if not self.ignition:
+                return out + ["UNABLE TO CONNECT"]
+            self.searched = True
+        if not self.ignition:
+            self._sleep(self.timeout)
+            return ["NO DATA"]
+
+        module, source = self._target()
+        replies = self._answer(cmd, module) if module else []
+        if not replies:
+            self._sleep(self.timeout)
+            return out + ["NO DATA"]
+        self._sleep(self.profile.per_pid.get(cmd, self.profile.latency))
+        for payload in replies:
+            out.extend(self._frames(payload, source))
+        return out
+
+    def _answer(self, cmd: str, module: str = "pcm") -> list[bytes]:
+        """Payloads (service byte onwards) for one request; empty means no ECU answered."""
+        mode = cmd[:2]
+        data = bytes.fromhex(cmd[2:] if len(cmd) % 2 == 0 else cmd[2:-1])   # odd: python-OBD response count
+        if module != "pcm" and mode != "22":
+            return []       # only the PCM does the emissions services here
+        if mode == "01" and data:
+            pids = self.engine.pids()
+            if len(data) > 1 and not self.profile.multi_pid:
+                return []
+            reply = bytearray([0x41])
+            for pid in data[:6]:
+                if pid % 0x20 == 0:
+                    value = supported_bitmap(pid, pids)
+                elif pid in pids:
+                    value = pids[pid]
+                else:
+                    continue
+                reply += bytes([pid]) + value
+            return [bytes(reply)] if len(reply) > 1 else []
+        if mode == "06" and len(data) == 1 and self.profile.mode06:
+            mid = data[0]
+            if mid % 0x20 == 0:
+                return [bytes([0x46, mid]) + supported_bitmap(mid, Engine.MODE06)]
+            tests = Engine.MODE06.get(mid)
+            if not tests:
+                return []
+            reply = bytearray([0x46])
+            for tid, unit, value, lo, hi in tests:
+                reply += bytes([mid, tid, unit]) + b"".join(v.to_bytes(2, "big") for v in (value, lo, hi))
+            return [bytes(reply)]
+        if mode == "09" and data == b"\x02":
+            if self.profile.protocol == "6":
+                return [b"\x49\x02\x01" + VIN.encode()]
+            # VPW: five numbered 4-byte chunks, first padded with three zeros
+            vin = b"\x00\x00\x00" + VIN.encode()
+            return [bytes([0x49, 0x02, i + 1]) + vin[i * 4:i * 4 + 4] for i in range(5)]
+        if mode == "22" and len(data) == 2:
+            did = int.from_bytes(data, "big")
+            value = self.engine.mode22(module).get(did)
+            if value is None:
+                # CAN ECUs say "request out of range"; VPW just stays quiet
+                return [bytes([0x7F, 0x22, 0x31])] if self.profile.protocol == "6" else []
+            return [bytes([0x62]) + data + value]
+        return []
+
+    # ---- serial side ----
+
+    def respond(self, line: str) -> bytes:
+        eol = "\r\n" if self.linefeeds else "\r"
+        text = (line + eol) if self.echo else ""
+        text += "".join(reply + eol for reply in self.handle(line)) + eol + ">"
+        return text.encode()
+
+
+def serve(emu: ElmEmulator, link: Optional[str] = None) -> None:
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    path = os.ttyname(slave)
+    if link:
+        if os.path.islink(link):
+            os.remove(link)
+        os.symlink(path, link)
+    print(f"[INFO] {ELM_VERSION} emulator ({emu.profile.description}) on {link or path}")
+
+    def toggle_ignition(*_):
+        emu.ignition = not emu.ignition
+        emu.searched = emu.protocol == emu.profile.protocol
+        print("[INFO] Ignition", "on" if emu.ignition else "off")
+    signal.signal(signal.SIGUSR1, toggle_ignition)
+
+    buf = b""
+    try:
+        while True:
+            try:
+                ready, _, _ = select.select([master], [], [], 1.0)
+            except InterruptedError:
+                continue
+            if not ready:
+                continue
+            try:
+                chunk = os.read(master, 1024)
+            except OSError:
+                continue
+            buf += chunk
+            while b"\r" in buf:
+                raw, buf = buf.split(b"\r", 1)
+                line = raw.decode("ascii", errors="ignore").strip("\n\x00\x7f ")
+                os.write(master, emu.respond(line))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"[INFO] Emulator served {emu.requests} OBD requests")
+        if link and os.path.islink(link):
+            os.remove(link)
+        os.close(master)
+        os.close(slave)
+
+
+def parse_latency(specs: list[str]) -> dict[str, float]:
+    out = {}
+    for spec in specs:
+        cmd, _, seconds = spec.partition("=")
+        out[cmd.upper()] = float(seconds)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--profile", choices=sorted(PROFILES), default="vpw")
+    ap.add_argument("--link", help="symlink to create for the pty (e.g. /tmp/rfcomm-sim)")
+    ap.add_argument("--latency", action="append", default=[], metavar="CMD=SECONDS",
+                    help="per-request latency override, e.g. 010C=0.08 (repeatable)")
+    ap.add_argument("--base-latency", type=float, help="latency for every other request")
+    args = ap.parse_args()
+
+    base = PROFILES[args.profile]
+    profile = Profile(base.protocol, base.description,
+                      base.latency if args.base_latency is None else args.base_latency,
+                      base.search_time, base.multi_pid, base.mode06,
+                      {**base.per_pid, **parse_latency(args.latency)})
+    serve(ElmEmulator(profile), args.link)
+
+
+if __name__ == "__main__":
+    main()
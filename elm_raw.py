@@ -0,0 +1,257 @@
+"""
+elm_raw.py - Raw ELM327 fast path for the hottest PIDs
+
+python-OBD costs a fair bit per sample on a Pi Zero: command lookup, building
+Message/Frame objects, wrapping the value in a Pint Quantity and then
+.to("mph") / .to("degF") in the getters. For the channels polled at 5-20 Hz
+that is most of the dash-side CPU.
+
+This module talks to the adapter directly through a RawLink, a second handle
+on the same serial device that the connection manager opens next to
+python-OBD's at the baud rate it connected with (same write /
+read-until-">" exchange as scan_mode22.py's cmd() and read_until_prompt()).
+Each PID has its request bytes pre-encoded and a precomputed decoder that
+turns the reply bytes straight into a float in dashboard units, the same
+units the py_obd getters return. Both handles are only used from the
+acquisition thread, one request at a time, so neither reads the other's
+replies.
+
+It is switchable per channel (acquisition.AcquisitionWorker(raw_channels=...),
+dashboard.py --raw rpm,speed), and every raw query is recorded in
+py_obd.QUERY_STATS as RAW_<command> next to the python-OBD numbers, so the two
+paths can be compared side by side on the diagnostics page or with
+bench_poll.py --raw.
+
+The adapter is left in python-OBD's settings (echo off, headers on, spaces
+on), so replies look like "48 6B 10 41 0C 1A F8 C5" on VPW and
+"7E8 04 41 0C 1A F8" on CAN; multi-frame CAN replies are put back together.
+
+Enhanced channels behind another module's header (enhanced_pids "ecu") only
+go out this way: the RawLink is the one place that sends ATSH and knows
+which header is in effect. It points the adapter back at the default header
+lazily, before the next python-OBD request (on_default_header), so a run of
+module reads costs a single ATSH each way.
+"""
+
+import time
+from typing import Callable, Optional
+
+import obd
+import serial
+
+import enhanced_pids
+import gm_modules
+import py_obd
+
+PROMPT = b">"
+READ_TIMEOUT = 1.0      # s; longer than ATST so NO DATA always arrives before we give up
+
+# Who answers on the default header, as python-OBD's ECU.ENGINE filter sees it (CAN 11-bit, others)
+ENGINE = ("7E8", "10")
+
+KMH_TO_MPH = 0.621371
+
+
+class RawPid:
+    """Pre-encoded request and plain-float decoder for one PID."""
+    __slots__ = ("name", "request", "reply", "size", "decode", "ecu")
+
+    def __init__(self, command: str, request: str, size: int, decode: Callable[[bytes], float],
+                 ecu: str = "pcm"):
+        self.name = "RAW_" + command                # QUERY_STATS key, next to the python-OBD name
+        self.ecu = ecu                              # module name or hex header, as in enhanced_pids
+        self.request = request.encode() + b"\r"
+        service = int(request[:2], 16) + 0x40
+        self.reply = bytes([service]) + bytes.fromhex(request[2:])     # e.g. 41 0C, 62 11 5C
+        self.size = size                            # data bytes after the reply prefix
+        self.decode = decode
+
+
+# Channel name (acquisition.CHANNELS) -> raw PID. Decoders match the py_obd
+# getters: rpm, mph, °F rounded to 0.1, percent, kPa, °C, volts rounded to 0.1
+RAW_PIDS: dict[str, RawPid] = {
+    "rpm": RawPid("RPM", "010C", 2, lambda d: (d[0] * 256 + d[1]) / 4.0),
+    "speed": RawPid("SPEED", "010D", 1, lambda d: d[0] * KMH_TO_MPH),
+    "throttle_pos": RawPid("THROTTLE_POS", "0111", 1, lambda d: d[0] * 100.0 / 255.0),
+    "engine_load": RawPid("ENGINE_LOAD", "0104", 1, lambda d: d[0] * 100.0 / 255.0),
+    "intake_pressure": RawPid("INTAKE_PRESSURE", "010B", 1, lambda d: float(d[0])),
+    "absolute_load": RawPid("ABSOLUTE_LOAD", "0143", 2, lambda d: (d[0] * 256 + d[1]) * 100.0 / 255.0),
+    "coolant_temp": RawPid("COOLANT_TEMP", "0105", 1, lambda d: round((d[0] - 40) * 1.8 + 32.0, 1)),
+    "intake_temp": RawPid("INTAKE_TEMP", "010F", 1, lambda d: float(d[0] - 40)),
+    "module_voltage": RawPid("CONTROL_MODULE_VOLTAGE", "0142", 2, lambda d: round((d[0] * 256 + d[1]) / 1000.0, 1)),
+    "fuel_level": RawPid("FUEL_LEVEL", "012F", 1, lambda d: round(d[0] * 100.0 / 255.0, 0)),
+    "baro_pressure": RawPid("BAROMETRIC_PRESSURE", "0133", 1, lambda d: float(d[0])),
+}
+# Every enhanced channel, with its compiled decoder and module
+RAW_PIDS.update({name: RawPid(pid.name, pid.request, pid.size, pid.value, pid.ecu)
+                 for name, pid in enhanced_pids.DEFINITIONS.items() if name not in RAW_PIDS})
+
+
+def line_bytes(line: str) -> Optional[bytes]:
+    """Hex bytes of one response line, minus a CAN header or "N:" frame index."""
+    tokens = line.replace(":", ": ").split()
+    if len(tokens) == 1 and len(tokens[0]) % 2 == 0:
+        tokens = [tokens[0][i:i + 2] for i in range(0, len(tokens[0]), 2)]   # ATS0, no spaces
+    tokens = [t for t in tokens if len(t) == 2 and not t.endswith(":")]  # drops 11-bit headers, "0:" indexes, lengths
+    try:
+        return bytes.fromhex("".join(tokens)) if tokens else None
+    except ValueError:
+        return None     # NO DATA, SEARCHING..., OK, echo
+
+
+class RawLink:
+    """Our own handle on the adapter's serial device, for raw requests, and the ATSH in effect."""
+
+    def __init__(self, port: str, baudrate: int, protocol: str = ""):
+        # Short reads: exchange() has its own deadline
+        self.serial = serial.Serial(port, baudrate, timeout=0.05)
+        self.protocol = protocol                # ELM protocol id (ATDPN), for module headers
+        self.header: Optional[str] = ""         # '' the adapter's default header, None unknown
+
+    def select(self, header: str) -> None:
+        """Send ATSH for `header` ('' = the default header) unless it is already in effect."""
+        if header == self.header:
+            return
+        self.header = None      # until the adapter has taken it
+        exchange(self.serial, f"ATSH{header or gm_modules.DEFAULT_HEADERS[self.protocol]}\r".encode())
+        self.header = header
+
+    def close(self) -> None:
+        try:
+            self.serial.close()
+        except (serial.SerialException, OSError):
+            pass
+
+
+def exchange(port, request: bytes, timeout: float = READ_TIMEOUT) -> bytes:
+    """Write one pre-encoded request and read up to the prompt (or timeout)."""
+    # A reply that came in after an earlier timeout would otherwise be read as this one's
+    port.reset_input_buffer()
+    port.write(request)
+    deadline = time.monotonic() + timeout
+    buf = bytearray()
+    while time.monotonic() < deadline:
+        chunk = port.read(port.in_waiting or 1)
+        if chunk:
+            buf += chunk
+            if PROMPT in buf:
+                break
+    return bytes(buf)
+
+
+def _sender(line: str, data: bytes, start: int) -> tuple[Optional[str], Optional[int]]:
+    """
+    Who sent the reply at data[start:] and where its CAN PCI byte is: ("7E8", 0),
+    ("10", 4) on CAN 29-bit, ("10", None) on J1850 / ISO, (None, None) with headers off.
+    """
+    s = line.replace(" ", "").upper()
+    if len(s) % 2 == 1:
+        return s[:3], 0                             # CAN 11-bit: 7E8 04 41 0C ...
+    if start in (5, 6) and data[:3] == b"\x18\xda\xf1":
+        return f"{data[3]:02X}", 4                  # CAN 29-bit: 18 DA F1 10 04 41 0C ...
+    if start == 3:
+        return f"{data[2]:02X}", None               # J1850 / ISO 9141 / KWP: 48 6B 10 41 0C ... CRC
+    return None, None
+
+
+def parse(pid: RawPid, reply: bytes, senders: tuple[str, ...] = ENGINE) -> Optional[float]:
+    """
+    The value `senders` gave in a raw reply, or None (NO DATA, error text, short
+    reply, only other modules answered). With headers off the first reply is taken.
+    """
+    lines = [line.decode("ascii", errors="ignore") for line in reply.split(b"\r")]
+    unknown = None
+    for i, text in enumerate(lines):
+        data = line_bytes(text)
+        if not data:
+            continue
+        start = data.find(pid.reply)
+        if start < 0:
+            continue
+        sender, pci = _sender(text, data, start)
+        if sender is not None and sender not in senders:
+            continue
+        end = len(data)
+        if sender is not None and pci is None:
+            end -= 1                                # J1850 CRC
+        elif pci is not None and data[pci] >> 4 == 0:
+            end = pci + 1 + data[pci]               # single frame: drop padding
+        payload = data[start + len(pid.reply):end]
+        if pci is not None and data[pci] >> 4 == 1:
+            # ISO-TP first frame: the rest is in the consecutive frames from the same sender
+            length = ((data[pci] & 0x0F) << 8 | data[pci + 1]) - len(pid.reply)
+            for later in lines[i + 1:]:
+                if len(payload) >= length:
+                    break
+                more = line_bytes(later)
+                if more and len(more) > pci and more[pci] >> 4 == 2 and _sender(later, more, pci + 1)[0] == sender:
+                    payload += more[pci + 1:]
+            payload = payload[:length]
+        if len(payload) < pid.size:
+            continue
+        if sender is not None:
+            return pid.decode(payload[:pid.size])
+        if unknown is None:
+            unknown = pid.decode(payload[:pid.size])
+    return unknown
+
+
+def query(link: Optional[RawLink], pid: RawPid, default: Optional[float] = 0.0) -> Optional[float]:
+    """One raw request, timed into QUERY_STATS. Same contract as the py_obd getters."""
+    if link is None:
+        py_obd.QUERY_STATS.record(pid.name, 0.0, py_obd.ERROR)
+        return default
+    header = gm_modules.header_for(pid.ecu, link.protocol)
+    if header is None:
+        py_obd.QUERY_STATS.record(pid.name, 0.0, py_obd.UNSUPPORTED)    # module not known on this protocol
+        return default
+    start = time.perf_counter()
+    try:
+        link.select(header)
+        reply = exchange(link.serial, pid.request)
+        value = parse(pid, reply, (gm_modules.responder(header),) if header else ENGINE)
+    except Exception as e:
+        py_obd.QUERY_STATS.record(pid.name, time.perf_counter() - start, py_obd.ERROR)
+        py_obd._log(f"[ERROR] Raw {pid.name} failed: {e}")
+        return default
+    latency = time.perf_counter() - start
+    if value is not None:
+        py_obd.QUERY_STATS.record(pid.name, latency, py_obd.OK, value)
+        return value
+    # Something came back that wasn't our reply (e.g. "7F 22 12" or "?") vs nothing at all
+    answered = PROMPT in reply and b"NO DATA" not in reply and any(
+        line_bytes(line.decode("ascii", errors="ignore")) for line in reply.split(b"\r"))
+    py_obd.QUERY_STATS.record(pid.name, latency, py_obd.NONE if answered else py_obd.TIMEOUT)
+    return default
+
+
+def getter(name: str, link: Optional[RawLink]) -> Callable[..., Optional[float]]:
+    """
+    A raw drop-in for the CHANNELS getter of `name`, sending on `link`:
+    getter(connection, default=0.0) like the others (connection is unused).
+    """
+    pid = RAW_PIDS[name]
+
+    def get(connection: obd.OBD, default: Optional[float] = 0.0) -> Optional[float]:
+        return query(link, pid, default)
+    get.__name__ = f"raw_{name}"
+    return get
+
+
+def on_default_header(link: Optional[RawLink], get: Callable) -> Callable:
+    """
+    A python-OBD getter that first points the adapter back at the default
+    header if a raw module read left it elsewhere.
+    """
+    if link is None:
+        return get
+
+    def restored(*args, **kwargs):
+        if link.header != "":
+            try:
+                link.select("")
+            except Exception as e:
+                py_obd._log(f"[ERROR] Could not restore the default header: {e}")
+        return get(*args, **kwargs)
+    restored.__name__ = getattr(get, "__name__", "get")
+    return restored
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+enhanced_pids.py - Mode 22 channels defined in enhanced_pids.json
+
+  python3 enhanced_pids.py                          # check the file, list what it defines
+  python3 enhanced_pids.py my_pids.json --payload 115C:35
+
+Each entry is a dash channel and how to read it:
+
+  "oil_pressure": {
+    "command": "GM_OIL_PRESSURE",   OBDCommand / QUERY_STATS name (default: channel in capitals)
+    "desc": "...",
+    "did": "115C",                  Mode 22 DID
+    "ecu": "pcm",                   module in gm_modules.TARGETS or a hex ATSH header (default pcm)
+    "value": "A*0.65 - 17.5",       expression over payload bytes A, B, ... or instead
+    "byte": 0, "length": 2,         big-endian raw value at a payload offset,
+    "signed": false,                then
+    "scale": 0.25, "offset": -40,   raw * scale + offset
+    "min": 0, "max": 100,           optional clamp
+    "units": "psi",
+    "hz": 1.0,                      target poll rate
+    "deadband": 0.5,                smallest change worth redrawing for (default 0)
+    "trip_id": 4444                 trip_recorder channel id (default the DID); keep it stable
+  }
+
+Expressions may use + - * / // % & | ^ >>, << by a constant (0..32),
+comparisons, "x if c else y" and min/max/abs/round; there is no ** and no
+shift by a payload byte, so no definition can build a number big enough to
+stall the acquisition thread. Each definition is checked and compiled once, at
+load, into a plain lambda of the payload bytes, so a sample costs the same
+as a hand-written decoder like the old _decode_gm_oil_pressure.
+
+acquisition.CHANNELS polls every definition at its "hz" and every one has an
+elm_raw fast path. The dash shows each channel in TelemetryModel's enhanced
+map and trip_recorder records it under its trip_id. PCM channels can also go
+through python-OBD (py_obd.get_enhanced), on the default header it already
+uses. DIDs behind another module's header are only read by elm_raw, which
+owns ATSH; they are skipped on protocols that module isn't known for.
+"""
+
+import argparse
+import ast
+import json
+import os
+import sys
+from typing import Callable, Optional
+
+from obd import OBDCommand
+from obd.protocols import ECU
+
+from gm_modules import MODULES
+
+DEFINITIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "enhanced_pids.json")
+
+FUNCTIONS = {"min": min, "max": max, "abs": abs, "round": round}
+_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.IfExp, ast.Compare, ast.Call, ast.Name, ast.Constant, ast.Load,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod,
+    ast.BitAnd, ast.BitOr, ast.BitXor, ast.LShift, ast.RShift, ast.USub, ast.UAdd, ast.Invert,
+    ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq,
+)
+
+
+class _PayloadBytes(ast.NodeTransformer):
+    """A, B, C, ... -> d[0], d[1], d[2], ..."""
+
+    def visit_Name(self, node):
+        if node.id in FUNCTIONS:
+            return node
+        index = ast.Constant(ord(node.id) - ord("A"))
+        return ast.copy_location(ast.Subscript(ast.Name("d", ast.Load()), index, ast.Load()), node)
+
+
+def compile_value(expr: str, low: Optional[float] = None, high: Optional[float] = None,
+                  label: str = "value") -> tuple[Callable[[bytes], float], int, str]:
+    """
+    Check a payload expression and compile it into a function of the payload
+    bytes. Returns (function, payload bytes it needs, the compiled source).
+    """
+    try:
+        tree = ast.parse(expr, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"{label}: bad expression {expr!r}: {e.msg}") from None
+    calls = {id(node.func) for node in ast.walk(tree) if isinstance(node, ast.Call)}
+    size = 0
+    for node in ast.walk(tree):
+        if not isinstance(node, _NODES):
+            raise ValueError(f"{label}: {type(node).__name__} not allowed in {expr!r}")
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+                raise ValueError(f"{label}: only {', '.join(FUNCTIONS)} can be called in {expr!r}")
+        elif isinstance(node, ast.Name) and id(node) not in calls:
+            if len(node.id) != 1 or not "A" <= node.id <= "Z":
+                raise ValueError(f"{label}: unknown name {node.id!r} in {expr!r} (payload bytes are A, B, ...)")
+            size = max(size, ord(node.id) - ord("A") + 1)
+        elif isinstance(node, ast.BinOp) and isinstance(node.op, ast.LShift):
+            shift = node.right
+            if not (isinstance(shift, ast.Constant) and type(shift.value) is int and 0 <= shift.value <= 32):
+                raise ValueError(f"{label}: << needs a constant shift of 0..32 in {expr!r}")
+        elif isinstance(node, ast.Constant) and type(node.value) not in (int, float):
+            raise ValueError(f"{label}: {node.value!r} is not a number in {expr!r}")
+    if not size:
+        raise ValueError(f"{label}: {expr!r} doesn't use any payload byte")
+
+    body = ast.unparse(_PayloadBytes().visit(tree))
+    if low is not None:
+        body = f"max({low!r}, {body})"
+    if high is not None:
+        body = f"min({high!r}, {body})"
+    source = f"lambda d: float({body})"
+    code = compile(source, f"<{label}>", "eval")
+    return eval(code, {"__builtins__": {}, "float": float, **FUNCTIONS}), size, source
+
+
+def _raw_expression(byte: int, length: int, signed: bool) -> str:
+    """Big-endian value of `length` payload bytes from `byte` as an expression over A, B, ..."""
+    letters = [chr(ord("A") + i) for i in range(byte, byte + length)]
+    raw = letters[0]
+    for letter in letters[1:]:
+        raw = f"({raw}*256 + {letter})"
+    if signed:
+        raw = f"({raw} - {1 << (8 * length)} if {raw} >= {1 << (8 * length - 1)} else {raw})"
+    return raw
+
+
+class EnhancedPid:
+    """One compiled definition."""
+    __slots__ = ("channel", "name", "desc", "did", "ecu", "size", "units", "hz", "deadband", "trip_id",
+                 "value", "source", "decoder", "_command")
+
+    def __init__(self, channel: str, spec: dict):
+        unknown = set(spec) - {"command", "desc", "did", "ecu", "value", "byte", "length", "signed",
+                               "scale", "offset", "min", "max", "units", "hz", "deadband", "trip_id"}
+        if unknown:
+            raise ValueError(f"{channel}: unknown field(s) {', '.join(sorted(unknown))}")
+        try:
+            did = str(spec["did"]).upper()
+            self.did = int(did[2:] if len(did) == 6 and did.startswith("22") else did, 16)
+            if not 0 <= self.did <= 0xFFFF:
+                raise ValueError
+        except KeyError:
+            raise ValueError(f"{channel}: no did") from None
+        except ValueError:
+            raise ValueError(f"{channel}: bad did {spec['did']!r}, expected e.g. \"115C\"") from None
+        self.channel = channel
+        self.name = spec.get("command", channel.upper())
+        self.ecu = str(spec.get("ecu", "pcm"))
+        if self.ecu.lower() in MODULES:
+            self.ecu = self.ecu.lower()
+        elif len(self.ecu) not in (3, 6) or any(c not in "0123456789ABCDEFabcdef" for c in self.ecu):
+            raise ValueError(f"{channel}: unknown ecu {self.ecu!r} (have: {', '.join(sorted(MODULES))} "
+                             f"or a hex header)")
+        else:
+            self.ecu = self.ecu.upper()
+        self.units = spec.get("units", "")
+        self.desc = spec.get("desc", f"Mode 22 DID {self.did:04X} ({self.ecu}), {self.units or 'raw'}")
+        self.hz = float(spec.get("hz", 1.0))
+        if self.hz <= 0:
+            raise ValueError(f"{channel}: hz must be positive")
+        self.deadband = float(spec.get("deadband", 0.0))
+        self.trip_id = int(spec.get("trip_id", self.did))
+        if not 0 < self.trip_id <= 0xFFFF:
+            raise ValueError(f"{channel}: trip_id must be 1..65535")
+
+        if "value" in spec:
+            if {"byte", "length", "signed", "scale", "offset"} & set(spec):
+                raise ValueError(f"{channel}: give either value or byte/length/scale/offset, not both")
+            expr = spec["value"]
+        else:
+            byte, length = int(spec.get("byte", 0)), int(spec.get("length", 1))
+            if byte < 0 or not 1 <= length <= 4 or byte + length > 26:
+                raise ValueError(f"{channel}: bad byte/length {byte}/{length}")
+            expr = f"{_raw_expression(byte, length, bool(spec.get('signed')))}*{float(spec.get('scale', 1.0))!r}" \
+                   f" + {float(spec.get('offset', 0.0))!r}"
+        self.value, self.size, self.source = compile_value(expr, spec.get("min"), spec.get("max"), channel)
+        self.decoder = self._decoder()
+        self._command: Optional[OBDCommand] = None
+
+    @property
+    def request(self) -> str:
+        return f"22{self.did:04X}"
+
+    def _decoder(self) -> Callable[[list], Optional[float]]:
+        """python-OBD decoder: the compiled value of the first reply that echoes our DID."""
+        prefix = bytes([0x62, self.did >> 8, self.did & 0xFF])
+        need = len(prefix) + self.size
+        value = self.value
+
+        def decode(messages):
+            for m in messages:
+                data = m.data
+                if len(data) >= need and data[:3] == prefix:
+                    try:
+                        return value(data[3:])
+                    except (ArithmeticError, ValueError):
+                        return None
+            return None
+        decode.__name__ = f"_decode_{self.channel}"
+        return decode
+
+    @property
+    def command(self) -> Optional[OBDCommand]:
+        """
+        python-OBD command for a PCM channel, on the default header python-OBD
+        already tracks (so it never sends ATSH for it); None for other modules.
+        """
+        if self.ecu != "pcm":
+            return None
+        if self._command is None:
+            # _bytes 0: the decoder checks the length
+            self._command = OBDCommand(self.name, self.desc, self.request.encode(), 0, self.decoder,
+                                       ecu=ECU.ENGINE, fast=False)
+        return self._command
+
+
+def load(path: str = DEFINITIONS_PATH, problems: Optional[list[str]] = None) -> dict[str, EnhancedPid]:
+    """
+    Channel name -> EnhancedPid for every entry in a definition file. Raises on
+    the first bad entry, or, given a `problems` list, notes each one there and
+    skips it (a missing file then loads nothing).
+    """
+    try:
+        with open(path, "r") as f:
+            specs = json.load(f)
+        if not isinstance(specs, dict):
+            raise ValueError(f"{path}: expected an object of channel definitions")
+    except (OSError, ValueError) as e:
+        if problems is None:
+            raise
+        problems.append(f"No enhanced PIDs loaded: {e}")
+        return {}
+
+    pids: dict[str, EnhancedPid] = {}
+    names = set()
+    trip_ids = {}
+    for channel, spec in specs.items():
+        try:
+            if not isinstance(spec, dict):
+                raise ValueError(f"{channel}: expected an object")
+            pid = EnhancedPid(channel, spec)
+            if pid.name in names:
+                raise ValueError(f"{channel}: command name {pid.name} is used twice")
+            if pid.trip_id in trip_ids:
+                raise ValueError(f"{channel}: trip_id {pid.trip_id} is {trip_ids[pid.trip_id]}'s too "
+                                 f"(give one of them a trip_id of its own)")
+        except ValueError as e:
+            if problems is None:
+                raise ValueError(f"{path}: {e}") from None
+            problems.append(f"Skipping enhanced PID {e}")
+            continue
+        names.add(pid.name)
+        trip_ids[pid.trip_id] = channel
+        pids[channel] = pid
+    return pids
+
+
+# Loaded once at startup; acquisition, py_obd, elm_raw and replay all use this.
+# Nothing is printed on import: what was skipped is in PROBLEMS for the dash to report.
+PROBLEMS: list[str] = []
+DEFINITIONS: dict[str, EnhancedPid] = load(DEFINITIONS_PATH, PROBLEMS)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("path", nargs="?", default=DEFINITIONS_PATH)
+    ap.add_argument("--payload", action="append", default=[], metavar="DID:HEX",
+                    help="decode a reply payload with every definition for that DID, e.g. 115C:35")
+    args = ap.parse_args()
+    try:
+        pids = load(args.path)
+        for p in pids.values():
+            print(f"{p.channel:<18} {p.name:<22} {p.request}  {p.ecu:<6} {p.size} bytes  "
+                  f"{p.units or '-':<6} {p.hz:g} Hz  {p.source}")
+        print(f"[INFO] {len(pids)} enhanced PIDs in {args.path}")
+        for spec in args.payload:
+            did, _, payload = spec.partition(":")
+            did, payload = int(did[-4:], 16), bytes.fromhex(payload)
+            for p in pids.values():
+                if p.did == did:
+                    value = p.value(payload) if len(payload) >= p.size else None
+                    print(f"22{did:04X} [{payload.hex(' ').upper()}] {p.channel} = {value} {p.units}")
+    except (ValueError, OSError) as e:
+        sys.exit(f"[ERROR] {e}")
+
+
+if __name__ == "__main__":
+    main()
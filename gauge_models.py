@@ -0,0 +1,245 @@
+"""
+gauge_models.py - Shared base for the QObjects the QML gauges bind to
+
+Every notify signal makes QML re-evaluate its bindings and redraw the
+Glow/DropShadow layers behind it, so updates only emit when a value moved by
+more than its channel's deadband (compared against the last value actually
+emitted). UPDATE_STATS counts emitted vs suppressed updates so the savings
+can be checked on the Pi.
+
+TelemetryModel carries every gauge value as one frame with a single
+frameChanged signal; GaugeModel is the per-property base for the rest.
+Channels from enhanced_pids.json don't need a field of their own: they are
+in the frame's `enhanced` / `enhancedStale` maps by channel name, e.g.
+telemetry.enhanced.trans_temp in QML.
+"""
+
+import threading
+from typing import Mapping, Optional
+
+from PyQt5.QtCore import QObject, QTimer, pyqtProperty, pyqtSignal, pyqtSlot
+
+
+class UpdateStats:
+    """Process-wide counters of notify signals emitted vs suppressed."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.emitted = 0
+        self.suppressed = 0
+
+    def count(self, emitted: bool) -> None:
+        with self._lock:
+            if emitted:
+                self.emitted += 1
+            else:
+                self.suppressed += 1
+
+    def summary(self) -> str:
+        total = self.emitted + self.suppressed
+        pct = 100.0 * self.suppressed / total if total else 0.0
+        return f"Gauge updates: {self.emitted} emitted, {self.suppressed} suppressed ({pct:.0f}% saved)"
+
+
+UPDATE_STATS = UpdateStats()
+
+
+class GaugeModel(QObject):
+    """Base for gauge models; `deadband` applies to the numeric value setters."""
+
+    def __init__(self, deadband: float = 0.0, parent=None):
+        super().__init__(parent)
+        self.deadband = deadband
+
+    def _set(self, attr: str, value, signal, deadband: float = None) -> bool:
+        """Store value and emit signal only if it actually changed. Returns True if emitted."""
+        old = getattr(self, attr)
+        band = self.deadband if deadband is None else deadband
+        if value == old or (band and isinstance(value, (int, float)) and isinstance(old, (int, float))
+                            and abs(value - old) < band):
+            UPDATE_STATS.count(False)
+            return False
+        setattr(self, attr, value)
+        signal.emit()
+        UPDATE_STATS.count(True)
+        return True
+
+
+# Frame field -> (type, deadband in display units)
+FRAME_FIELDS = {
+    "speed": (float, 0.1),              # mph (fused)
+    "rpm": (float, 0.01),               # x1000 rpm, so 10 rpm
+    "coolantTemp": (float, 1.0),        # °F
+    "moduleVoltage": (float, 0.1),      # V
+    "engineLoad": (float, 0.5),         # %
+    "throttlePos": (float, 0.5),        # %
+    "absoluteLoad": (float, 0.5),       # %
+    "baroPressure": (float, 1.0),       # kPa
+    "intakePressure": (float, 1.0),     # kPa
+    "intakeTemp": (float, 1.0),         # °C
+    "fuelLevel": (float, 1.0),          # %
+    "oilPressure": (float, 0.5),        # psi
+    "mil": (bool, 0),
+    "dtcCount": (int, 0),
+    "connected": (bool, 0),
+    "linkState": (str, 0),
+    "speedSource": (str, 0),            # "obd" / "gps" / "none"
+    "runTime": (str, 0),                # H:MM:SS since engine start
+    "fuelType": (str, 0),               # as python-OBD names it, "" if not reported
+}
+
+# Snapshot channel -> frame field (see acquisition.CHANNELS)
+SNAPSHOT_FIELDS = {
+    "coolant_temp": "coolantTemp",
+    "module_voltage": "moduleVoltage",
+    "engine_load": "engineLoad",
+    "throttle_pos": "throttlePos",
+    "absolute_load": "absoluteLoad",
+    "baro_pressure": "baroPressure",
+    "intake_pressure": "intakePressure",
+    "intake_temp": "intakeTemp",
+    "fuel_level": "fuelLevel",
+    "oil_pressure": "oilPressure",
+}
+
+# "<field>Stale" flags: the gauge is holding its last good value past the
+# channel's staleness window (see acquisition.stale_window)
+STALE_FIELDS = {"rpm": "rpmStale", **{channel: key + "Stale" for channel, key in SNAPSHOT_FIELDS.items()}}
+FRAME_FIELDS.update({key: (bool, 0) for key in STALE_FIELDS.values()})
+
+# Shown while the ECU isn't answering
+DISCONNECTED_FRAME = {
+    **{key: 0.0 for key in SNAPSHOT_FIELDS.values()},
+    **{key: False for key in STALE_FIELDS.values()},
+    "rpm": 0.0,
+    # Show "disconnected" by turning MIL on (optional)
+    "mil": True,
+    "dtcCount": 0,
+    "connected": False,
+}
+
+
+def _frame_property(key: str, type_, signal):
+    return pyqtProperty(type_, lambda self: self._frame[key], notify=signal)
+
+
+def _frame_namespace() -> dict:
+    """
+    frameChanged, one read-only property per FRAME_FIELDS key and the two
+    enhanced channel maps, all notifying on it.
+    """
+    frame_changed = pyqtSignal()
+    namespace = {"frameChanged": frame_changed}
+    namespace.update({key: _frame_property(key, type_, frame_changed) for key, (type_, _) in FRAME_FIELDS.items()})
+    namespace["enhanced"] = pyqtProperty("QVariantMap", lambda self: self._enhanced, notify=frame_changed)
+    namespace["enhancedStale"] = pyqtProperty("QVariantMap", lambda self: self._enhanced_stale, notify=frame_changed)
+    return namespace
+
+
+# PyQt builds the meta-object QML sees when the class is created, so the
+# generated properties go into the namespace of a base class rather than
+# being attached afterwards
+_FrameProperties = type(QObject)("_FrameProperties", (QObject,), _frame_namespace())
+
+
+class TelemetryModel(_FrameProperties):
+    """
+    Everything the gauges show, as one QObject. Updates are staged as they
+    arrive (acquisition snapshots, fused speed) and committed on a fixed frame
+    timer; a commit that moves any field past its deadband emits frameChanged
+    once, so a whole frame costs QML one binding pass.
+
+    `enhanced` maps each enhanced channel to its deadband (see
+    enhanced_pids.EnhancedPid.deadband).
+    """
+
+    def __init__(self, rate_hz: float = 20.0, enhanced: Optional[Mapping[str, float]] = None, parent=None):
+        super().__init__(parent)
+        self._frame = {key: type_() for key, (type_, _) in FRAME_FIELDS.items()}
+        self._frame["speedSource"] = "none"
+        self._pending = {}
+        self._enhanced_bands = dict(enhanced or {})
+        self._enhanced = {channel: 0.0 for channel in self._enhanced_bands}
+        self._enhanced_stale = {channel: False for channel in self._enhanced_bands}
+        self._pending_enhanced = {}     # channel -> (value, stale)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.commit)
+        self.timer.start(int(1000 / rate_hz))
+
+    # Gauge ranges never change
+    @pyqtProperty(float, constant=True)
+    def maxSpeed(self): return 160.0
+
+    @pyqtProperty(float, constant=True)
+    def minSpeed(self): return 0.0
+
+    @pyqtProperty(float, constant=True)
+    def maxRPM(self): return 10.0
+
+    @pyqtProperty(float, constant=True)
+    def minRPM(self): return 0.0
+
+    def stage(self, key: str, value) -> None:
+        self._pending[key] = value
+
+    @pyqtSlot(float)
+    def setSpeed(self, v): self.stage("speed", v)
+
+    @pyqtSlot(str)
+    def setSpeedSource(self, v): self.stage("speedSource", v)
+
+    def applySnapshot(self, snapshot) -> None:
+        """Stage one acquisition.Snapshot; nothing is emitted until the next commit."""
+        self.stage("linkState", snapshot.link)
+        if not snapshot.connected:
+            self._pending.update(DISCONNECTED_FRAME)
+            self._pending_enhanced.update({channel: (0.0, False) for channel in self._enhanced})
+            return
+
+        v = snapshot.values
+        self.stage("connected", True)
+        self.stage("mil", snapshot.mil)
+        self.stage("dtcCount", snapshot.dtc_count)
+        # RPM in thousands for the gauge
+        self.stage("rpm", v.get("rpm", 0.0) / 1000)
+        for channel, key in SNAPSHOT_FIELDS.items():
+            if channel in v:
+                self.stage(key, v[channel])
+        for channel, key in STALE_FIELDS.items():
+            self.stage(key, channel in snapshot.stale)
+        if "run_time" in v:
+            seconds = int(v["run_time"])
+            self.stage("runTime", f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}")
+        self.stage("fuelType", snapshot.fuel_type)
+        for channel in self._enhanced:
+            if channel in v:
+                self._pending_enhanced[channel] = (v[channel], channel in snapshot.stale)
+
+    @pyqtSlot()
+    def commit(self) -> None:
+        if not self._pending and not self._pending_enhanced:
+            return
+        changed = False
+        for key, value in self._pending.items():
+            old = self._frame[key]
+            band = FRAME_FIELDS[key][1]
+            if value == old or (band and abs(value - old) < band):
+                continue
+            self._frame[key] = value
+            changed = True
+        self._pending.clear()
+
+        for channel, (value, stale) in self._pending_enhanced.items():
+            old = self._enhanced[channel]
+            band = self._enhanced_bands[channel]
+            if not (value == old or (band and abs(value - old) < band)):
+                self._enhanced[channel] = value
+                changed = True
+            if stale != self._enhanced_stale[channel]:
+                self._enhanced_stale[channel] = stale
+                changed = True
+        self._pending_enhanced.clear()
+
+        if changed:
+            self.frameChanged.emit()
+        UPDATE_STATS.count(changed)
@@ -0,0 +1,66 @@
+"""
+gm_modules.py - GM module addressing shared by the dash, the scanners and the emulator
+
+TARGETS names the physical request headers (ATSH) of the modules worth
+talking to, per ELM protocol number, and DEFAULT_HEADERS the functional
+header the adapter starts out with (the one python-OBD's requests go out
+on); j1850_crc is the checksum VPW frames end with. Kept apart from
+mode22_db and elm_emulator so the live dash can use them without importing
+sqlite3 or the emulator.
+"""
+
+from typing import Optional
+
+# Physical request headers (ATSH) per ELM protocol number (ATDPN)
+TARGETS = {
+    "2": {"pcm": "6C10F1", "tcm": "6C18F1", "bcm": "6C40F1"},     # J1850 VPW: priority, node, tester
+    "6": {"pcm": "7E0", "tcm": "7E1"},                            # CAN 11-bit 500k
+    "8": {"pcm": "7E0", "tcm": "7E1"},                            # CAN 11-bit 250k
+}
+
+MODULES = {name for modules in TARGETS.values() for name in modules}
+
+# The ELM327's power-on header per protocol: what to go back to after a physical ATSH
+DEFAULT_HEADERS = {"2": "686AF1", "6": "7DF", "8": "7DF"}
+
+
+def header_for(ecu: str, protocol: str) -> Optional[str]:
+    """
+    ATSH header for a module name or hex header on `protocol`: '' for the PCM
+    (it answers on the default header), None if it can't be reached there.
+    """
+    if ecu == "pcm":
+        return ""
+    if protocol not in DEFAULT_HEADERS:
+        return None     # no known way back to the default header afterwards
+    if ecu in MODULES:
+        return TARGETS[protocol].get(ecu)
+    return ecu
+
+
+def responder(header: str) -> str:
+    """Reply address for a physical header: "7E9" for 7E1 (CAN 11-bit), "18" for 6C18F1 (J1850)."""
+    if len(header) == 3:
+        return f"{int(header, 16) + 8:03X}"
+    return header[2:4]
+
+
+def module_name(target: str) -> str:
+    """'pcm' for "6C10F1", 'functional' for '', the header itself if it isn't a known module."""
+    if not target:
+        return "functional"
+    for modules in TARGETS.values():
+        for name, header in modules.items():
+            if header == target:
+                return name
+    return target
+
+
+def j1850_crc(data: bytes) -> int:
+    """SAE J1850 CRC-8 (poly 0x1D, init and final XOR 0xFF)."""
+    crc = 0xFF
+    for b in data:
+        crc ^= b
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1D) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc ^ 0xFF
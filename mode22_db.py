@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+mode22_db.py - Parsed Mode 22 scan results, kept per vehicle
+
+  python3 mode22_db.py list                     # hits for every vehicle scanned
+  python3 mode22_db.py list --all --vehicle 1GCEK19T45E000001
+  python3 mode22_db.py export scans.json
+  python3 mode22_db.py command 22115C           # enhanced_pids.json entry for a hit
+
+parse_reply() turns an ELM327 reply to "22xxxx" into a Reply: the header
+(and which module answered), positive 0x62 responses only when the echoed
+DID matches the request, the payload after it, and 7F 22 negative responses
+with their NRC. ScanDB stores one row per (vehicle, target header, DID) in
+SQLite, so the scanners only probe DIDs that haven't had a definite answer
+yet and the hits can be turned into enhanced_pids.json channels.
+
+Replies are expected with headers on (ATH1), spaces on or off: VPW
+"48 6B 10 62 11 5C 35 <CRC>", CAN "7E8 04 62 11 5C 35".
+
+The target is the ATSH header a request went out with ('' for the adapter's
+default functional header); gm_modules.TARGETS names the physical headers of
+the modules worth scanning, so each DID is recorded against the module that owns it.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from gm_modules import j1850_crc, module_name
+
+DB_PATH = os.path.expanduser("~/.cache/odb2-guages/mode22.sqlite")
+
+POSITIVE = "positive"       # 62 + echoed DID + payload
+NEGATIVE = "negative"       # 7F 22 ... NRC
+NO_DATA = "no_data"         # nothing answered within ATST
+ERROR = "error"             # adapter error, garbled or someone else's reply
+
+NRC_NAMES = {
+    0x10: "generalReject",
+    0x11: "serviceNotSupported",
+    0x12: "subFunctionNotSupported",
+    0x13: "incorrectMessageLength",
+    0x21: "busyRepeatRequest",
+    0x22: "conditionsNotCorrect",
+    0x31: "requestOutOfRange",
+    0x33: "securityAccessDenied",
+    0x78: "responsePending",
+}
+# Worth asking again on a later scan (engine running, module awake, ...)
+TRANSIENT_NRCS = {0x21, 0x22, 0x78}
+
+@dataclass(frozen=True)
+class Reply:
+    did: int
+    status: str
+    header: str = ""            # as printed by the adapter, e.g. "486B10", "7E8"
+    responder: str = ""         # source address: "10" (VPW PCM), "7E8" (CAN ECM)
+    payload: bytes = b""        # data after 62 + DID
+    nrc: Optional[int] = None
+    raw: str = ""
+
+    @property
+    def nrc_name(self) -> str:
+        return "" if self.nrc is None else NRC_NAMES.get(self.nrc, f"0x{self.nrc:02X}")
+
+    def describe(self) -> str:
+        if self.status == POSITIVE:
+            return f"{len(self.payload)} bytes [{self.payload.hex(' ').upper()}] from {self.responder or '?'}"
+        if self.status == NEGATIVE:
+            return f"7F {self.nrc_name} from {self.responder or '?'}"
+        return self.status
+
+
+def _responder(header: str) -> str:
+    return header if len(header) <= 3 else header[-2:]
+
+
+def frames(text: str) -> list[tuple[str, bytes]]:
+    """
+    (header, data) per reply, data starting at the service byte. CAN PCI bytes
+    and the J1850 CRC are removed and ISO-TP multi-frame replies joined.
+    """
+    out: list[tuple[str, bytearray]] = []
+    pending: dict[str, tuple[int, bytearray]] = {}     # header -> (expected length, data so far)
+    for line in text.replace("\r", "\n").replace(">", "").split("\n"):
+        s = line.replace(" ", "").upper()
+        if not s or any(c not in "0123456789ABCDEF" for c in s):
+            continue    # NO DATA, SEARCHING..., ?, BUS ERROR
+        if len(s) % 2 == 1 or (len(s) >= 10 and s.startswith("18DA")):
+            # CAN: 11-bit (3 hex digits) or 29-bit header, then the ISO-TP PCI byte
+            split = 3 if len(s) % 2 == 1 else 8
+            header, data = s[:split], bytes.fromhex(s[split:])
+            if not data:
+                continue
+            kind = data[0] >> 4
+            if kind == 0:
+                out.append((header, bytearray(data[1:1 + (data[0] & 0x0F)])))
+            elif kind == 1 and len(data) >= 2:
+                pending[header] = (((data[0] & 0x0F) << 8) | data[1], bytearray(data[2:]))
+            elif kind == 2 and header in pending:
+                length, buf = pending[header]
+                buf += data[1:]
+                if len(buf) >= length:
+                    out.append((header, buf[:length]))
+                    del pending[header]
+            continue
+        data = bytes.fromhex(s)
+        if len(data) >= 5 and j1850_crc(data[:-1]) == data[-1]:
+            out.append((data[:3].hex().upper(), bytearray(data[3:-1])))     # J1850: 3-byte header + CRC
+        else:
+            out.append(("", bytearray(data)))       # headers off
+    return [(h, bytes(d)) for h, d in out]
+
+
+def parse_reply(did: int, text: str) -> Reply:
+    """Classify the adapter's reply to 22<did>."""
+    raw = " ".join(text.replace(">", "").split())
+    want = bytes([0x62, did >> 8, did & 0xFF])
+    negative = None
+    for header, data in frames(text):
+        if data.startswith(want):
+            return Reply(did, POSITIVE, header, _responder(header), data[3:], raw=raw)
+        # CAN: 7F 22 NRC. GM VPW echoes the DID: 7F 22 hi lo ... NRC
+        if len(data) >= 3 and data[0] == 0x7F and data[1] == 0x22 and negative is None:
+            if len(data) >= 5 and data[2:4] != want[1:]:
+                continue
+            negative = Reply(did, NEGATIVE, header, _responder(header), nrc=data[-1], raw=raw)
+    if negative is not None:
+        return negative
+    return Reply(did, NO_DATA if "NO DATA" in text.upper() else ERROR, raw=raw)
+
+
+def vin_from_reply(text: str) -> str:
+    """VIN from a raw 0902 reply (VPW: five numbered 4-byte messages, CAN: one ISO-TP message)."""
+    parts = sorted((data[2], data[3:]) for _, data in frames(text)
+                   if len(data) > 3 and data[0] == 0x49 and data[1] == 0x02)
+    vin = b"".join(p for _, p in parts).strip(b"\x00").decode("ascii", errors="ignore")
+    return vin if len(vin) == 17 else ""
+
+
+def _timed_out(row, full_timeout: float) -> bool:
+    # Half an ATST count (4 ms) of slack for the rounding in ATST_UNIT multiples
+    return row["status"] == NO_DATA and (row["timeout"] is None or row["timeout"] < full_timeout - 0.002)
+
+
+class ScanDB:
+    """One row per (vehicle, target header, DID): the latest answer and when it was seen."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS dids (
+            vehicle TEXT NOT NULL,
+            target TEXT NOT NULL DEFAULT '',    -- ATSH header the request went out with ('' = default)
+            did INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            responder TEXT NOT NULL DEFAULT '',
+            header TEXT NOT NULL DEFAULT '',
+            nrc INTEGER,
+            length INTEGER,
+            payload TEXT NOT NULL DEFAULT '',
+            raw TEXT NOT NULL DEFAULT '',
+            first_seen REAL NOT NULL,
+            last_seen REAL NOT NULL,
+            count INTEGER NOT NULL DEFAULT 1,
+            timeout REAL,                       -- ATST (s) it was asked with (NULL = not recorded)
+            PRIMARY KEY (vehicle, target, did)
+        );
+        CREATE TABLE IF NOT EXISTS vehicles (
+            vehicle TEXT PRIMARY KEY,
+            protocol TEXT NOT NULL DEFAULT '',     -- ATDPN
+            updated REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path: str = DB_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(self.SCHEMA)
+        if "timeout" not in {r["name"] for r in self.db.execute("PRAGMA table_info(dids)")}:
+            self.db.execute("ALTER TABLE dids ADD COLUMN timeout REAL")     # database from before it was kept
+
+    def close(self) -> None:
+        self.db.commit()
+        self.db.close()
+
+    def commit(self) -> None:
+        self.db.commit()
+
+    def record(self, vehicle: str, reply: Reply, target: str = "", timeout: Optional[float] = None) -> None:
+        """Store a reply; timeout is the ATST (s) the request went out with."""
+        if reply.status == ERROR:
+            return      # says nothing about the DID
+        now = time.time()
+        length = len(reply.payload) if reply.status == POSITIVE else None
+        self.db.execute("""
+            INSERT INTO dids (vehicle, target, did, status, responder, header, nrc, length, payload, raw,
+                              first_seen, last_seen, timeout)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (vehicle, target, did) DO UPDATE SET
+                status = excluded.status, responder = excluded.responder, header = excluded.header,
+                nrc = excluded.nrc, length = excluded.length, payload = excluded.payload, raw = excluded.raw,
+                last_seen = excluded.last_seen, count = count + 1, timeout = excluded.timeout
+        """, (vehicle, target, reply.did, reply.status, reply.responder, reply.header, reply.nrc, length,
+              reply.payload.hex().upper(), reply.raw, now, now, timeout))
+
+    def known(self, vehicle: str, target: str = "", full_timeout: float = 0.0) -> set[int]:
+        """
+        DIDs with a definite answer for this vehicle and target: no need to ask
+        again. NO DATA only counts if it was asked with an ATST of full_timeout.
+        """
+        rows = self.db.execute("SELECT did, status, nrc, timeout FROM dids WHERE vehicle = ? AND target = ?",
+                               (vehicle, target))
+        return {r["did"] for r in rows
+                if not _timed_out(r, full_timeout) and (r["status"] != NEGATIVE or r["nrc"] not in TRANSIENT_NRCS)}
+
+    def timed_out(self, vehicle: str, target: str, full_timeout: float) -> set[int]:
+        """DIDs that got NO DATA under an ATST shorter than full_timeout: they may just be slow."""
+        rows = self.db.execute("SELECT did, status, timeout FROM dids WHERE vehicle = ? AND target = ?",
+                               (vehicle, target))
+        return {r["did"] for r in rows if _timed_out(r, full_timeout)}
+
+    def rows(self, vehicle: Optional[str] = None, hits_only: bool = True,
+             target: Optional[str] = None) -> list[sqlite3.Row]:
+        sql = "SELECT * FROM dids WHERE 1 = 1"
+        args: list = []
+        if vehicle:
+            sql += " AND vehicle = ?"
+            args.append(vehicle)
+        if target is not None:
+            sql += " AND target = ?"
+            args.append(target)
+        if hits_only:
+            sql += " AND status = ?"
+            args.append(POSITIVE)
+        return self.db.execute(sql + " ORDER BY vehicle, target, did", args).fetchall()
+
+    def set_vehicle(self, vehicle: str, protocol: str = "") -> None:
+        self.db.execute("""
+            INSERT INTO vehicles (vehicle, protocol, updated) VALUES (?, ?, ?)
+            ON CONFLICT (vehicle) DO UPDATE SET
+                protocol = CASE WHEN excluded.protocol != '' THEN excluded.protocol ELSE protocol END,
+                updated = excluded.updated
+        """, (vehicle, protocol, time.time()))
+
+    def export_json(self, path: str) -> int:
+        rows = [dict(r) for r in self.rows(hits_only=False)]
+        with open(path, "w") as f:
+            json.dump(rows, f, indent=1)
+        return len(rows)
+
+
+def command_for(row, decoder, name: Optional[str] = None):
+    """
+    An OBDCommand for a positive scan row (a ScanDB row or Reply), sized from
+    the payload that came back: e.g. command_for(row, lambda messages: ...).
+    DIDs found behind a physical header keep it, so python-OBD sends ATSH first.
+    """
+    from obd import OBDCommand
+    from obd.protocols import ECU
+    if isinstance(row, sqlite3.Row):
+        did, length, target = row["did"], row["length"], row["target"]
+    else:
+        did, length, target = row.did, len(row.payload), ""
+    name = name or f"GM_DID_{did:04X}"
+    extra = {} if module_name(target) in ("functional", "pcm") else {"header": target.encode()}
+    return OBDCommand(name, f"Mode 22 DID {did:04X} ({module_name(target)})", f"22{did:04X}".encode(),
+                      3 + length, decoder, ecu=ECU.ENGINE if not extra else ECU.ALL, fast=False, **extra)
+
+
+def cmd_list(db: ScanDB, args) -> None:
+    rows = db.rows(args.vehicle, hits_only=not args.all)
+    if not rows:
+        print("[INFO] Nothing recorded" + (f" for {args.vehicle}" if args.vehicle else ""))
+        return
+    vehicle = None
+    for r in rows:
+        if r["vehicle"] != vehicle:
+            vehicle = r["vehicle"]
+            print(f"\n{vehicle}")
+        detail = ""
+        if r["status"] == POSITIVE:
+            detail = f"{r['length']} bytes  {r['payload']}"
+        elif r["status"] == NEGATIVE:
+            detail = NRC_NAMES.get(r["nrc"], f"NRC 0x{r['nrc']:02X}")
+        seen = time.strftime("%Y-%m-%d %H:%M", time.localtime(r["last_seen"]))
+        print(f"  22{r['did']:04X}  {module_name(r['target']):<10} {r['responder'] or '-':<4} {r['status']:<9} "
+              f"{detail:<28} x{r['count']:<3} {seen}")
+
+
+def cmd_command(db: ScanDB, args) -> None:
+    did = int(args.did[2:] if len(args.did) == 6 else args.did, 16)
+    rows = [r for r in db.rows(args.vehicle) if r["did"] == did]
+    if not rows:
+        raise ValueError(f"no positive reply recorded for 22{did:04X}")
+    for r in rows:
+        module = module_name(r["target"])
+        spec = {"command": f"GM_DID_{did:04X}", "did": f"{did:04X}",
+                "ecu": "pcm" if module == "functional" else module,
+                "value": "A" if r["length"] < 2 else "A*256 + B", "units": "", "hz": 1.0}
+        print(f"# {r['vehicle']}, {module} (answered by {r['responder'] or '?'}): "
+              f"{r['payload']} (payload bytes A, B, ...); discover_dids.py can suggest the value")
+        print(f'"did_{did:04x}": {json.dumps(spec)},')
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db", default=DB_PATH)
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("list", help="recorded DIDs (hits only unless --all)")
+    p.add_argument("--vehicle")
+    p.add_argument("--all", action="store_true")
+    p.set_defaults(func=cmd_list)
+
+    p = sub.add_parser("export", help="every row as JSON")
+    p.add_argument("output")
+    p.set_defaults(func=lambda db, a: print(f"[INFO] {db.export_json(a.output)} rows -> {a.output}"))
+
+    p = sub.add_parser("command", help="enhanced_pids.json entry for a hit")
+    p.add_argument("did", help="e.g. 22115C or 115C")
+    p.add_argument("--vehicle")
+    p.set_defaults(func=cmd_command)
+
+    args = ap.parse_args()
+    db = ScanDB(args.db)
+    try:
+        args.func(db, args)
+    except (ValueError, OSError) as e:
+        sys.exit(f"[ERROR] {e}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
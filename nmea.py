@@ -0,0 +1,79 @@
+"""
+nmea.py - Minimal NMEA 0183 decoding for the sentences the dash uses
+
+Handles RMC, VTG and GGA from any talker ($GP, $GN, $GL, ...). Checksums are
+validated and fields are sliced straight out of the raw bytes; no pynmea2
+message objects are built. See bench_nmea.py for the comparison.
+"""
+
+from typing import NamedTuple, Optional
+
+KNOTS_TO_MPH = 1.15078
+
+
+class Fix(NamedTuple):
+    sentence: str                   # "RMC", "VTG" or "GGA"
+    valid: bool                     # RMC status A / VTG mode not N / GGA quality > 0
+    speed_knots: Optional[float]    # RMC, VTG
+    course: Optional[float]         # true course in degrees (RMC, VTG)
+    fix_quality: Optional[int]      # GGA only (0 = no fix, 1 = GPS, 2 = DGPS, ...)
+
+
+def checksum_ok(line: bytes) -> bool:
+    """True if the *XX checksum matches the XOR of everything between $ and *."""
+    star = line.rfind(b"*")
+    if star < 1 or len(line) < star + 3:
+        return False
+    cs = 0
+    for b in line[1:star]:
+        cs ^= b
+    try:
+        return cs == int(line[star + 1:star + 3], 16)
+    except ValueError:
+        return False
+
+
+def _float(field: bytes) -> Optional[float]:
+    try:
+        return float(field) if field else None
+    except ValueError:
+        return None
+
+
+def parse(line: bytes) -> Optional[Fix]:
+    """
+    Decode one raw line (with or without the trailing CR/LF). Returns None for
+    other sentence types, bad checksums or garbage.
+    """
+    line = line.strip()
+    if len(line) < 7 or line[0] != 0x24:  # "$"
+        return None
+    kind = line[3:6]
+    if kind not in (b"RMC", b"VTG", b"GGA") or not checksum_ok(line):
+        return None
+
+    fields = line[:line.rfind(b"*")].split(b",")
+    try:
+        if kind == b"RMC":
+            # $xxRMC,time,status,lat,N,lon,E,speed_kn,course,date,...
+            return Fix("RMC", fields[2] == b"A", _float(fields[7]), _float(fields[8]), None)
+        if kind == b"VTG":
+            # $xxVTG,course_t,T,course_m,M,speed_kn,N,speed_kmh,K[,mode]
+            valid = len(fields) < 10 or fields[9] not in (b"N", b"")
+            return Fix("VTG", valid and fields[5] != b"", _float(fields[5]), _float(fields[1]), None)
+        # $xxGGA,time,lat,N,lon,E,quality,sats,hdop,alt,M,...
+        quality = int(fields[6]) if fields[6] else 0
+        return Fix("GGA", quality > 0, None, None, quality)
+    except (IndexError, ValueError):
+        return None
+
+
+def speed_mph(line: bytes) -> Optional[float]:
+    """
+    Speed in mph from an RMC/VTG line with a valid fix; None for anything else
+    (no fix is "no measurement", not 0 mph, so the speed fusion can tell).
+    """
+    fix = parse(line)
+    if fix is None or not fix.valid or fix.speed_knots is None:
+        return None
+    return fix.speed_knots * KNOTS_TO_MPH
@@ -6,25 +6,144 @@ Key fixes vs prior version:
 - Safer query helpers (handle None responses).
 - Defaults return 0 / empty values (better for a dash vs "44").
 - Battery now reports CONTROL_MODULE_VOLTAGE (if supported); fuel level is its own function.
-- Logging goes to /tmp/output.txt to reduce SD wear on Raspberry Pi.
+- Logging goes to /tmp/output.txt to reduce SD wear on Raspberry Pi, through a
+  buffered writer that batches, de-duplicates and rotates (dashlog.py).
+- Supported-PID bitmaps are parsed into a set of command names and cached per VIN/protocol.
+- Multi-PID Mode 01 batching on CAN (query_batch), single-PID fallback elsewhere.
+- PollScheduler interleaves getters by target refresh rate instead of a flat list per tick.
+- Every query is timed and its outcome counted per command (QUERY_STATS).
+- Mode 22 channels (oil pressure, ...) come from enhanced_pids.json instead of hand-written decoders.
 """
 
-from obd import OBDCommand
+from obd import OBDCommand, OBDResponse
 from obd.utils import bytes_to_int
-from obd.protocols import ECU
+from obd.protocols.protocol import Message
 import obd
-from typing import Any, Optional
+from typing import Any, Callable, Optional
+import collections
+import json
+import os
+import threading
+import time
+
+import enhanced_pids
+from dashlog import BufferedLog
 
 LOG_PATH = "/tmp/output.txt"
 
+# Small JSON caches that must survive reboots live on the SD card (written rarely)
+CACHE_DIR = os.path.expanduser("~/.cache/odb2-guages")
+
+# Supported-PID bitmaps per vehicle
+CAPABILITY_CACHE_PATH = os.path.join(CACHE_DIR, "capabilities.json")
+
+
+# Flushed in batches by a background thread; repeats are counted, not rewritten
+LOG = BufferedLog(LOG_PATH)
+
 
 def _log(msg: str) -> None:
+    LOG.write(msg)
+
+
+# ---- Query instrumentation ----
+
+OK = "ok"                   # decoded value
+NONE = "none"               # ECU replied but nothing decodable came back
+TIMEOUT = "timeout"         # no reply at all (NO DATA / ATST ran out)
+ERROR = "error"             # exception in python-OBD or a decoder
+UNSUPPORTED = "unsupported" # python-OBD refused to send it
+OUTCOMES = (OK, NONE, TIMEOUT, ERROR, UNSUPPORTED)
+
+
+class _CommandStats:
+    __slots__ = ("latencies", "outcomes", "last_ok", "last_value")
+
+    def __init__(self):
+        self.latencies = collections.deque(maxlen=256)
+        self.outcomes = dict.fromkeys(OUTCOMES, 0)
+        self.last_ok: Optional[float] = None
+        self.last_value: Any = None
+
+
+class QueryStats:
+    """Per-command latency and outcome counters, safe to read from any thread."""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._commands: dict[str, _CommandStats] = {}
+
+    def record(self, name: str, latency: float, outcome: str, value: Any = None) -> None:
+        with self._lock:
+            stats = self._commands.get(name)
+            if stats is None:
+                stats = self._commands[name] = _CommandStats()
+            stats.outcomes[outcome] += 1
+            if outcome != UNSUPPORTED:
+                stats.latencies.append(latency)
+            if outcome == OK:
+                stats.last_ok = self._clock()
+                stats.last_value = value
+
+    def reset(self) -> None:
+        with self._lock:
+            self._commands.clear()
+
+    def rows(self) -> list[dict]:
+        """One dict per command: counts, success rate, latency percentiles (ms), last good age (s)."""
+        now = self._clock()
+        with self._lock:
+            snapshot = [(name, sorted(s.latencies), dict(s.outcomes), s.last_ok, s.last_value)
+                        for name, s in sorted(self._commands.items())]
+        rows = []
+        for name, lat, outcomes, last_ok, last_value in snapshot:
+            total = sum(outcomes.values())
+
+            def pct(q):
+                return lat[min(len(lat) - 1, int(q * len(lat)))] * 1000 if lat else 0.0
+            rows.append({
+                "command": name, "count": total, **outcomes,
+                "success": outcomes[OK] / total if total else 0.0,
+                "p50_ms": pct(0.50), "p95_ms": pct(0.95), "max_ms": lat[-1] * 1000 if lat else 0.0,
+                "last_ok_age": None if last_ok is None else now - last_ok,
+                "last_value": last_value,
+            })
+        return rows
+
+    def table(self) -> str:
+        lines = [f"{'command':<24} {'n':>6} {'ok%':>5} {'none':>5} {'t/o':>5} {'err':>4} {'unsup':>5} "
+                 f"{'p50':>6} {'p95':>6} {'max':>6} {'age':>6}"]
+        for r in self.rows():
+            age = "-" if r["last_ok_age"] is None else f"{r['last_ok_age']:.1f}"
+            lines.append(f"{r['command'][:24]:<24} {r['count']:6d} {100 * r['success']:5.0f} {r[NONE]:5d} "
+                         f"{r[TIMEOUT]:5d} {r[ERROR]:4d} {r[UNSUPPORTED]:5d} "
+                         f"{r['p50_ms']:6.0f} {r['p95_ms']:6.0f} {r['max_ms']:6.0f} {age:>6}")
+        return "\n".join(lines)
+
+
+QUERY_STATS = QueryStats()
+
+
+def timed_query(connection: obd.OBD, command: OBDCommand, force: bool = False) -> OBDResponse:
+    """connection.query() with its latency and outcome recorded in QUERY_STATS. Exceptions propagate."""
+    if not force and not connection.supports(command):
+        QUERY_STATS.record(command.name, 0.0, UNSUPPORTED)
+        return OBDResponse()
+    start = time.perf_counter()
     try:
-        with open(LOG_PATH, "a") as f:
-            f.write(msg.rstrip() + "\n")
+        resp = connection.query(command, force=force)
     except Exception:
-        # Never let logging crash the dash
-        pass
+        QUERY_STATS.record(command.name, time.perf_counter() - start, ERROR)
+        raise
+    latency = time.perf_counter() - start
+    if resp is None or not resp.messages:
+        QUERY_STATS.record(command.name, latency, TIMEOUT)
+    elif resp.value is None:
+        QUERY_STATS.record(command.name, latency, NONE)
+    else:
+        QUERY_STATS.record(command.name, latency, OK, resp.value)
+    return resp
 
 
 def query_match_pids(connection: obd.OBD, pidlist: list[str], command: obd.OBDCommand) -> str:
@@ -33,7 +152,8 @@ def query_match_pids(connection: obd.OBD, pidlist: list[str], command: obd.OBDCo
     Returns a string of 0/1 bits, or "" on failure.
     """
     try:
-        resp = connection.query(command)
+        # Forced: after a re-link python-OBD hasn't loaded PIDS_B/C support itself
+        resp = timed_query(connection, command, force=True)
         response = resp.value
         if response is None:
             _log(f"[WARN] Supported PID query returned None for {command}")
@@ -41,10 +161,8 @@ def query_match_pids(connection: obd.OBD, pidlist: list[str], command: obd.OBDCo
 
         bit_string = "".join("1" if bit else "0" for bit in response)
 
-        _log(f"Command: {command}")
-        _log(f"Length of bit response: {len(response)}")
-        _log(f"Length of name list: {len(pidlist)}")
-        _log(f"Supported bits: {bit_string}")
+        # One line per bitmap, so the log's dedupe only folds a true repeat of the same read
+        _log(f"{command.name}: {len(response)} bits for {len(pidlist)} names, supported {bit_string}")
 
         for index, bit in enumerate(response):
             if bit:
@@ -59,6 +177,21 @@ def query_match_pids(connection: obd.OBD, pidlist: list[str], command: obd.OBDCo
         return ""
 
 
+def supported_names(command: obd.OBDCommand, bit_string: str) -> set[str]:
+    """
+    Turn a PIDS_x / MIDS_x bit string into the names of the supported commands.
+    Bit 0 of PIDS_A (PID 00) is PID 01, bit 0 of PIDS_B (PID 20) is PID 21, etc.
+    """
+    names = set()
+    for index, bit in enumerate(bit_string):
+        if bit != "1":
+            continue
+        pid = command.pid + index + 1
+        if obd.commands.has_pid(command.mode, pid):
+            names.add(obd.commands[command.mode][pid].name)
+    return names
+
+
 def _value_or_default(resp: Any, default: Any) -> Any:
     if resp is None:
         return default
@@ -74,41 +207,59 @@ def _value_or_default(resp: Any, default: Any) -> Any:
         return default
 
 
-def query_obd(connection: obd.OBD, command: obd.OBDCommand, default_value: float, error_message: str) -> float:
+def query_obd(connection: obd.OBD, command: obd.OBDCommand, default_value: Optional[float],
+              error_message: str) -> Optional[float]:
     """Query an OBD command and return a numeric magnitude; default on errors."""
     try:
-        resp = connection.query(command)
-        return float(_value_or_default(resp, default_value))
+        resp = timed_query(connection, command)
+        v = _value_or_default(resp, default_value)
+        return None if v is None else float(v)
     except Exception as e:
         _log(f"[ERROR] {error_message}: {e}")
-        return float(default_value)
+        return default_value
 
 
-def query_speed_mph(connection: obd.OBD, command: obd.OBDCommand, default_value: float, error_message: str) -> float:
+def query_speed_mph(connection: obd.OBD, command: obd.OBDCommand, default_value: Optional[float],
+                    error_message: str) -> Optional[float]:
     """Query a speed command and return mph; default on errors."""
     try:
-        resp = connection.query(command)
+        resp = timed_query(connection, command)
         if resp.value is None:
-            return float(default_value)
+            return default_value
         return float(resp.value.to("mph").magnitude)
     except Exception as e:
         _log(f"[ERROR] {error_message}: {e}")
-        return float(default_value)
+        return default_value
+
+
+def _round(v: Optional[float], ndigits: int) -> Optional[float]:
+    return None if v is None else round(v, ndigits)
 
 
-def get_supported_pids_mode01(connection: obd.OBD) -> None:
+# PIDS_A bits 1..32 (PID 01..20)
+PIDS_A_NAMES = [
+    "STATUS", "FREEZE_DTC", "FUEL_STATUS", "ENGINE_LOAD", "COOLANT_TEMP",
+    "SHORT_FUEL_TRIM_1", "LONG_FUEL_TRIM_1", "SHORT_FUEL_TRIM_2", "LONG_FUEL_TRIM_2",
+    "FUEL_PRESSURE", "INTAKE_PRESSURE", "RPM", "SPEED", "TIMING_ADVANCE",
+    "INTAKE_TEMP", "MAF", "THROTTLE_POS", "AIR_STATUS", "O2_SENSORS", "O2_B1S1",
+    "O2_B1S2", "O2_B1S3", "O2_B1S4", "O2_B2S1", "O2_B2S2", "O2_B2S3", "O2_B2S4",
+    "OBD_COMPLIANCE", "O2_SENSORS_ALT", "AUX_INPUT_STATUS", "RUN_TIME", "PIDS_B"
+]
+
+
+def get_supported_pids_mode01(connection: obd.OBD, pids_a: str = "") -> tuple[set[str], bool]:
+    """
+    Supported Mode 01 command names, and whether every bitmap was read:
+    PIDS_A (pids_a if it was already read), then PIDS_B / PIDS_C as far as
+    the previous bitmap says they exist. When one of them doesn't answer,
+    everything from it on counts as supported (unknown) for this session, and
+    the result mustn't be cached.
+    """
     cmd1 = obd.commands.PIDS_A
     cmd2 = obd.commands.PIDS_B
     cmd3 = obd.commands.PIDS_C
 
-    pid_list1 = [
-        "STATUS", "FREEZE_DTC", "FUEL_STATUS", "ENGINE_LOAD", "COOLANT_TEMP",
-        "SHORT_FUEL_TRIM_1", "LONG_FUEL_TRIM_1", "SHORT_FUEL_TRIM_2", "LONG_FUEL_TRIM_2",
-        "FUEL_PRESSURE", "INTAKE_PRESSURE", "RPM", "SPEED", "TIMING_ADVANCE",
-        "INTAKE_TEMP", "MAF", "THROTTLE_POS", "AIR_STATUS", "O2_SENSORS", "O2_B1S1",
-        "O2_B1S2", "O2_B1S3", "O2_B1S4", "O2_B2S1", "O2_B2S2", "O2_B2S3", "O2_B2S4",
-        "OBD_COMPLIANCE", "O2_SENSORS_ALT", "AUX_INPUT_STATUS", "RUN_TIME", "PIDS_B"
-    ]
+    pid_list1 = PIDS_A_NAMES
 
     pid_list2 = [
         "DISTANCE_W_MIL", "FUEL_RAIL_PRESSURE_VAC", "FUEL_RAIL_PRESSURE_DIRECT",
@@ -133,12 +284,30 @@ def get_supported_pids_mode01(connection: obd.OBD) -> None:
         "OIL_TEMP", "FUEL_INJECT_TIMING", "FUEL_RATE"
     ]
 
-    query_match_pids(connection, pid_list1, cmd1)
-    query_match_pids(connection, pid_list2, cmd2)
-    query_match_pids(connection, pid_list3, cmd3)
-
-
-def get_supported_pids_mode06(connection: obd.OBD) -> None:
+    supported = set()
+    bitmaps = ((pid_list1, cmd1), (pid_list2, cmd2), (pid_list3, cmd3))
+    for i, (pid_list, cmd) in enumerate(bitmaps):
+        if i and bitmaps[i][1].name not in supported:
+            break   # the previous bitmap says there is no next one
+        bit_string = pids_a if i == 0 and pids_a else query_match_pids(connection, pid_list, cmd)
+        if not bit_string:
+            _log(f"[WARN] {cmd.name} didn't answer; polling its PIDs and later ones without knowing")
+            for unread, _ in bitmaps[i:]:
+                supported |= {name for name in unread if name in obd.commands}
+            return supported, False
+        supported |= supported_names(cmd, bit_string)
+    return supported, True
+
+
+def get_supported_pids_mode06(connection: obd.OBD) -> tuple[set[str], bool]:
+    """
+    Supported Mode 06 monitor names, and whether every MIDS bitmap that should
+    exist answered (same rules as get_supported_pids_mode01). Only asked on CAN:
+    J1850 and K-line vehicles don't have this Mode 06, and each MIDS query
+    would just time out.
+    """
+    if connection.protocol_id() not in CAN_PROTOCOL_IDS:
+        return set(), True
     commands_and_mids = {
         "MIDS_A": {
             "cmd": obd.commands.MIDS_A,
@@ -174,84 +343,217 @@ def get_supported_pids_mode06(connection: obd.OBD) -> None:
         "MIDS_F": {"cmd": obd.commands.MIDS_F, "mids": ["MIDS_G"]},
     }
 
-    for value in commands_and_mids.values():
-        query_match_pids(connection, value["mids"], value["cmd"])
+    supported = set()
+    for i, value in enumerate(commands_and_mids.values()):
+        cmd = value["cmd"]
+        if i and cmd.name not in supported:
+            break   # the previous bitmap says there is no next one
+        bit_string = query_match_pids(connection, value["mids"], cmd)
+        if not bit_string:
+            return supported, False
+        supported |= supported_names(cmd, bit_string)
+    return supported, True
+
+
+# ---- Capability cache (per VIN / protocol) ----
+
+def get_vin(connection: obd.OBD) -> str:
+    # Mode 09 isn't in the PIDS_x bitmaps, so force it; "" if the ECU won't say
+    try:
+        resp = timed_query(connection, obd.commands.VIN, force=True)
+        if resp is None or resp.value is None:
+            return ""
+        v = resp.value
+        if isinstance(v, (bytes, bytearray)):
+            v = v.decode("ascii", errors="ignore")
+        return str(v).strip().strip("\x00")
+    except Exception as e:
+        _log(f"[ERROR] Error receiving VIN: {e}")
+        return ""
+
+
+def _capability_key(vin: str, protocol_id: str, pids_a: str) -> Optional[str]:
+    """
+    Cache key for a vehicle: its VIN, or without one (no Mode 09 on older VPW
+    trucks, a VIN read that failed) its PIDS_A bitmap. None if neither is known.
+    """
+    if vin:
+        return f"{vin}/{protocol_id or '?'}"
+    if pids_a:
+        return f"PIDS_A:{int(pids_a, 2):08X}/{protocol_id or '?'}"
+    return None
+
+
+def read_json_cache(path: str) -> dict:
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def write_json_cache(path: str, data: dict) -> None:
+    # Write-then-rename so a power cut mid-write can't leave a truncated cache
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+    except OSError as e:
+        _log(f"[ERROR] Could not write {path}: {e}")
+
+
+def load_capabilities(vin: str, protocol_id: str, pids_a: str,
+                      path: str = CAPABILITY_CACHE_PATH) -> Optional[set[str]]:
+    """The cached set, if there is one and it was saved with the same PIDS_A bitmap as this vehicle's."""
+    key = _capability_key(vin, protocol_id, pids_a)
+    entry = read_json_cache(path).get(key) if key and pids_a else None
+    if not entry:
+        return None
+    if entry.get("pids_a") != pids_a:
+        _log(f"[INFO] Cached capabilities for {key} don't match this vehicle's PIDS_A; rediscovering")
+        return None
+    return set(entry.get("supported", []))
+
+
+def save_capabilities(vin: str, protocol_id: str, pids_a: str, supported: set[str],
+                      path: str = CAPABILITY_CACHE_PATH) -> None:
+    key = _capability_key(vin, protocol_id, pids_a)
+    if key is None:
+        return
+    data = read_json_cache(path)
+    data[key] = {
+        "supported": sorted(supported),
+        "pids_a": pids_a,
+        "saved": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    write_json_cache(path, data)
+
+
+def discover_capabilities(connection: obd.OBD, path: Optional[str] = CAPABILITY_CACHE_PATH) -> set[str]:
+    """
+    Supported command names for the connected vehicle. Uses the cached set when
+    this VIN/protocol has been seen before; otherwise queries the PIDS/MIDS
+    bitmaps once and stores the result (path None: always query, never store).
+    PIDS_A is read every time: it keys the entry when there is no VIN and has
+    to match the cached one, so another vehicle's support set is never used.
+    The PCM's enhanced_pids commands are registered with python-OBD as well.
+    """
+    register_enhanced(connection)
+    vin = get_vin(connection)
+    protocol_id = connection.protocol_id()
+    pids_a = query_match_pids(connection, PIDS_A_NAMES, obd.commands.PIDS_A)
+    supported = load_capabilities(vin, protocol_id, pids_a, path) if path else None
+    if supported is not None:
+        _log(f"[INFO] Loaded {len(supported)} supported commands for "
+             f"{_capability_key(vin, protocol_id, pids_a)} from cache")
+    else:
+        supported, complete = get_supported_pids_mode01(connection, pids_a)
+        monitors, monitors_complete = get_supported_pids_mode06(connection)
+        supported |= monitors
+        if complete and monitors_complete and path:
+            # A bitmap that didn't answer would leave its channels out on every later connect
+            save_capabilities(vin, protocol_id, pids_a, supported, path)
+
+    # Let python-OBD send them too; its own support table is empty when the
+    # connection was re-linked rather than freshly opened
+    connection.supported_commands.update(obd.commands[name] for name in supported if name in obd.commands)
+    return supported
 
 
 # ---- Individual getters used by dashboard ----
+#
+# Every getter returns `default` when the read fails. The dash passes None so
+# a failed read (NO DATA, decode error) can be told apart from a real 0 and the
+# last good value held instead (see acquisition.AcquisitionWorker).
 
-def get_speed(connection: obd.OBD) -> float:
-    return query_speed_mph(connection, obd.commands.SPEED, 0.0, "Error receiving speed")
+def get_speed(connection: obd.OBD, default: Optional[float] = 0.0) -> Optional[float]:
+    return query_speed_mph(connection, obd.commands.SPEED, default, "Error receiving speed")
 
 
-def get_rpm(connection: obd.OBD) -> float:
+def get_rpm(connection: obd.OBD, default: Optional[float] = 0.0) -> Optional[float]:
     # Returns RPM (dashboard divides by 1000 to display "x1000")
-    return query_obd(connection, obd.commands.RPM, 0.0, "Error receiving RPM")
+    return query_obd(connection, obd.commands.RPM, default, "Error receiving RPM")
 
 
-def get_temperature(connection: obd.OBD) -> float:
+def get_temperature(connection: obd.OBD, default: Optional[float] = 0.0) -> Optional[float]:
     # python-OBD returns coolant temp in °C; convert to °F for the dash
     try:
-        r = connection.query(obd.commands.COOLANT_TEMP)
+        r = timed_query(connection, obd.commands.COOLANT_TEMP)
         if r is None or r.value is None:
-            return 0.0
+            return default
         # Pint Quantity supports .to("degF")
         return float(r.value.to("degF").magnitude).__round__(1)
     except Exception:
-        return 0.0
+        return default
 
 
-def get_fuel_level(connection: obd.OBD) -> float:
+def get_fuel_level(connection: obd.OBD, default: Optional[float] = 0.0) -> Optional[float]:
     # 0-100 (%)
-    return round(query_obd(connection, obd.commands.FUEL_LEVEL, 0.0, "Error receiving fuel level"), 0)
+    return _round(query_obd(connection, obd.commands.FUEL_LEVEL, default, "Error receiving fuel level"), 0)
 
 
-def get_battery_voltage(connection: obd.OBD) -> float:
+def get_battery_voltage(connection: obd.OBD, default: Optional[float] = 0.0) -> Optional[float]:
     # Typical running 13.5-14.6V, key-on ~12.0-12.8V
-    return round(query_obd(connection, obd.commands.CONTROL_MODULE_VOLTAGE, 0.0, "Error receiving module voltage"), 1)
+    return _round(query_obd(connection, obd.commands.CONTROL_MODULE_VOLTAGE, default,
+                            "Error receiving module voltage"), 1)
 
 
 # Backwards-compatible name used by your dashboard originally
-def get_battery(connection: obd.OBD) -> float:
-    return get_battery_voltage(connection)
+def get_battery(connection: obd.OBD, default: Optional[float] = 0.0) -> Optional[float]:
+    return get_battery_voltage(connection, default)
 
 
-def get_intake_pressure(connection: obd.OBD) -> float:
-    return query_obd(connection, obd.commands.INTAKE_PRESSURE, 0.0, "Error receiving intake pressure")
+def get_intake_pressure(connection: obd.OBD, default: Optional[float] = 0.0) -> Optional[float]:
+    return query_obd(connection, obd.commands.INTAKE_PRESSURE, default, "Error receiving intake pressure")
 
 
-def get_intake_temp(connection: obd.OBD) -> float:
-    return query_obd(connection, obd.commands.INTAKE_TEMP, 0.0, "Error receiving intake temperature")
+def get_intake_temp(connection: obd.OBD, default: Optional[float] = 0.0) -> Optional[float]:
+    return query_obd(connection, obd.commands.INTAKE_TEMP, default, "Error receiving intake temperature")
 
 
-def get_runtime(connection: obd.OBD) -> float:
-    return query_obd(connection, obd.commands.RUN_TIME, 0.0, "Error receiving engine runtime")
+def get_runtime(connection: obd.OBD, default: Optional[float] = 0.0) -> Optional[float]:
+    return query_obd(connection, obd.commands.RUN_TIME, default, "Error receiving engine runtime")
 
 
-def get_throttle_pos(connection: obd.OBD) -> float:
-    return query_obd(connection, obd.commands.THROTTLE_POS, 0.0, "Error receiving throttle position")
+def get_throttle_pos(connection: obd.OBD, default: Optional[float] = 0.0) -> Optional[float]:
+    return query_obd(connection, obd.commands.THROTTLE_POS, default, "Error receiving throttle position")
 
 
-def get_absolute_load(connection: obd.OBD) -> float:
-    return query_obd(connection, obd.commands.ABSOLUTE_LOAD, 0.0, "Error receiving absolute load")
+def get_absolute_load(connection: obd.OBD, default: Optional[float] = 0.0) -> Optional[float]:
+    return query_obd(connection, obd.commands.ABSOLUTE_LOAD, default, "Error receiving absolute load")
 
 
-def get_engine_load(connection: obd.OBD) -> float:
-    return query_obd(connection, obd.commands.ENGINE_LOAD, 0.0, "Error receiving engine load")
+def get_engine_load(connection: obd.OBD, default: Optional[float] = 0.0) -> Optional[float]:
+    return query_obd(connection, obd.commands.ENGINE_LOAD, default, "Error receiving engine load")
 
 
-def get_barometric_pressure(connection: obd.OBD) -> float:
-    return query_obd(connection, obd.commands.BAROMETRIC_PRESSURE, 0.0, "Error receiving barometric pressure")
+def get_barometric_pressure(connection: obd.OBD, default: Optional[float] = 0.0) -> Optional[float]:
+    return query_obd(connection, obd.commands.BAROMETRIC_PRESSURE, default, "Error receiving barometric pressure")
 
 
-def get_accelerator_pos(connection: obd.OBD) -> float:
-    # Use one of the accelerator position PIDs if supported; fall back to 0
-    return query_obd(connection, obd.commands.ACCELERATOR_POS_D, 0.0, "Error receiving accelerator position")
+def get_accelerator_pos(connection: obd.OBD, default: Optional[float] = 0.0) -> Optional[float]:
+    # Use one of the accelerator position PIDs if supported; fall back to default
+    return query_obd(connection, obd.commands.ACCELERATOR_POS_D, default, "Error receiving accelerator position")
+
+
+def get_status(connection: obd.OBD) -> Optional[tuple[bool, int]]:
+    # (MIL on, DTC count) from Mode 01 PID 01; None when the read fails
+    try:
+        resp = timed_query(connection, obd.commands.STATUS)
+        if resp is None or resp.value is None:
+            return None
+        return bool(resp.value.MIL), int(resp.value.DTC_count)
+    except Exception as e:
+        _log(f"[ERROR] Error receiving status: {e}")
+        return None
 
 
 def get_fuel_type(connection: obd.OBD) -> str:
     try:
-        resp = connection.query(obd.commands.FUEL_TYPE)
+        resp = timed_query(connection, obd.commands.FUEL_TYPE)
         if resp.value is None:
             return ""
         return str(resp.value)
@@ -260,54 +562,228 @@ def get_fuel_type(connection: obd.OBD) -> str:
         return ""
 
 
-def _decode_gm_oil_pressure(messages):
-    """
-    Decode GM enhanced PID 22115C response.
+# ---- Enhanced (Mode 22) channels, defined in enhanced_pids.json ----
 
-    Typical response payload:
-      62 11 5C A
-    where A is the value byte.
+def register_enhanced(connection: obd.OBD) -> None:
+    """Add the PCM's enhanced commands to python-OBD's support table (it won't send them otherwise)."""
+    commands = (pid.command for pid in enhanced_pids.DEFINITIONS.values())
+    connection.supported_commands.update(cmd for cmd in commands if cmd is not None)
 
-    Formula widely reported for 2005 GM trucks:
-      psi = (A * 0.65) - 17.5
-    """
-    if not messages:
-        return None
-    try:
-        data = messages[0].data  # bytearray
-        # Look for: 62 11 5C A
-        if len(data) >= 4 and data[0] == 0x62 and data[1] == 0x11 and data[2] == 0x5C:
-            A = data[3]
-        else:
-            # Fallback: last byte as A
-            A = data[-1]
-
-        psi = (A * 0.65) - 17.5
-        if psi < 0:
-            psi = 0.0
-        return float(psi)
-    except Exception:
-        return None
 
-# Define the custom command once
-GM_OIL_PRESSURE = OBDCommand(
-    "GM_OIL_PRESSURE",
-    "GM Enhanced Oil Pressure (psi) via Mode 22 PID 115C",
-    "22115C",
-    4,                       # bytes_returned (positional)
-    _decode_gm_oil_pressure,
-    ecu=ECU.ENGINE,
-    fast=False
-)
-
-def get_oil_pressure(connection):
+def get_enhanced(connection: obd.OBD, channel: str, default: Optional[float] = 0.0) -> Optional[float]:
     """
-    Returns oil pressure in PSI using GM enhanced Mode 22 PID 22115C.
+    Value of an enhanced_pids channel, e.g. get_enhanced(connection, "oil_pressure")
+    in psi. PCM channels only: other modules need an ATSH, which only elm_raw sends.
     """
+    pid = enhanced_pids.DEFINITIONS[channel]
+    command = pid.command
+    if command is None:
+        QUERY_STATS.record(pid.name, 0.0, UNSUPPORTED)     # read through elm_raw.getter instead
+        return default
     try:
-        r = connection.query(GM_OIL_PRESSURE)
+        r = timed_query(connection, command)
         if r is None or r.value is None:
-            return 0.0
+            return default
         return float(r.value)
-    except Exception:
-        return 0.0
+    except Exception as e:
+        _log(f"[ERROR] Error receiving {pid.name}: {e}")
+        return default
+
+
+def enhanced_getter(channel: str) -> Callable[..., Optional[float]]:
+    """get_enhanced bound to one channel: getter(connection, default=0.0), like the getters above."""
+    def get(connection: obd.OBD, default: Optional[float] = 0.0) -> Optional[float]:
+        return get_enhanced(connection, channel, default)
+    get.__name__ = f"get_{channel}"
+    return get
+
+
+# ---- Multi-PID batching (CAN only) ----
+
+# ELM327 protocol ids for the ISO 15765-4 / SAE J1939 CAN variants
+CAN_PROTOCOL_IDS = {"6", "7", "8", "9", "A", "B", "C"}
+
+# ISO 15765-4 allows up to six PIDs in one Mode 01 request
+MAX_PIDS_PER_REQUEST = 6
+
+
+def supports_multi_pid(connection: obd.OBD) -> bool:
+    """Multi-PID requests only exist on CAN; J1850 VPW/PWM and K-line take one PID at a time."""
+    return connection.protocol_id() in CAN_PROTOCOL_IDS
+
+
+def _split_multi_pid(messages: list, by_pid: dict[int, OBDCommand]) -> dict[int, list]:
+    """
+    Split combined responses ("41 0C A B 0D A 11 A ...") into one single-PID
+    Message per PID, so each command's normal decoder can be reused.
+    """
+    parts: dict[int, list] = {}
+    for m in messages:
+        data = m.data
+        if len(data) < 2 or data[0] != 0x41:
+            continue
+        i = 1
+        while i < len(data):
+            cmd = by_pid.get(data[i])
+            if cmd is None:
+                # Unknown PID, so we can't tell how long its data is; stop here
+                break
+            n = cmd.bytes - 2  # bytes includes the mode and PID bytes
+            if i + 1 + n > len(data):
+                break
+            part = Message(m.frames)
+            part.ecu = m.ecu
+            part.data = bytearray([0x41, data[i]]) + data[i + 1:i + 1 + n]
+            parts.setdefault(data[i], []).append(part)
+            i += 1 + n
+    return parts
+
+
+def query_multi_pid(connection: obd.OBD, commands: list[OBDCommand]) -> dict[OBDCommand, OBDResponse]:
+    """
+    Query Mode 01 commands up to six at a time in combined requests.
+    PIDs missing from the reply come back as null responses.
+    """
+    results = {}
+    for start in range(0, len(commands), MAX_PIDS_PER_REQUEST):
+        chunk = commands[start:start + MAX_PIDS_PER_REQUEST]
+        by_pid = {c.pid: c for c in chunk}
+        request = b"01" + b"".join(c.command[2:] for c in chunk)
+        started = time.perf_counter()
+        try:
+            messages = connection.interface.send_and_parse(request) or []
+        except Exception:
+            for c in chunk:
+                QUERY_STATS.record(c.name, time.perf_counter() - started, ERROR)
+            raise
+        latency = time.perf_counter() - started
+        parts = _split_multi_pid(messages, by_pid)
+        for c in chunk:
+            results[c] = c(parts[c.pid]) if c.pid in parts else OBDResponse(c)
+            # Every PID in the chunk shared the one request, so they share its latency
+            value = results[c].value
+            outcome = OK if value is not None else (NONE if c.pid in parts else TIMEOUT)
+            QUERY_STATS.record(c.name, latency, outcome, value)
+    return results
+
+
+def query_batch(connection: obd.OBD, commands: list[OBDCommand]) -> dict[OBDCommand, OBDResponse]:
+    """Query several Mode 01 commands: batched on CAN, one request each otherwise."""
+    if supports_multi_pid(connection):
+        try:
+            return query_multi_pid(connection, commands)
+        except Exception as e:
+            _log(f"[ERROR] Multi-PID request failed, falling back to single PIDs: {e}")
+    return {c: timed_query(connection, c) for c in commands}
+
+
+def probe_multi_pid(connection: obd.OBD, commands: list[OBDCommand]) -> bool:
+    """True if the ECU actually answers a combined request (some CAN ECUs only return the first PID)."""
+    if not supports_multi_pid(connection) or len(commands) < 2:
+        return False
+    try:
+        responses = query_multi_pid(connection, commands[:2])
+        return all(r.value is not None for r in responses.values())
+    except Exception as e:
+        _log(f"[ERROR] Multi-PID probe failed: {e}")
+        return False
+
+
+def _dash_value(command: OBDCommand, resp: OBDResponse, default_value: Optional[float] = 0.0) -> Optional[float]:
+    """Same units the single getters return (speed in mph, everything else as decoded)."""
+    try:
+        if resp is None or resp.value is None:
+            return default_value
+        if command == obd.commands.SPEED:
+            return float(resp.value.to("mph").magnitude)
+        return float(_value_or_default(resp, default_value))
+    except Exception as e:
+        _log(f"[ERROR] Error decoding {command.name}: {e}")
+        return default_value
+
+
+def get_batch(connection: obd.OBD, channels: dict[str, OBDCommand],
+              default: Optional[float] = 0.0) -> dict[str, Optional[float]]:
+    """Query a {channel name: command} group in one go and return dashboard values."""
+    responses = query_batch(connection, list(channels.values()))
+    return {name: _dash_value(cmd, responses.get(cmd), default) for name, cmd in channels.items()}
+
+
+# ---- Poll scheduling ----
+
+class _ScheduledGetter:
+    __slots__ = ("name", "getter", "period", "next_due", "count")
+
+    def __init__(self, name: str, getter: Callable[[obd.OBD], Any], period: float, next_due: float):
+        self.name = name
+        self.getter = getter
+        self.period = period
+        self.next_due = next_due
+        self.count = 0
+
+
+class PollScheduler:
+    """
+    Interleaves getters by target refresh rate.
+
+    Each getter is registered with a rate in Hz and poll_next() always runs the
+    getter with the earliest due time. When the bus can't keep up (VPW manages
+    roughly 10-15 requests/s) every channel falls behind together, so the
+    available bandwidth is shared in proportion to the requested rates: RPM at
+    20 Hz gets 600x the slots of baro every 30 s instead of one slot per tick
+    like everything else.
+    """
+
+    # How far behind the schedule may drift before it is re-based. Keeps a
+    # saturated bus from building a backlog that would later be polled in a burst.
+    MAX_LAG = 0.25
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._entries: list[_ScheduledGetter] = []
+
+    def register(self, name: str, getter: Callable[[obd.OBD], Any], hz: float) -> None:
+        if hz <= 0:
+            raise ValueError(f"refresh rate for {name} must be positive, got {hz}")
+        # Everything is due immediately so the first pass fills every channel
+        self._entries.append(_ScheduledGetter(name, getter, 1.0 / hz, self._clock()))
+
+    def names(self) -> list[str]:
+        return [e.name for e in self._entries]
+
+    def reset(self) -> None:
+        """Make every getter due now (e.g. after a reconnect)."""
+        now = self._clock()
+        for e in self._entries:
+            e.next_due = now
+            e.count = 0
+
+    def time_until_due(self) -> float:
+        """Seconds until the next getter is due (0 if one is already overdue)."""
+        if not self._entries:
+            return float("inf")
+        return max(0.0, min(e.next_due for e in self._entries) - self._clock())
+
+    def poll_next(self, connection: obd.OBD) -> Optional[tuple[str, Any]]:
+        """Run the most overdue getter. Returns (name, value), or None if nothing is due yet."""
+        if not self._entries:
+            return None
+        entry = min(self._entries, key=lambda e: e.next_due)
+        now = self._clock()
+        if entry.next_due > now:
+            return None
+
+        lag = now - entry.next_due
+        if lag > self.MAX_LAG:
+            # Shift everyone by the same amount so relative order (and share) is kept
+            shift = lag - self.MAX_LAG
+            for e in self._entries:
+                e.next_due += shift
+
+        value = entry.getter(connection)
+        entry.count += 1
+        entry.next_due += entry.period
+        return entry.name, value
+
+    def counts(self) -> dict[str, int]:
+        return {e.name: e.count for e in self._entries}
@@ -0,0 +1,345 @@
+"""
+replay.py - Drive the dashboard from a recording instead of the truck
+
+ReplayWorker is a drop-in for acquisition.AcquisitionWorker: same
+snapshotReady(Snapshot) signal and stop(), so dashboard.py wires it up the
+same way (python3 dashboard.py --replay trip.bin --speed 10). GPS speed in the
+recording comes out of gpsSpeed(float) instead of the serial reader.
+
+Two sources are understood:
+- trip_recorder .bin trip or ring files (every sample, original timestamps)
+- ELM327 text transcripts, decoded into the same units the live dash's
+  getters return (elm_raw's decoders). Either the terminal form
+      [12.345] >010C
+      [12.389] 41 0C 1A F8
+  (timestamps optional, "[12]" or "12.345"; headers, echo and SEARCHING... are tolerated) or a
+  python-OBD debug log with "write: b'010C\\r'" / "read: b'41 0C 1A F8\\r\\r>'"
+  lines. Without timestamps requests are spaced 1 / TRANSCRIPT_RATE apart.
+
+Snapshots are published every `interval` of wall time and carry interval*speed
+of recorded time, so the UI sees its normal 20 Hz cadence at any replay speed.
+
+  python3 replay.py obd-debug.log       # what a recording decodes to
+"""
+
+import argparse
+import ast
+import re
+import sys
+import threading
+import time
+from types import MappingProxyType
+from typing import Iterable, Iterator, Optional
+
+from PyQt5.QtCore import QThread, pyqtSignal
+import obd
+from obd.protocols import ECU
+from obd.protocols.protocol import Message
+
+import elm_raw
+import enhanced_pids
+import py_obd
+import trip_recorder
+from acquisition import CHANNELS, FAST_BATCH, Snapshot
+from connection_manager import LinkState
+
+Event = tuple[float, str, float]        # (recorded time, channel, value)
+
+MIN_SPEED, MAX_SPEED = 1.0, 50.0
+TRANSCRIPT_RATE = 10.0      # requests/s assumed when a transcript has no timestamps
+SILENT_AFTER = 2.0          # recorded seconds without OBD data before showing "disconnected"
+MAX_GAP = 5.0               # wall seconds; longer silences in the recording are skipped
+
+# "[12]" or "12.345" in front of a line; a bare integer is a reply byte ("41 0C ...")
+_TIMESTAMP = re.compile(r"^\s*(?:\[(\d+(?:\.\d+)?)\]|(\d+\.\d+))\s+(.*)$")
+_ELM_MESSAGES = ("NO DATA", "SEARCHING", "OK", "?", "STOPPED", "UNABLE TO CONNECT", "BUS", "CAN ERROR",
+                 "DATA ERROR", "BUFFER FULL", "FB ERROR", "ELM327")
+_PYOBD = re.compile(r"(write|read):\s*(b?'.*'|b?\".*\")")
+
+
+def trip_events(path: str) -> list[Event]:
+    return sorted(trip_recorder.read_records(path), key=lambda e: e[0])
+
+
+def _transcript_commands() -> dict[bytes, tuple[str, obd.OBDCommand]]:
+    """Request bytes -> (channel, command) for everything the dash polls."""
+    by_request = {b"0101": ("status", obd.commands.STATUS)}
+    for name, (_, _, command_name) in CHANNELS.items():
+        if command_name is not None:
+            by_request[obd.commands[command_name].command] = (name, obd.commands[command_name])
+    for name, cmd in FAST_BATCH.items():
+        by_request[cmd.command] = (name, cmd)
+    return by_request
+
+
+def _is_transcript_line(text: str) -> bool:
+    """A request (">010C"), reply bytes or an adapter message."""
+    text = text.strip()
+    return text.startswith(">") or elm_raw.line_bytes(text) is not None or text.upper().startswith(_ELM_MESSAGES)
+
+
+def _exchanges(lines: Iterable[str]) -> Iterator[tuple[Optional[float], str, list[str]]]:
+    """Group transcript lines into (time, request, response lines)."""
+    t, request, response = None, None, []
+    for raw in lines:
+        m = _PYOBD.search(raw)
+        if m:
+            kind, text = m.groups()
+            try:
+                text = ast.literal_eval(text)
+            except (ValueError, SyntaxError):
+                continue
+            if isinstance(text, bytes):
+                text = text.decode("ascii", errors="ignore")
+            parts = [p for p in text.replace(">", "").split("\r") if p.strip()]
+            if kind == "write":
+                if request is not None:
+                    yield t, request, response
+                t, request, response = None, "".join(parts).strip(), []
+            else:
+                response.extend(parts)
+            continue
+
+        line_t = None
+        m = _TIMESTAMP.match(raw)
+        if m and _is_transcript_line(m.group(3)):
+            line_t, raw = float(m.group(1) or m.group(2)), m.group(3)
+        line = raw.strip()
+        if not line:
+            continue
+        if line.startswith(">"):
+            if request is not None:
+                yield t, request, response
+            t, request, response = line_t, line[1:].strip(), []
+        elif request is not None:
+            response.append(line)
+            if t is None:
+                t = line_t
+    if request is not None:
+        yield t, request, response
+
+
+def _reassemble(frames: list[bytes]) -> list[bytes]:
+    """Join ISO-TP first/consecutive frames (headers on: "10 0D ..." + "21 ...") into one payload."""
+    out = []
+    i = 0
+    while i < len(frames):
+        frame = frames[i]
+        if len(frame) > 2 and frame[0] & 0xF0 == 0x10 and i + 1 < len(frames) and frames[i + 1][:1] == b"\x21":
+            length = ((frame[0] & 0x0F) << 8) | frame[1]
+            payload = bytearray(frame[2:])
+            i += 1
+            while i < len(frames) and frames[i] and frames[i][0] & 0xF0 == 0x20 and len(payload) < length:
+                payload += frames[i][1:]
+                i += 1
+            out.append(bytes(payload[:length]))
+            continue
+        out.append(frame)
+        i += 1
+    return out
+
+
+def _response_messages(request: bytes, response: list[str]) -> list[Message]:
+    """Response lines -> python-OBD Messages starting at the service byte (headers dropped)."""
+    want = bytes([int(request[:2], 16) + 0x40, int(request[2:4], 16)])
+    frames = [b for b in map(elm_raw.line_bytes, response) if b]
+    if any(":" in line for line in response):
+        frames = [b"".join(frames)]     # headers off, multi-frame: "0: ..." "1: ..."
+    messages = []
+    for data in _reassemble(frames):
+        start = data.find(want)
+        if start < 0:
+            continue
+        m = Message([])
+        m.ecu = ECU.ENGINE
+        m.data = bytearray(data[start:])
+        messages.append(m)
+    return messages
+
+
+def _channel_value(name: str, cmd: obd.OBDCommand, messages: list[Message]) -> Optional[float]:
+    """
+    A transcript reply in the units the live getters return (coolant in °F,
+    rounded voltage, ...): elm_raw's decoder for the channel, python-OBD's otherwise.
+    """
+    pid = elm_raw.RAW_PIDS.get(name)
+    if pid is None:
+        resp = cmd(messages)
+        return None if resp.value is None else py_obd._dash_value(cmd, resp)
+    start = len(pid.reply)
+    for m in messages:
+        data = bytes(m.data)
+        if data.startswith(pid.reply) and len(data) >= start + pid.size:
+            return pid.decode(data[start:start + pid.size])
+    return None
+
+
+def _transcript_enhanced() -> dict[bytes, list[tuple[str, enhanced_pids.EnhancedPid]]]:
+    """Request bytes -> enhanced channels read from it (several channels can share a DID)."""
+    by_request: dict[bytes, list] = {}
+    for name, pid in enhanced_pids.DEFINITIONS.items():
+        by_request.setdefault(pid.request.encode(), []).append((name, pid))
+    return by_request
+
+
+def transcript_events(path: str) -> list[Event]:
+    commands = _transcript_commands()
+    enhanced = _transcript_enhanced()
+    by_pid = {cmd.pid: (name, cmd) for name, cmd in FAST_BATCH.items()}
+    events: list[Event] = []
+    with open(path, "r", errors="ignore") as f:
+        for i, (t, request, response) in enumerate(_exchanges(f)):
+            request = request.replace(" ", "").upper().encode()
+            if request.startswith(b"AT") or len(request) < 4:
+                continue
+            t = i / TRANSCRIPT_RATE if t is None else t
+            try:
+                messages = _response_messages(request, response)
+            except ValueError:
+                continue
+            if not messages:
+                continue
+
+            if request.startswith(b"01") and len(request) > 4 and request not in commands:
+                # Multi-PID request: split the combined reply back into single PIDs
+                parts = py_obd._split_multi_pid(messages, {pid: cmd for pid, (_, cmd) in by_pid.items()})
+                for pid, msgs in parts.items():
+                    name, cmd = by_pid[pid]
+                    value = _channel_value(name, cmd, msgs)
+                    if value is not None:
+                        events.append((t, name, value))
+                continue
+
+            if request in enhanced:
+                for name, pid in enhanced[request]:
+                    value = pid.decoder(messages)
+                    if value is not None:
+                        events.append((t, name, value))
+                continue
+            if request not in commands:
+                continue
+            name, cmd = commands[request]
+            if name == "status":
+                resp = cmd(messages)
+                if resp.value is not None:
+                    events.append((t, "mil", float(resp.value.MIL)))
+                    events.append((t, "dtc_count", float(resp.value.DTC_count)))
+                continue
+            value = _channel_value(name, cmd, messages)
+            if value is not None:
+                events.append((t, name, value))
+    events.sort(key=lambda e: e[0])
+    return events
+
+
+def load_events(path: str) -> list[Event]:
+    """Trip file if it has a trip header, otherwise an ELM transcript."""
+    with open(path, "rb") as f:
+        is_trip = trip_recorder.read_header(f.read(trip_recorder.HEADER_SIZE)) is not None
+    return trip_events(path) if is_trip else transcript_events(path)
+
+
+class ReplayWorker(QThread):
+    """Publishes recorded samples as Snapshots, paced like the live worker."""
+
+    snapshotReady = pyqtSignal(object)
+    gpsSpeed = pyqtSignal(float)
+
+    def __init__(self, path: str, speed: float = 1.0, interval: float = 0.05, loop: bool = False, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.speed = min(MAX_SPEED, max(MIN_SPEED, speed))
+        self.interval = interval
+        self.loop = loop
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.wait()
+
+    def run(self) -> None:
+        try:
+            events = load_events(self.path)
+        except (OSError, ValueError) as e:
+            print("[WARN] Replay failed:", e)
+            return
+        if not events:
+            print(f"[WARN] Nothing to replay in {self.path}")
+            return
+        span = events[-1][0] - events[0][0]
+        print(f"[INFO] Replaying {len(events)} samples ({span / 60:.1f} min) from {self.path} at {self.speed:g}x")
+
+        while not self._stop.is_set():
+            started = time.monotonic()
+            published = self._play(events)
+            if published:
+                wall = time.monotonic() - started
+                print(f"[INFO] Replay done: {published} snapshots in {wall:.1f} s ({published / wall:.1f}/s)")
+            if not self.loop:
+                break
+
+    def _play(self, events: list[Event]) -> int:
+        values = {name: 0.0 for name in (*CHANNELS, *FAST_BATCH)}
+        mil, dtc_count = False, 0
+        last_obd = None
+        published = 0
+
+        window = self.interval * self.speed
+        t = events[0][0]
+        i = 0
+        deadline = time.monotonic()
+        while i < len(events) and not self._stop.is_set():
+            # Silence in the recording (engine off, dash off): jump ahead instead of waiting it out
+            if events[i][0] - t > MAX_GAP * self.speed:
+                t = events[i][0] - window
+
+            t += window
+            fresh = set()
+            gps = None
+            while i < len(events) and events[i][0] < t:
+                _, name, value = events[i]
+                i += 1
+                if name == "gps_speed":
+                    gps = value
+                elif name == "mil":
+                    mil = bool(value)
+                elif name == "dtc_count":
+                    dtc_count = int(value)
+                elif name in values:
+                    values[name] = value
+                    fresh.add(name)
+                else:
+                    continue
+                if name != "gps_speed":
+                    last_obd = events[i - 1][0]
+
+            # Don't try to catch up after the UI stalled; just carry on from now
+            deadline = max(deadline + self.interval, time.monotonic() - self.interval)
+            self._stop.wait(max(0.0, deadline - time.monotonic()))
+
+            if gps is not None:
+                self.gpsSpeed.emit(gps)
+            if last_obd is None or t - last_obd > SILENT_AFTER:
+                self.snapshotReady.emit(Snapshot(False, t, LinkState.ECU_SILENT.value))
+            else:
+                self.snapshotReady.emit(Snapshot(True, t, LinkState.CONNECTED.value, mil, dtc_count,
+                                                 MappingProxyType(dict(values)), frozenset(fresh)))
+            published += 1
+        return published
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Decode a recording the way --replay would and summarise it")
+    ap.add_argument("path", help="trip file or ELM transcript")
+    args = ap.parse_args()
+    try:
+        events = load_events(args.path)
+    except (ValueError, OSError) as e:
+        sys.exit(f"[ERROR] {e}")
+    by_channel: dict[str, list[float]] = {}
+    for _, name, value in events:
+        by_channel.setdefault(name, []).append(value)
+    span = events[-1][0] - events[0][0] if events else 0.0
+    print(f"{len(events)} events over {span:.1f} s")
+    for name, values in sorted(by_channel.items()):
+        print(f"  {name:<16} n={len(values):<6} min={min(values):<10.4g} max={max(values):<10.4g} last={values[-1]:.4g}")
@@ -1,6 +1,8 @@
 import time
 import serial
 
+import mode22_db
+
 PORT = "/dev/rfcomm0"
 
 # Try common ELM baudrates. OBDLink LX usually works with 115200 or 38400 over SPP.
@@ -49,14 +51,6 @@ def init_elm(ser):
     print(cmd(ser, "ATAT2"))
     print(cmd(ser, "ATST64"))  # timeout a bit longer
 
-def is_good_reply(txt):
-    # Successful Mode 22 reply typically contains "62" (response for service 22)
-    # Example: "62 11 A6 ..."
-    t = txt.replace("\r", "\n")
-    if "NO DATA" in t or "?" in t or "UNABLE" in t:
-        return False
-    return "62" in t
-
 def main():
     ser = None
     for b in BAUDS:
@@ -69,19 +63,29 @@ def main():
     if ser is None:
         raise SystemExit("Could not open rfcomm port")
 
+    db = mode22_db.ScanDB()
     try:
         init_elm(ser)
+        vehicle = mode22_db.vin_from_reply(cmd(ser, "0902", 0.5)) or "unknown"
+        # The 0902 above ran the protocol search; command_for needs the protocol for headers.
+        # A slow search can leave its reply in front of ATDPN's "A2", so take the last token.
+        tokens = cmd(ser, "ATDPN").replace(">", "").split()
+        protocol = tokens[-1][-1:] if tokens else ""
+        db.set_vehicle(vehicle, protocol)
+        print(f"[INFO] Vehicle {vehicle}, protocol {protocol}")
 
         print("\n[INFO] Probing Mode 22 candidates...")
         for pid in CANDIDATES:
             q = "22" + pid
             out = cmd(ser, q, 0.2)
-            ok = is_good_reply(out)
-            print(f"\n>>> {q}  {'OK' if ok else 'no'}")
+            reply = mode22_db.parse_reply(int(pid, 16), out)
+            db.record(vehicle, reply, timeout=0x64 * 0.004)    # ATST64
+            print(f"\n>>> {q}  {reply.describe()}")
             print(out.strip())
 
-        print("\n[INFO] Done. If any showed a '62 ....' reply, tell me which PID and paste the raw reply.")
+        print(f"\n[INFO] Done. Results saved to {db.path}; see python3 mode22_db.py list")
     finally:
+        db.close()
         ser.close()
 
 if __name__ == "__main__":
@@ -1,6 +1,46 @@
+#!/usr/bin/env python3
+"""
+scan_mode22_range.py - Sweep GM Mode 22 DID ranges, fast and resumable
+
+  python3 scan_mode22_range.py                       # carries on with whatever is still unknown
+  python3 scan_mode22_range.py --range 1100-11FF --range 1900-19FF --rescan
+  python3 scan_mode22_range.py --target pcm --target tcm --target 6C28F1
+
+Every module in gm_modules.TARGETS for the detected protocol (VPW: PCM, TCM,
+BCM; CAN: PCM, TCM) is scanned in one session by switching the request
+header with ATSH, and each DID is recorded against the module that answered.
+--target picks modules by name or raw header; "functional" is the adapter's
+default header, where only whichever module answers first is heard.
+
+Each request is read straight up to the ">" prompt (no fixed sleeps). The
+module's answer time (seeded from DIDs it answered before or a few Mode 01
+requests, then every positive or 7F negative reply) is tracked and ATST is
+cut down to cover it with some margin, so DIDs nothing answers cost ~100 ms
+instead of the default timeout. If an answer ever comes in close to the
+current ATST, it is raised again. Learning starts over for each module.
+NO DATA under a cut-down ATST may just be a slow DID, so those are asked
+again at the full timeout at the end of each module's sweep; only a NO DATA
+at the full timeout counts as an answer.
+
+Every reply is parsed (mode22_db.parse_reply) and stored per vehicle (VIN)
+in mode22_db's SQLite database, committed every few seconds. DIDs that
+already have a definite answer are skipped, so after a Bluetooth drop the
+sweep carries on where it was and a new run only probes what is still
+unknown (--rescan to ask everything again). See the results with:
+python3 mode22_db.py list, and work out what the hits mean with discover_dids.py.
+"""
+
+import argparse
+import collections
+import signal
+import sys
 import time
+
 import serial
 
+import gm_modules
+import mode22_db
+
 PORT = "/dev/rfcomm0"
 BAUD = 115200
 
@@ -11,65 +51,262 @@ RANGES = [
     (0x1A00, 0x1AFF),
 ]
 
-def cmd(ser, s, d=0.15, w=2.0):
+ATST_UNIT = 0.004           # s per ATST count
+INITIAL_TIMEOUT = 0.6       # ATST96: a little more patience on VPW until we know the ECU
+MIN_TIMEOUT = 0.06
+TIMEOUT_MARGIN = 0.025      # s on top of 1.5x the slowest recent answer
+LEARN_AFTER = 5             # answers before the tighter ATST fit
+CHECKPOINT_EVERY = 5.0      # s
+RECONNECT_DELAY = 3.0       # s
+
+
+def cmd(ser, s, w=2.0):
+    """
+    Send one command and read up to the prompt.
+    Returns (reply text, seconds until the first reply byte or None).
+    """
     ser.reset_input_buffer()
+    start = time.monotonic()
     ser.write((s + "\r").encode())
-    time.sleep(d)
-    end = time.time() + w
+    end = start + w
     out = ""
-    while time.time() < end:
+    first = None
+    while time.monotonic() < end:
         chunk = ser.read(ser.in_waiting or 1).decode(errors="ignore")
         if chunk:
+            if first is None and chunk.strip("\r\n >"):
+                first = time.monotonic() - start
             out += chunk
             if ">" in out:
                 break
+    return out.replace("\r", "\n"), first
+
+
+def parse_range(text):
+    start, _, end = text.partition("-")
+    start, end = int(start, 16), int(end or start, 16)
+    if not 0 <= start <= end <= 0xFFFF:
+        raise argparse.ArgumentTypeError(f"bad DID range {text!r}, expected e.g. 1100-11FF")
+    return start, end
+
+
+def resolve_targets(specs, protocol):
+    """--target names/headers -> [(name, header)]; default every known module for the protocol."""
+    modules = gm_modules.TARGETS.get(protocol, {})
+    if not specs:
+        return list(modules.items()) or [("functional", "")]
+    out = []
+    for spec in specs:
+        if spec.lower() == "functional":
+            out.append(("functional", ""))
+        elif spec.lower() in modules:
+            out.append((spec.lower(), modules[spec.lower()]))
+        elif len(spec) in (3, 6) and all(c in "0123456789ABCDEFabcdef" for c in spec):
+            out.append((gm_modules.module_name(spec.upper()), spec.upper()))
         else:
-            time.sleep(0.01)
-    return out.replace("\r", "\n")
-
-def init(ser):
-    print(cmd(ser, "ATZ", 0.8, 3.0))
-    print(cmd(ser, "ATE0"))
-    print(cmd(ser, "ATL0"))
-    print(cmd(ser, "ATS0"))
-    print(cmd(ser, "ATH1"))
-    print(cmd(ser, "ATSP0"))
-    print(cmd(ser, "ATDP"))
-    # A little more patience on VPW
-    print(cmd(ser, "ATST96"))   # timeout ~150ms*? (ELM units), slightly longer
-    print(cmd(ser, "ATAT2"))    # adaptive timing
-
-def looks_like_hit(txt):
-    t = txt.upper()
-    if "NO DATA" in t or "STOPPED" in t or "UNABLE" in t or "?" in t:
-        return False
-    # Mode 22 positive response is 0x62
-    return "62" in t
+            raise ValueError(f"unknown target {spec!r} for protocol {protocol} "
+                             f"(have: functional, {', '.join(modules)} or a hex header)")
+    # The default header can't be restored without ATZ/ATD, so functional goes first
+    return sorted(out, key=lambda t: t[1] != "")
+
+
+class Scanner:
+    def __init__(self, port, baud, ranges, db, vehicle=None, rescan=False, targets=None):
+        self.port = port
+        self.baud = baud
+        self.ranges = ranges
+        self.db = db
+        self.vehicle = vehicle          # None: identify by VIN once connected
+        self.rescan = rescan
+        self.target_specs = targets
+        self.targets = None             # [(name, header)] once the protocol is known
+        self.protocol = None            # ELM protocol id (ATDPN) once open
+        self.target = None              # header currently set (None: not selected since the last ATZ)
+        self.ser = None
+        self.timeout = INITIAL_TIMEOUT
+        self.answer_times = collections.deque(maxlen=32)
+        self.done = set()               # headers fully swept this run
+        self.hits = []
+        self.requests = 0
+        self._saved_at = time.monotonic()
+
+    def save(self):
+        self.db.commit()
+        self._saved_at = time.monotonic()
+
+    # ---- link ----
+
+    def open(self):
+        self.ser = serial.Serial(self.port, self.baud, timeout=0.2)
+        print(f"[INFO] Opened {self.port} at {self.baud}")
+        for c in ("ATZ", "ATE0", "ATL0", "ATS0", "ATH1", "ATSP0", "ATDP"):
+            print(c, " ".join(cmd(self.ser, c, 3.0)[0].replace(">", "").split()))
+        # We manage the timeout ourselves; adaptive timing would move it under us
+        cmd(self.ser, "ATAT0")
+        self.set_timeout(INITIAL_TIMEOUT, force=True)
+        cmd(self.ser, "0100", 10.0)     # protocol search, on the default header
+        self.target = None
+
+        protocol = self.protocol = cmd(self.ser, "ATDPN")[0].replace(">", "").strip().lstrip("A")
+        if self.vehicle is None:
+            self.vehicle = mode22_db.vin_from_reply(cmd(self.ser, "0902", 5.0)[0])
+            if not self.vehicle:
+                self.vehicle = f"unknown-{protocol}"
+                print(f"[WARN] No VIN; recording results as {self.vehicle} (use --vehicle to name it)")
+        self.db.set_vehicle(self.vehicle, protocol)
+        if self.targets is None:
+            self.targets = resolve_targets(self.target_specs, protocol)
+        print(f"[INFO] Vehicle {self.vehicle}, modules: {', '.join(name for name, _ in self.targets)}")
+
+    def select(self, name, header):
+        """Point requests at one module and learn its answer time from scratch."""
+        if header:
+            cmd(self.ser, f"ATSH{header}")
+        self.target = header
+        self.answer_times.clear()
+        self.set_timeout(INITIAL_TIMEOUT, force=True)
+        # Requests this module is known to answer, then Mode 01 (only the PCM does that)
+        seeds = [f"22{r['did']:04X}" for r in self.db.rows(self.vehicle, target=header)][:LEARN_AFTER]
+        for q in seeds + ["0100"] * (2 * LEARN_AFTER):
+            if len(self.answer_times) >= LEARN_AFTER:
+                break
+            txt, first = cmd(self.ser, q, self.timeout + 1.0)
+            if first is not None and mode22_db.frames(txt):
+                self.learn(first)
+            elif q == "0100":
+                break
+        print(f"\n[INFO] Module {name} ({header or 'default header'}), ATST {self.timeout * 1000:.0f} ms")
+
+    def close(self):
+        if self.ser is not None:
+            try:
+                self.ser.close()
+            except serial.SerialException:
+                pass
+            self.ser = None
+
+    def set_timeout(self, seconds, force=False):
+        counts = max(1, min(0xFF, round(seconds / ATST_UNIT)))
+        if not force and counts == round(self.timeout / ATST_UNIT):
+            return
+        cmd(self.ser, f"ATST{counts:02X}")
+        if not force:
+            print(f"\n[INFO] ATST {self.timeout * 1000:.0f} -> {counts * ATST_UNIT * 1000:.0f} ms")
+        self.timeout = counts * ATST_UNIT
+
+    def learn(self, first):
+        """
+        Fit ATST to the module's answer times: 1.5x the slowest recent one plus a
+        margin, 2x while there are fewer than LEARN_AFTER answers to go on.
+        """
+        self.answer_times.append(first)
+        if first > 0.8 * self.timeout:
+            # Cutting it close: back off right away rather than start missing replies
+            self.set_timeout(min(INITIAL_TIMEOUT, first * 2 + TIMEOUT_MARGIN))
+            return
+        factor = 1.5 if len(self.answer_times) >= LEARN_AFTER else 2.0
+        target = max(self.answer_times) * factor + TIMEOUT_MARGIN
+        self.set_timeout(max(MIN_TIMEOUT, min(INITIAL_TIMEOUT, target)))
+
+    # ---- sweep ----
+
+    def probe(self, did, learn=True):
+        q = f"22{did:04X}"
+        txt, first = cmd(self.ser, q, self.timeout + 1.0)
+        self.requests += 1
+        if ">" not in txt:
+            raise serial.SerialException(f"no prompt after {q}")
+        reply = mode22_db.parse_reply(did, txt)
+        if learn and first is not None and reply.status in (mode22_db.POSITIVE, mode22_db.NEGATIVE):
+            self.learn(first)
+        self.db.record(self.vehicle, reply, self.target, self.timeout)
+        if reply.status == mode22_db.POSITIVE:
+            print(f"\nHIT {q}: {reply.describe()}")
+            self.hits.append((gm_modules.module_name(self.target), q))
+
+    def retry_slow(self, name, header):
+        """Ask again, at INITIAL_TIMEOUT, for DIDs that got NO DATA under a learned (shorter) ATST."""
+        slow = self.db.timed_out(self.vehicle, header, INITIAL_TIMEOUT)
+        dids = [did for did in sorted(slow) if any(start <= did <= end for start, end in self.ranges)]
+        if not dids:
+            return
+        print(f"\n[SCAN] {name}: {len(dids)} NO DATA under a shorter ATST, asking again at "
+              f"{INITIAL_TIMEOUT * 1000:.0f} ms")
+        self.set_timeout(INITIAL_TIMEOUT, force=True)
+        for did in dids:
+            self.probe(did, learn=False)
+            if time.monotonic() - self._saved_at > CHECKPOINT_EVERY:
+                self.save()
+
+    def run(self):
+        started = time.monotonic()
+        while True:
+            try:
+                if self.ser is None:
+                    self.open()
+                for name, header in self.targets:
+                    if header in self.done:
+                        continue
+                    known = set() if self.rescan else self.db.known(self.vehicle, header, INITIAL_TIMEOUT)
+                    todo = [[did for did in range(start, end + 1) if did not in known] for start, end in self.ranges]
+                    if any(todo):
+                        if self.target != header:
+                            self.select(name, header)
+                        for (start, end), dids in zip(self.ranges, todo):
+                            if dids:
+                                print(f"[SCAN] {name} 22{start:04X}..22{end:04X}: {len(dids)} unknown")
+                            for did in dids:
+                                self.probe(did)
+                                if time.monotonic() - self._saved_at > CHECKPOINT_EVERY:
+                                    self.save()
+                        self.retry_slow(name, header)
+                    self.done.add(header)
+                break
+            except (serial.SerialException, OSError) as e:
+                # Bluetooth dropped: keep what we have and carry on once the port is back
+                print(f"\n[WARN] Link lost ({e}); reconnecting in {RECONNECT_DELAY:.0f} s")
+                self.close()
+                self.save()
+                time.sleep(RECONNECT_DELAY)
+        self.save()
+        wall = time.monotonic() - started
+        print(f"\nDone. {self.requests} requests in {wall:.0f} s "
+              f"({self.requests / wall if wall else 0:.1f}/s). New hits: {len(self.hits)}")
+        for name, q in self.hits:
+            print(f"  {name:<10} {q}")
+
 
 def main():
-    ser = serial.Serial(PORT, BAUD, timeout=0.2)
-    init(ser)
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--port", default=PORT)
+    ap.add_argument("--baud", type=int, default=BAUD)
+    ap.add_argument("--range", action="append", type=parse_range, dest="ranges",
+                    help="hex DID range, e.g. 1100-11FF (repeatable; default: the GM blocks above)")
+    ap.add_argument("--db", default=mode22_db.DB_PATH, help="scan results database")
+    ap.add_argument("--vehicle", help="name to record results under (default: the VIN)")
+    ap.add_argument("--rescan", action="store_true", help="probe DIDs that already have an answer too")
+    ap.add_argument("--target", action="append", dest="targets",
+                    help="module to scan: pcm, tcm, bcm, functional or a hex ATSH header (repeatable; "
+                         "default: every known module for the protocol)")
+    args = ap.parse_args()
 
-    hits = []
-    try:
-        for start, end in RANGES:
-            print(f"\n[SCAN] 22{start:04X}..22{end:04X}")
-            for pid in range(start, end + 1):
-                q = f"22{pid:04X}"
-                out = cmd(ser, q, d=0.12, w=1.2)
-                if looks_like_hit(out):
-                    print(f"\nHIT {q}")
-                    print(out.strip())
-                    hits.append((q, out.strip()))
-                # tiny delay to be kind to VPW bus
-                time.sleep(0.01)
-
-        print(f"\nDone. Hits: {len(hits)}")
-        for q, _ in hits:
-            print(" ", q)
+    db = mode22_db.ScanDB(args.db)
+    scanner = Scanner(args.port, args.baud, args.ranges or RANGES, db, args.vehicle, args.rescan, args.targets)
 
+    def interrupt(*_):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, interrupt)    # e.g. shutdown_monitor powering off: save first
+    try:
+        scanner.run()
+    except ValueError as e:
+        sys.exit(f"[ERROR] {e}")
+    except KeyboardInterrupt:
+        scanner.save()
+        print(f"\n[INFO] Stopped; progress saved to {args.db}")
     finally:
-        ser.close()
+        scanner.close()
+        db.close()
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,136 @@
+"""
+speed_fusion.py - One low-latency speed channel from OBD SPEED + GPS
+
+OBD SPEED arrives quickly but is quantised to 1 km/h and reads off by the
+tyre-size error; GPS is accurate but lags under hard acceleration and drops
+out in tunnels. A scalar Kalman filter (constant-speed model) takes both as
+measurements:
+
+- OBD samples are scaled by a GPS-learned correction factor and trusted with
+  roughly their quantisation noise.
+- GPS noise grows with the current acceleration, so it dominates when cruising
+  and fades out while the speed is changing quickly.
+- Either source alone keeps the estimate going; with neither it decays to 0.
+
+The result is published at a fixed rate along with which source dominated.
+"""
+
+import time
+from typing import Callable
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal, pyqtSlot
+
+OBD = "obd"
+GPS = "gps"
+NONE = "none"
+
+
+class SpeedFusion(QObject):
+    speedChanged = pyqtSignal(float)
+    sourceChanged = pyqtSignal(str)
+
+    OBD_TIMEOUT = 1.0           # s without a sample before a source counts as lost
+    GPS_TIMEOUT = 2.0
+    ACCEL_NOISE = 15.0          # mph/s, process noise (how fast speed can really change)
+    OBD_NOISE = 0.62 ** 2 / 12 + 0.3  # mph^2: 1 km/h (0.62 mph) quantisation + jitter
+    GPS_NOISE = 0.3             # mph^2 when steady
+    GPS_LAG = 0.6               # s of effective GPS lag; noise grows with (lag * accel)^2
+    SCALE_RATE = 0.02           # per-sample learning rate for the OBD correction factor
+
+    def __init__(self, rate_hz: float = 20.0, clock: Callable[[], float] = time.monotonic, parent=None):
+        super().__init__(parent)
+        self._clock = clock
+        self.speed = 0.0
+        self.source = NONE
+        self.scale = 1.0
+
+        self._p = 100.0
+        self._accel = 0.0
+        self._last_tick = clock()
+        self._obd = None            # (value, time) of the newest unprocessed sample
+        self._gps = None
+        self._obd_seen = -1e9
+        self._gps_seen = -1e9
+        self._obd_last = None       # previous processed OBD sample, for the accel estimate
+        self._r_gps = self.GPS_NOISE
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.tick)
+        self.timer.start(int(1000 / rate_hz))
+
+    @pyqtSlot(float)
+    def updateObd(self, mph: float) -> None:
+        now = self._clock()
+        self._obd = (mph, now)
+        self._obd_seen = now
+
+    @pyqtSlot(float)
+    def updateGps(self, mph: float) -> None:
+        now = self._clock()
+        self._gps = (mph, now)
+        self._gps_seen = now
+
+    def _update(self, z: float, r: float) -> None:
+        k = self._p / (self._p + r)
+        self.speed += k * (z - self.speed)
+        self._p *= (1 - k)
+
+    @pyqtSlot()
+    def tick(self) -> None:
+        now = self._clock()
+        dt = max(1e-3, now - self._last_tick)
+        self._last_tick = now
+
+        obd_ok = now - self._obd_seen < self.OBD_TIMEOUT
+        gps_ok = now - self._gps_seen < self.GPS_TIMEOUT
+
+        # Predict: constant speed, uncertainty grows with how hard we could be accelerating
+        self._p += (self.ACCEL_NOISE * dt) ** 2
+
+        if self._obd is not None:
+            mph, t = self._obd
+            self._obd = None
+            if self._obd_last is not None and t > self._obd_last[1]:
+                a = (mph - self._obd_last[0]) / (t - self._obd_last[1])
+                self._accel += 0.3 * (a - self._accel)
+            self._obd_last = (mph, t)
+            self._update(mph * self.scale, self.OBD_NOISE)
+
+        if self._gps is not None:
+            mph, _ = self._gps
+            self._gps = None
+            lag_error = self.GPS_LAG * self._accel if obd_ok else 0.0
+            self._r_gps = self.GPS_NOISE + lag_error ** 2
+            self._update(mph, self._r_gps)
+
+            # Learn the tyre-size correction only when cruising, where GPS is trustworthy
+            if obd_ok and self._obd_last and self._obd_last[0] > 10 and abs(self._accel) < 1.0:
+                self.scale += self.SCALE_RATE * (mph / self._obd_last[0] - self.scale)
+                self.scale = min(1.2, max(0.8, self.scale))
+
+        if not obd_ok:
+            self._accel = 0.0
+        if not obd_ok and not gps_ok:
+            # Nothing to go on: let the needle fall back to rest
+            self.speed *= 0.9
+            if self.speed < 0.5:
+                self.speed = 0.0
+
+        self.speed = max(0.0, self.speed)
+        self._set_source(self._dominant(obd_ok, gps_ok))
+        self.speedChanged.emit(self.speed)
+
+    def _dominant(self, obd_ok: bool, gps_ok: bool) -> str:
+        if obd_ok and gps_ok:
+            # Whichever measurement the filter currently trusts more
+            return OBD if self.OBD_NOISE <= self._r_gps else GPS
+        if obd_ok:
+            return OBD
+        if gps_ok:
+            return GPS
+        return NONE
+
+    def _set_source(self, source: str) -> None:
+        if source != self.source:
+            self.source = source
+            self.sourceChanged.emit(source)
@@ -0,0 +1,48 @@
+"""
+test_replay.py - Transcript decoding in replay.py (python3 -m pytest test_replay.py)
+"""
+
+import pytest
+
+import elm_raw
+from acquisition import CHANNELS
+from replay import TRANSCRIPT_RATE, _exchanges, transcript_events
+
+# Headers on (J1850 header + CRC), no timestamps: the first byte of every reply
+# looks like a number and must not be taken for a time
+VPW = """\
+>010C
+48 6B 10 41 0C 1A F8 B2
+>0105
+48 6B 10 41 05 7B 06
+>010D
+48 6B 10 41 0D 28 A5
+>22115C
+48 6B 10 62 11 5C 35 34
+"""
+EXPECTED = [("rpm", 1726.0), ("coolant_temp", 181.4), ("speed", 40 * elm_raw.KMH_TO_MPH),
+            ("oil_pressure", 16.95)]
+
+# Requests "[0.00]" ... "[0.30]", replies "1.050 48 6B ..." a little later
+TIMESTAMPED = "".join(f"[{i * 0.05:.2f}] {line}\n" if i % 2 == 0 else f"{i * 0.05 + 1:.3f} {line}\n"
+                      for i, line in enumerate(VPW.splitlines()))
+
+
+@pytest.mark.parametrize("text", [VPW, TIMESTAMPED], ids=["untimestamped", "timestamped"])
+def test_reply_lines(text):
+    replies = [response for _, _, response in _exchanges(text.splitlines())]
+    assert replies == [[line] for line in VPW.splitlines()[1::2]]
+
+
+@pytest.mark.parametrize("text", [VPW, TIMESTAMPED], ids=["untimestamped", "timestamped"])
+def test_transcript_events(text, tmp_path):
+    path = tmp_path / "transcript.txt"
+    path.write_text(text)
+    got = transcript_events(str(path))
+    # One request per 1 / TRANSCRIPT_RATE without timestamps; the timestamped copy uses the same times
+    wanted = [(i / TRANSCRIPT_RATE, name, value) for i, (name, value) in enumerate(EXPECTED)
+              if name in CHANNELS]
+    assert [e[1] for e in got] == [w[1] for w in wanted]
+    for (t, _, value), (want_t, _, want_value) in zip(got, wanted):
+        assert t == pytest.approx(want_t)
+        assert value == pytest.approx(want_value)
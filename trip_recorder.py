@@ -0,0 +1,227 @@
+"""
+trip_recorder.py - Binary trip recording into a memory-mapped ring file
+
+Every sample is one fixed 16-byte record (RECORD: float64 unix time, uint16
+channel id, 2 pad bytes, float32 value) written with struct.pack_into straight
+into an mmap of a preallocated file on tmpfs, so recording costs no syscalls
+and no SD writes while driving. When the ring is full the oldest records are
+overwritten.
+
+At shutdown save() copies the ring, oldest record first, to a trip file on the
+SD card in large sequential writes. Trip files use the same header and record
+layout with the ring unwrapped, so read_records() handles both.
+
+File layout: HEADER (64 bytes) followed by `capacity` records.
+
+Channels from enhanced_pids.json are recorded under their trip_id (default
+the DID), so new ones need no id here.
+"""
+
+import mmap
+import os
+import struct
+import time
+from typing import Iterator, Optional
+
+import enhanced_pids
+
+RECORD = struct.Struct("<dHxxf")
+HEADER = struct.Struct("<8sIIQQd")      # magic, version, record size, capacity, records written, started
+HEADER_SIZE = 64
+MAGIC = b"ODBTRIP1"
+VERSION = 1
+
+RING_PATH = "/dev/shm/odb2-trip.ring"
+TRIP_DIR = os.path.expanduser("~/odb2-trips")
+DEFAULT_CAPACITY = 1 << 20             # 16 MiB; ~85 min at 200 samples/s
+
+# Stable ids: never renumber, only append (trip files on disk depend on them)
+CHANNEL_IDS = {
+    "rpm": 1,
+    "speed": 2,                # OBD SPEED, mph
+    "throttle_pos": 3,
+    "engine_load": 4,
+    "intake_pressure": 5,
+    "absolute_load": 6,
+    "coolant_temp": 7,
+    "oil_pressure": 8,
+    "intake_temp": 9,
+    "module_voltage": 10,
+    "fuel_level": 11,
+    "baro_pressure": 12,
+    "gps_speed": 13,           # mph
+    "mil": 14,                 # 0 / 1
+    "dtc_count": 15,
+    "run_time": 16,            # s since engine start
+}
+
+
+def _enhanced_ids(problems: list[str]) -> dict[str, int]:
+    """Ids for the enhanced_pids.json channels that don't have one above; clashes go in `problems`."""
+    taken = {cid: name for name, cid in CHANNEL_IDS.items()}
+    ids = {}
+    for name, pid in enhanced_pids.DEFINITIONS.items():
+        if name in CHANNEL_IDS:
+            continue
+        if pid.trip_id in taken:
+            problems.append(f"Enhanced PID {name}: trip_id {pid.trip_id} is {taken[pid.trip_id]}'s; not recorded")
+            continue
+        taken[pid.trip_id] = name
+        ids[name] = pid.trip_id
+    return ids
+
+
+# Enhanced channels that can't be recorded, for the dash to report
+PROBLEMS: list[str] = []
+CHANNEL_IDS.update(_enhanced_ids(PROBLEMS))
+CHANNEL_NAMES = {cid: name for name, cid in CHANNEL_IDS.items()}
+
+SAVE_CHUNK = 1 << 20        # bytes per write() when copying to SD
+
+
+def read_header(buf) -> Optional[tuple[int, int, float]]:
+    """(capacity, records written, start time) if `buf` starts with a valid header."""
+    if len(buf) < HEADER_SIZE:
+        return None
+    magic, version, rec_size, capacity, count, started = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or version != VERSION or rec_size != RECORD.size:
+        return None
+    return capacity, count, started
+
+
+def _ordered_ranges(capacity: int, count: int) -> list[tuple[int, int]]:
+    """Byte ranges of the valid records, oldest first."""
+    if count <= capacity:
+        return [(HEADER_SIZE, HEADER_SIZE + count * RECORD.size)]
+    head = HEADER_SIZE + (count % capacity) * RECORD.size
+    end = HEADER_SIZE + capacity * RECORD.size
+    return [(head, end), (HEADER_SIZE, head)]
+
+
+def read_records(path: str) -> Iterator[tuple[float, str, float]]:
+    """Yield (time, channel name, value) from a ring or trip file, oldest first."""
+    with open(path, "rb") as f:
+        data = f.read()
+    header = read_header(data)
+    if header is None:
+        raise ValueError(f"{path} is not a trip file")
+    capacity, count, _ = header
+    for start, end in _ordered_ranges(capacity, count):
+        for t, cid, value in RECORD.iter_unpack(data[start:end]):
+            yield t, CHANNEL_NAMES.get(cid, str(cid)), value
+
+
+class TripRecorder:
+    """Appends samples to the ring file. Not thread-safe: feed it from one thread."""
+
+    def __init__(self, path: str = RING_PATH, capacity: int = DEFAULT_CAPACITY,
+                 trip_dir: str = TRIP_DIR):
+        self.path = path
+        self.capacity = capacity
+        self.trip_dir = trip_dir
+        self._last_status = None
+
+        # A ring left behind by a crash still holds the previous trip
+        if os.path.exists(path):
+            self._rescue_previous()
+
+        size = HEADER_SIZE + capacity * RECORD.size
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.ftruncate(self._fd, size)
+        self._mm = mmap.mmap(self._fd, size)
+        self.started = time.time()
+        self.count = 0
+        self._write_header()
+        print(f"[INFO] Recording trip to {path} ({size >> 20} MiB ring)")
+
+    def _rescue_previous(self) -> None:
+        try:
+            with open(self.path, "rb") as f:
+                header = read_header(f.read(HEADER_SIZE))
+            if header and header[1]:
+                print("[INFO] Found an unsaved trip ring, saving it first")
+                self._save_file(self.path, self._trip_path(header[2]))
+        except OSError as e:
+            print("[WARN] Could not rescue previous trip ring:", e)
+
+    def _write_header(self) -> None:
+        HEADER.pack_into(self._mm, 0, MAGIC, VERSION, RECORD.size, self.capacity, self.count, self.started)
+
+    def record(self, channel: str, value: float, t: Optional[float] = None) -> None:
+        cid = CHANNEL_IDS.get(channel)
+        if cid is None or self._mm is None:
+            return
+        offset = HEADER_SIZE + (self.count % self.capacity) * RECORD.size
+        RECORD.pack_into(self._mm, offset, time.time() if t is None else t, cid, value)
+        self.count += 1
+        # Only the count field; keeps the header valid if we crash
+        struct.pack_into("<Q", self._mm, 24, self.count)
+
+    def record_snapshot(self, snapshot) -> None:
+        """Record the channels an acquisition.Snapshot freshly sampled, plus MIL changes."""
+        if not snapshot.connected:
+            return
+        t = snapshot.timestamp
+        for name in snapshot.fresh:
+            self.record(name, snapshot.values[name], t)
+        status = (snapshot.mil, snapshot.dtc_count)
+        if status != self._last_status:
+            self._last_status = status
+            self.record("mil", float(snapshot.mil), t)
+            self.record("dtc_count", float(snapshot.dtc_count), t)
+
+    def record_gps(self, mph: float) -> None:
+        self.record("gps_speed", mph)
+
+    def _trip_path(self, started: float) -> str:
+        stem = os.path.join(self.trip_dir, time.strftime("trip-%Y%m%d-%H%M%S", time.localtime(started)))
+        path, n = stem + ".bin", 1
+        while os.path.exists(path):
+            path, n = f"{stem}-{n}.bin", n + 1
+        return path
+
+    def _save_file(self, src: str, dest: str) -> Optional[str]:
+        with open(src, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as ring:
+                return self._save_from(ring, dest)
+
+    def _save_from(self, ring, dest: str) -> Optional[str]:
+        header = read_header(ring)
+        if header is None or header[1] == 0:
+            return None
+        capacity, count, started = header
+        kept = min(count, capacity)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = dest + ".tmp"
+        with open(tmp, "wb") as out:
+            out.write(HEADER.pack(MAGIC, VERSION, RECORD.size, kept, kept, started).ljust(HEADER_SIZE, b"\0"))
+            for start, end in _ordered_ranges(capacity, count):
+                for pos in range(start, end, SAVE_CHUNK):
+                    out.write(ring[pos:min(end, pos + SAVE_CHUNK)])
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, dest)
+        print(f"[INFO] Saved {kept} trip records to {dest}" +
+              (f" ({count - kept} oldest overwritten)" if count > kept else ""))
+        return dest
+
+    def save(self) -> Optional[str]:
+        """Copy the ring to a trip file on the SD card. Returns its path, or None if empty."""
+        if self._mm is None:
+            return None
+        try:
+            return self._save_from(self._mm, self._trip_path(self.started))
+        except OSError as e:
+            print("[WARN] Could not save trip:", e)
+            return None
+
+    def close(self) -> None:
+        """Save the trip and drop the ring file."""
+        if self._mm is None:
+            return
+        saved = self.save()
+        self._mm.close()
+        self._mm = None
+        os.close(self._fd)
+        if saved:
+            os.remove(self.path)
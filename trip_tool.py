@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+trip_tool.py - Export recorded trips to columnar NumPy files and query them
+
+  python3 trip_tool.py export ~/odb2-trips/trip-20250101-120000.bin      # -> .npz
+  python3 trip_tool.py info trip.npz
+  python3 trip_tool.py query trip.npz --where "rpm > 3000" --where "oil_pressure < 20" \\
+      --agg min:oil_pressure --agg max:rpm
+
+Every channel is resampled (sample-and-hold) onto one shared time grid at
+--hz, so a query is plain boolean masks over equal-length arrays. The .npz
+holds one compressed array per channel per chunk of CHUNK_SECONDS, plus the
+grid start and rate. query also accepts a .bin trip or ring file directly.
+
+--where conditions are ANDed; each is "<channel> <op> <number>". RPM is in rpm,
+speeds in mph (see trip_recorder.CHANNEL_IDS for channel names).
+"""
+
+import argparse
+import re
+import sys
+import time
+
+import numpy as np
+
+import trip_recorder
+
+RECORD_DTYPE = np.dtype([("t", "<f8"), ("ch", "<u2"), ("pad", "V2"), ("v", "<f4")])
+assert RECORD_DTYPE.itemsize == trip_recorder.RECORD.size
+
+DEFAULT_HZ = 20.0
+CHUNK_SECONDS = 600
+
+OPS = {"<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal,
+       "==": np.equal, "!=": np.not_equal}
+AGGS = {"min": np.nanmin, "max": np.nanmax, "mean": np.nanmean}
+CONDITION = re.compile(r"^\s*(\w+)\s*(<=|>=|==|!=|<|>)\s*(-?\d+(?:\.\d*)?)\s*$")
+
+
+class Trip:
+    """Channels on a shared grid: t0 + arange(n) / hz. Missing samples are NaN."""
+
+    def __init__(self, t0: float, hz: float, columns: dict[str, np.ndarray]):
+        self.t0 = t0
+        self.hz = hz
+        self.columns = columns
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def times(self) -> np.ndarray:
+        return self.t0 + np.arange(len(self)) / self.hz
+
+    def column(self, name: str) -> np.ndarray:
+        if name not in self.columns:
+            raise ValueError(f"no channel {name!r} in this trip (have: {', '.join(sorted(self.columns))})")
+        return self.columns[name]
+
+
+def load_records(path: str) -> np.ndarray:
+    """All records of a .bin trip or ring file as a structured array, oldest first."""
+    with open(path, "rb") as f:
+        data = f.read()
+    header = trip_recorder.read_header(data)
+    if header is None:
+        raise ValueError(f"{path} is not a trip file")
+    capacity, count, _ = header
+    parts = [np.frombuffer(data, RECORD_DTYPE, (end - start) // RECORD_DTYPE.itemsize, start)
+             for start, end in trip_recorder._ordered_ranges(capacity, count)]
+    records = np.concatenate(parts)
+    # Samples are written in arrival order; GPS and OBD timestamps can interleave slightly
+    return records[np.argsort(records["t"], kind="stable")]
+
+
+def resample(records: np.ndarray, hz: float = DEFAULT_HZ) -> Trip:
+    """Sample-and-hold every channel onto a common grid."""
+    if len(records) == 0:
+        return Trip(0.0, hz, {})
+    t0 = records["t"][0]
+    grid = t0 + np.arange(int((records["t"][-1] - t0) * hz) + 1) / hz
+    columns = {}
+    for cid in np.unique(records["ch"]):
+        rows = records[records["ch"] == cid]
+        idx = np.searchsorted(rows["t"], grid, side="right") - 1
+        col = rows["v"][np.maximum(idx, 0)].astype(np.float32)
+        col[idx < 0] = np.nan
+        columns[trip_recorder.CHANNEL_NAMES.get(int(cid), str(cid))] = col
+    return Trip(float(t0), hz, columns)
+
+
+def save_npz(trip: Trip, path: str) -> None:
+    chunk = int(CHUNK_SECONDS * trip.hz)
+    arrays = {"t0": np.float64(trip.t0), "hz": np.float64(trip.hz),
+              "channels": np.array(sorted(trip.columns))}
+    for name, col in trip.columns.items():
+        for i, start in enumerate(range(0, len(col), chunk)):
+            arrays[f"{name}.{i:04d}"] = col[start:start + chunk]
+    np.savez_compressed(path, **arrays)
+
+
+def load_npz(path: str) -> Trip:
+    with np.load(path) as z:
+        columns = {}
+        for name in z["channels"]:
+            keys = sorted(k for k in z.files if k.rsplit(".", 1)[0] == name)
+            columns[str(name)] = np.concatenate([z[k] for k in keys])
+        return Trip(float(z["t0"]), float(z["hz"]), columns)
+
+
+def load_trip(path: str, hz: float = DEFAULT_HZ) -> Trip:
+    return load_npz(path) if path.endswith(".npz") else resample(load_records(path), hz)
+
+
+def parse_condition(text: str) -> tuple[str, str, float]:
+    m = CONDITION.match(text)
+    if not m:
+        raise ValueError(f"bad condition {text!r}, expected e.g. 'rpm > 3000'")
+    return m.group(1), m.group(2), float(m.group(3))
+
+
+def select(trip: Trip, conditions: list[tuple[str, str, float]]) -> np.ndarray:
+    """Boolean mask of grid rows where every condition holds (NaN never matches)."""
+    mask = np.ones(len(trip), dtype=bool)
+    for name, op, value in conditions:
+        mask &= OPS[op](trip.column(name), value)
+    return mask
+
+
+def episodes(mask: np.ndarray) -> list[tuple[int, int]]:
+    """(start, end) row ranges of contiguous True runs."""
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    return list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+
+def cmd_export(args) -> None:
+    for path in args.trips:
+        out = args.output or re.sub(r"\.(bin|ring)$", "", path) + ".npz"
+        trip = resample(load_records(path), args.hz)
+        save_npz(trip, out)
+        print(f"[INFO] {path}: {len(trip)} rows x {len(trip.columns)} channels -> {out}")
+
+
+def cmd_info(args) -> None:
+    trip = load_trip(args.trip, args.hz)
+    print(f"start {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(trip.t0))}, "
+          f"{len(trip) / trip.hz / 60:.1f} min at {trip.hz:g} Hz")
+    for name in sorted(trip.columns):
+        col = trip.columns[name]
+        if np.isnan(col).all():
+            print(f"  {name:<16} no samples")
+        else:
+            print(f"  {name:<16} min {np.nanmin(col):9.2f}  max {np.nanmax(col):9.2f}  mean {np.nanmean(col):9.2f}")
+
+
+def cmd_query(args) -> None:
+    started = time.perf_counter()
+    trip = load_trip(args.trip, args.hz)
+    mask = select(trip, [parse_condition(c) for c in args.where])
+    runs = episodes(mask)
+    print(f"{int(mask.sum())} of {len(trip)} rows match ({mask.sum() / trip.hz:.1f} s in {len(runs)} episodes)")
+
+    for spec in args.agg:
+        fn_name, _, name = spec.partition(":")
+        if fn_name not in AGGS or not name:
+            raise ValueError(f"bad aggregate {spec!r}, expected e.g. 'min:oil_pressure'")
+        values = trip.column(name)[mask]
+        result = AGGS[fn_name](values) if values.size and not np.isnan(values).all() else float("nan")
+        print(f"{fn_name}({name}) = {result:.2f}")
+
+    times = trip.times()
+    for start, end in runs[:args.episodes]:
+        print(f"  {time.strftime('%H:%M:%S', time.localtime(times[start]))}  {(end - start) / trip.hz:6.1f} s")
+    if len(runs) > args.episodes:
+        print(f"  ... {len(runs) - args.episodes} more")
+    print(f"({time.perf_counter() - started:.3f} s)", file=sys.stderr)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--hz", type=float, default=DEFAULT_HZ, help="grid rate when reading .bin files")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("export", help="convert .bin trips to columnar .npz")
+    p.add_argument("trips", nargs="+")
+    p.add_argument("-o", "--output", help="output path (single trip only)")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("info", help="channels and ranges in a trip")
+    p.add_argument("trip")
+    p.set_defaults(func=cmd_info)
+
+    p = sub.add_parser("query", help="filter rows and aggregate")
+    p.add_argument("trip")
+    p.add_argument("--where", action="append", default=[], help="e.g. 'rpm > 3000' (repeat to AND)")
+    p.add_argument("--agg", action="append", default=[], help="min|max|mean:<channel>")
+    p.add_argument("--episodes", type=int, default=10, help="matching episodes to list")
+    p.set_defaults(func=cmd_query)
+
+    args = ap.parse_args()
+    if args.command == "export" and args.output and len(args.trips) > 1:
+        ap.error("--output only works with a single trip")
+    try:
+        args.func(args)
+    except (ValueError, OSError) as e:
+        sys.exit(f"[ERROR] {e}")
+
+
+if __name__ == "__main__":
+    main()